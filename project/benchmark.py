@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Crypto Benchmark Suite
+Measures ML-KEM-768 key exchange and media frame encryption throughput,
+optionally writing JSON results to diff between releases
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import cryptography
+import numpy
+
+from src.crypto.kyber import (
+    _AEAD_INTO, AEAD_CIPHERS, KyberKeyExchange, MediaEncryption,
+    ml_kem_decaps, ml_kem_encaps, ml_kem_keygen,
+)
+
+FRAME_SIZES = {
+    "audio_160b": 160,
+    "video_2kb": 2 * 1024,
+    "video_10kb": 10 * 1024,
+    "video_50kb": 50 * 1024,
+    "raw_640x480x3": 640 * 480 * 3,
+}
+
+# Frames sampled under tracemalloc per case
+ALLOCATION_SAMPLES = 16
+
+def bench(func, duration, repeat=1):
+    """Best ops/second of `repeat` runs of about `duration` seconds each
+
+    The fastest run is the one least disturbed by other load, so it is the
+    steadiest number to compare against a baseline.
+    """
+    func()  # warm up
+    best = 0.0
+    for _ in range(repeat):
+        ops = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < duration:
+            func()
+            ops += 1
+            elapsed = time.perf_counter() - start
+        best = max(best, ops / elapsed)
+    return best
+
+def allocated_bytes(func, samples=ALLOCATION_SAMPLES):
+    """Average peak heap bytes allocated by one call of func"""
+    func()  # warm up caches outside the measurement
+    tracemalloc.start()
+    total = 0
+    try:
+        for _ in range(samples):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            func()
+            total += tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return total / samples
+
+def key_exchange():
+    """Full caller/callee exchange through KyberKeyExchange"""
+    caller = KyberKeyExchange()
+    callee = KyberKeyExchange()
+    ciphertext = callee.encapsulate(caller.generate_keypair())
+    caller.decapsulate(ciphertext)
+    return caller.get_encryption_key()
+
+def bench_kem(duration, repeat):
+    """ML-KEM operations per second"""
+    ek, dk = ml_kem_keygen()
+    _, ciphertext = ml_kem_encaps(ek)
+    peer = KyberKeyExchange()
+    peer_public_key = peer.generate_keypair()
+    operations = {
+        "keygen": ml_kem_keygen,
+        "encaps": lambda: ml_kem_encaps(ek),
+        "decaps": lambda: ml_kem_decaps(dk, ciphertext),
+        "derive": lambda: KyberKeyExchange().derive_shared_secret(peer_public_key),
+        "exchange": key_exchange,
+    }
+    results = {}
+    for name, func in operations.items():
+        ops = bench(func, duration, repeat)
+        results[name] = {"ops_per_s": ops, "ms_per_op": 1000 / ops}
+        print(f"{name:<10} {ops:10.1f} ops/s  {1000 / ops:8.3f} ms/op")
+    return results
+
+class FrameSource:
+    """Cycles through pre-encrypted frames, starting a fresh receiver per pass
+
+    Each frame may be decrypted only once per receiver (replay window), so
+    the benchmark replays a batch of frames against new receivers.
+    """
+
+    def __init__(self, key, cipher, size):
+        self.key = key
+        self.cipher = cipher
+        batch = max(16, min(1024, (8 << 20) // size))
+        sender = MediaEncryption(key, cipher=cipher)
+        self.frames = [sender.encrypt_frame(os.urandom(size)) for _ in range(batch)]
+        self.index = len(self.frames)
+        self.receiver = None
+
+    def next(self):
+        """Return (receiver, frame) for the next decryption"""
+        if self.index == len(self.frames):
+            self.receiver = MediaEncryption(self.key, cipher=self.cipher, sender_id=1)
+            self.index = 0
+        frame = self.frames[self.index]
+        self.index += 1
+        return self.receiver, frame
+
+def bench_media_case(cipher, size, duration, repeat):
+    """Encrypt/decrypt throughput and allocations for one cipher and frame size"""
+    key = os.urandom(32)
+    frame = os.urandom(size)
+    sender = MediaEncryption(key, cipher=cipher)
+    out = bytearray(sender.encrypted_size(size))
+    source = FrameSource(key, cipher, size)
+    plain = bytearray(size)
+
+    def decrypt():
+        receiver, encrypted = source.next()
+        return receiver.decrypt_frame(encrypted)
+
+    def decrypt_into():
+        receiver, encrypted = source.next()
+        return receiver.decrypt_frame_into(encrypted, plain)
+
+    operations = {
+        "encrypt": lambda: sender.encrypt_frame(frame),
+        "encrypt_into": lambda: sender.encrypt_frame_into(frame, out),
+        "decrypt": decrypt,
+        "decrypt_into": decrypt_into,
+    }
+    results = {}
+    for name, func in operations.items():
+        frames_per_s = bench(func, duration, repeat)
+        results[name] = {
+            "frames_per_s": frames_per_s,
+            "mb_per_s": frames_per_s * size / 1e6,
+            "alloc_bytes_per_frame": allocated_bytes(func),
+        }
+    return results
+
+def bench_media(duration, repeat, ciphers, sizes):
+    """MediaEncryption throughput for each cipher and frame size"""
+    results = {}
+    for cipher in ciphers:
+        results[cipher] = {}
+        print(f"\n{cipher}")
+        print(f"{'frame':<15} {'operation':<13} {'frames/s':>11} {'MB/s':>9} {'alloc B/frame':>14}")
+        for label in sizes:
+            size = FRAME_SIZES[label]
+            case = bench_media_case(cipher, size, duration, repeat)
+            results[cipher][label] = {"frame_bytes": size, **case}
+            for name, result in case.items():
+                print(f"{label:<15} {name:<13} {result['frames_per_s']:11.1f} "
+                      f"{result['mb_per_s']:9.1f} {result['alloc_bytes_per_frame']:14.0f}")
+    return results
+
+def environment():
+    """Versions and flags that affect the numbers"""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "cryptography": cryptography.__version__,
+        "aead_into": _AEAD_INTO,
+    }
+
+def throughput_metrics(results, prefix=""):
+    """Flatten results into {path: value} for the rate metrics (higher is better)"""
+    metrics = {}
+    for name, value in results.items():
+        path = f"{prefix}{name}"
+        if isinstance(value, dict):
+            metrics.update(throughput_metrics(value, path + "."))
+        elif name in ("ops_per_s", "frames_per_s"):
+            metrics[path] = value
+    return metrics
+
+def compare(results, baseline, tolerance):
+    """Print changes against a baseline run, return the regressed metrics"""
+    current = throughput_metrics(results)
+    previous = throughput_metrics(baseline)
+    regressions = []
+    print(f"\n📊 Compared with baseline (tolerance {tolerance:.0%})")
+    for path, value in current.items():
+        if path not in previous or not previous[path]:
+            continue
+        change = value / previous[path] - 1
+        marker = ""
+        if change < -tolerance:
+            marker = "  ❌ regression"
+            regressions.append(path)
+        print(f"{path:<62} {change:+7.1%}{marker}")
+    return regressions
+
+def main():
+    """Run the crypto benchmark suite"""
+    parser = argparse.ArgumentParser(description="Crypto benchmark suite")
+    parser.add_argument("--duration", type=float, default=0.5,
+                        help="seconds per run of each operation")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs per operation; the best one is reported")
+    parser.add_argument("--ciphers", nargs="+", default=list(AEAD_CIPHERS),
+                        choices=list(AEAD_CIPHERS), help="media ciphers to measure")
+    parser.add_argument("--sizes", nargs="+", default=list(FRAME_SIZES),
+                        choices=list(FRAME_SIZES), help="frame sizes to measure")
+    parser.add_argument("--skip-kem", action="store_true", help="skip ML-KEM benchmarks")
+    parser.add_argument("--skip-media", action="store_true", help="skip media benchmarks")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON")
+    parser.add_argument("--baseline", metavar="PATH",
+                        help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="allowed throughput drop against the baseline")
+    args = parser.parse_args()
+
+    print("⏱️  Crypto Benchmark Suite")
+    print("=========================")
+
+    results = {"environment": environment(), "duration": args.duration, "repeat": args.repeat}
+    if not args.skip_kem:
+        print("\nML-KEM-768")
+        results["kem"] = bench_kem(args.duration, args.repeat)
+    if not args.skip_media:
+        results["media"] = bench_media(args.duration, args.repeat, args.ciphers, args.sizes)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\n💾 Results written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
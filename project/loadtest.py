@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Signaling Load Generator
+Simulates many SignalingClient users against a local signaling server:
+registration, call offer/answer, ICE candidate storms and churn
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+
+from src.signaling.websocket_client import SignalingClient
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+# A typical audio+video offer is a few KB of SDP
+FAKE_SDP = "v=0\r\no=- 0 0 IN IP4 127.0.0.1\r\ns=-\r\nt=0 0\r\n" + \
+    "a=candidate:1 1 udp 2130706431 192.168.1.2 54321 typ host\r\n" * 40
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summarize(latencies):
+    """p50/p99/max in milliseconds for each message type"""
+    return {
+        name: {
+            "count": len(values),
+            "p50_ms": 1000 * percentile(values, 0.50),
+            "p99_ms": 1000 * percentile(values, 0.99),
+            "max_ms": 1000 * max(values),
+        }
+        for name, values in sorted(latencies.items()) if values
+    }
+
+class ProcessSampler:
+    """RSS and CPU time of a process tree, read from /proc (Linux only)"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self.peak_rss = 0
+        self.start_cpu = None
+        self.start_time = None
+        self.task = None
+
+    def tree(self):
+        """The process and all its descendants"""
+        children = defaultdict(list)
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                try:
+                    with open(f"/proc/{entry}/stat") as f:
+                        ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                    children[ppid].append(int(entry))
+                except (OSError, IndexError, ValueError):
+                    pass
+        pids, pending = [], [self.pid]
+        while pending:
+            pid = pending.pop()
+            pids.append(pid)
+            pending.extend(children.get(pid, []))
+        return pids
+
+    def sample(self):
+        """(rss_bytes, cpu_seconds) summed over the tree"""
+        rss = cpu = 0
+        for pid in self.tree():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                cpu += (int(fields[11]) + int(fields[12])) / self.ticks
+                rss += int(fields[21]) * resource.getpagesize()
+            except (OSError, IndexError, ValueError):
+                pass
+        return rss, cpu
+
+    async def run(self, interval=0.5):
+        """Track peak RSS until cancelled"""
+        while True:
+            rss, _ = self.sample()
+            self.peak_rss = max(self.peak_rss, rss)
+            await asyncio.sleep(interval)
+
+    def start(self):
+        _, self.start_cpu = self.sample()
+        self.start_time = time.perf_counter()
+        self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        """Return peak/final RSS and average CPU use since start"""
+        self.task.cancel()
+        rss, cpu = self.sample()
+        elapsed = time.perf_counter() - self.start_time
+        return {
+            "rss_mb": rss / 2**20,
+            "peak_rss_mb": max(self.peak_rss, rss) / 2**20,
+            "cpu_percent": 100 * (cpu - self.start_cpu) / elapsed,
+        }
+
+class LoadGenerator:
+    """Drives simulated users and collects forward latencies"""
+
+    def __init__(self, url, users, call_rate, candidates, churn_rate, concurrency,
+                 ice_batch_delay=0.005):
+        self.url = url
+        self.ice_batch_delay = ice_batch_delay
+        self.user_count = users
+        self.call_rate = call_rate
+        self.candidates = candidates
+        self.churn_rate = churn_rate
+        self.concurrency = concurrency
+        self.clients = {}
+        self.idle = set()
+        self.latencies = defaultdict(list)
+        self.sent = Counter()
+        self.received = Counter()
+        self.calls_started = 0
+        self.calls_completed = 0
+        self.call_started_at = {}
+        self.errors = Counter()
+
+    def now(self):
+        return time.perf_counter()
+
+    def record(self, message_type, stamp):
+        self.received[message_type] += 1
+        if stamp is not None:
+            self.latencies[message_type].append(self.now() - stamp)
+
+    async def send_candidates(self, client, peer_id):
+        for index in range(self.candidates):
+            await client.send_ice_candidate(peer_id, {
+                "candidate": f"candidate:{index} 1 udp 2130706431 10.0.0.{index} 5000{index} typ host",
+                "sdpMid": "0",
+                "sdpMLineIndex": 0,
+                "ts": self.now(),
+            })
+            self.sent["ice_candidate"] += 1
+
+    def make_client(self, user_id):
+        """A SignalingClient with the load test's handlers"""
+        client = SignalingClient(self.url, ice_batch_delay=self.ice_batch_delay)
+
+        async def on_call_offer(data):
+            self.record("call_offer", data.get("offer", {}).get("ts"))
+            caller = data.get("from")
+            await client.answer_call(caller, {"type": "answer", "sdp": FAKE_SDP, "ts": self.now()})
+            self.sent["call_answer"] += 1
+            await self.send_candidates(client, caller)
+
+        async def on_call_answer(data):
+            self.record("call_answer", data.get("answer", {}).get("ts"))
+            started = self.call_started_at.pop(user_id, None)
+            if started is not None:
+                self.latencies["call_setup"].append(self.now() - started)
+            callee = data.get("from")
+            await self.send_candidates(client, callee)
+            await client.end_call(callee)
+            self.sent["call_end"] += 1
+            self.calls_completed += 1
+            self.idle.update((user_id, callee))
+
+        async def on_ice_candidate(data):
+            self.record("ice_candidate", data.get("candidate", {}).get("ts"))
+
+        async def on_call_end(data):
+            self.record("call_end", None)
+
+        async def on_error(data):
+            self.errors[data.get("message", "error").split(" ")[0]] += 1
+
+        async def on_user_list(data):
+            pass
+
+        client.on("call_offer", on_call_offer)
+        client.on("call_answer", on_call_answer)
+        client.on("ice_candidate", on_ice_candidate)
+        client.on("call_end", on_call_end)
+        client.on("error", on_error)
+        client.on("user_list", on_user_list)
+        client.on("presence_delta", on_user_list)
+        return client
+
+    async def connect_user(self, user_id):
+        """Connect and wait for the presence snapshot"""
+        client = self.make_client(user_id)
+        start = self.now()
+        await client.connect(user_id)
+        while client.presence_version is None:
+            await asyncio.sleep(0.005)
+        self.latencies["register"].append(self.now() - start)
+        self.clients[user_id] = client
+        self.idle.add(user_id)
+
+    async def connect_all(self):
+        """Register every simulated user, `concurrency` at a time"""
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def connect(index):
+            async with slots:
+                await self.connect_user(f"load-{index}")
+
+        await asyncio.gather(*(connect(i) for i in range(self.user_count)))
+
+    async def start_call(self):
+        """Offer a call between two idle users"""
+        if len(self.idle) < 2:
+            return
+        caller, callee = random.sample(sorted(self.idle), 2)
+        self.idle.difference_update((caller, callee))
+        self.call_started_at[caller] = self.now()
+        await self.clients[caller].call_user(callee, {"type": "offer", "sdp": FAKE_SDP, "ts": self.now()},
+                                            public_key="A" * 1580)
+        self.sent["call_offer"] += 1
+        self.calls_started += 1
+
+    async def churn_user(self):
+        """Disconnect an idle user and register it again"""
+        if not self.idle:
+            return
+        user_id = random.choice(sorted(self.idle))
+        self.idle.discard(user_id)
+        client = self.clients.pop(user_id)
+        await client.disconnect()
+        self.sent["churn"] += 1
+        await self.connect_user(user_id)
+
+    async def paced(self, rate, duration, action):
+        """Run action() `rate` times per second for `duration` seconds"""
+        if rate <= 0:
+            return
+        tasks = []
+        interval = 1.0 / rate
+        deadline = self.now() + duration
+        next_run = self.now()
+        while next_run < deadline:
+            tasks.append(asyncio.ensure_future(action()))
+            next_run += interval
+            await asyncio.sleep(max(0.0, next_run - self.now()))
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run(self, duration):
+        """Calls and churn for `duration` seconds, then let in-flight calls finish"""
+        await asyncio.gather(
+            self.paced(self.call_rate, duration, self.start_call),
+            self.paced(self.churn_rate, duration, self.churn_user),
+        )
+        deadline = self.now() + 5
+        while self.calls_completed < self.calls_started and self.now() < deadline:
+            await asyncio.sleep(0.05)
+
+    async def close(self):
+        await asyncio.gather(*(client.disconnect() for client in self.clients.values()),
+                             return_exceptions=True)
+
+def raise_fd_limit(users):
+    """Each simulated user needs a socket; raise the soft limit if allowed"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, max(soft, 2 * users + 256))
+    if wanted > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+def start_server(port, workers):
+    """Launch server.py on localhost and wait until it accepts connections"""
+    process = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--port", str(port), "--workers", str(workers)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("localhost", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Signaling server did not start")
+
+async def run_load(args, server_pid):
+    sampler = ProcessSampler(server_pid) if server_pid and os.path.isdir("/proc") else None
+    generator = LoadGenerator(args.url, args.users, args.call_rate, args.candidates,
+                              args.churn_rate, args.concurrency, args.ice_batch_ms / 1000)
+    if sampler:
+        sampler.start()
+    own_cpu = time.process_time()
+
+    start = time.perf_counter()
+    await generator.connect_all()
+    register_time = time.perf_counter() - start
+    print(f"👥 {args.users} users registered in {register_time:.2f}s")
+
+    start = time.perf_counter()
+    await generator.run(args.duration)
+    elapsed = time.perf_counter() - start
+    await generator.close()
+
+    received = sum(generator.received.values())
+    results = {
+        "users": args.users,
+        "duration_s": elapsed,
+        "registrations_per_s": args.users / register_time,
+        "calls_started": generator.calls_started,
+        "calls_completed": generator.calls_completed,
+        "call_setups_per_s": generator.calls_completed / elapsed,
+        "messages_sent": dict(generator.sent),
+        "messages_received": dict(generator.received),
+        "messages_per_s": received / elapsed,
+        "errors": dict(generator.errors),
+        "latency": summarize(generator.latencies),
+        "server": sampler.stop() if sampler else None,
+        "generator_cpu_s": time.process_time() - own_cpu,
+    }
+    return results
+
+def report(results):
+    print(f"📞 {results['calls_completed']}/{results['calls_started']} calls, "
+          f"{results['call_setups_per_s']:.1f} setups/s, "
+          f"{results['messages_per_s']:.0f} messages/s received")
+    print(f"{'message':<15} {'count':>8} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, stats in results["latency"].items():
+        print(f"{name:<15} {stats['count']:8d} {stats['p50_ms']:9.2f} "
+              f"{stats['p99_ms']:9.2f} {stats['max_ms']:9.2f}")
+    if results["server"]:
+        server = results["server"]
+        print(f"🖥️  server: {server['cpu_percent']:.0f}% CPU, "
+              f"{server['rss_mb']:.1f} MB RSS (peak {server['peak_rss_mb']:.1f} MB)")
+    if results["errors"]:
+        print(f"⚠️  errors: {results['errors']}")
+
+def main():
+    """Run the signaling load test"""
+    parser = argparse.ArgumentParser(description="Signaling server load generator")
+    parser.add_argument("--users", type=int, default=1000, help="simulated users")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of call traffic")
+    parser.add_argument("--call-rate", type=float, default=50.0, help="call setups started per second")
+    parser.add_argument("--candidates", type=int, default=10,
+                        help="ICE candidates each side sends per call")
+    parser.add_argument("--ice-batch-ms", type=float, default=5.0,
+                        help="ICE candidate batching window (0 sends each on its own)")
+    parser.add_argument("--churn-rate", type=float, default=5.0,
+                        help="users disconnecting and re-registering per second")
+    parser.add_argument("--concurrency", type=int, default=100,
+                        help="registrations in flight at once")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes for the local server")
+    parser.add_argument("--url", help="existing server to test instead of starting one")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON")
+    args = parser.parse_args()
+
+    print("🔥 Signaling Load Test")
+    print("======================")
+
+    raise_fd_limit(args.users)
+    server = None
+    if args.url is None:
+        port = free_port()
+        server = start_server(port, args.workers)
+        args.url = f"ws://localhost:{port}"
+        print(f"🌐 Started server.py on port {port} with {args.workers} worker(s)")
+
+    try:
+        results = asyncio.run(run_load(args, server.pid if server else None))
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+
+    report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"💾 Results written to {args.json}")
+
+if __name__ == "__main__":
+    main()
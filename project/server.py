@@ -3,15 +3,40 @@
 Standalone Signaling Server
 Run this separately to provide signaling services
 """
+import argparse
 import asyncio
 import logging
+from src.signaling.cluster import SignalingCluster
+from src.signaling.connection import ClientConnection
 from src.signaling.websocket_server import SignalingServer
 
 def main():
     """Run the signaling server"""
+    parser = argparse.ArgumentParser(description="WebRTC signaling server")
+    parser.add_argument("--host", default="localhost", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes sharing the port (SO_REUSEPORT)")
+    parser.add_argument("--send-queue", type=int, default=256,
+                        help="messages queued per client before the slow consumer policy applies")
+    parser.add_argument("--slow-consumer-policy", default=ClientConnection.SNAPSHOT,
+                        choices=ClientConnection.POLICIES,
+                        help="resend only the latest user list, or disconnect")
+    parser.add_argument("--resume-timeout", type=float, default=30.0,
+                        help="seconds a dropped client can resume its session (0 disables)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics on this port (worker N uses port + N)")
+    parser.add_argument("--metrics-interval", type=float, default=None,
+                        help="also log all metrics every this many seconds")
+    args = parser.parse_args()
+    
     print("🌐 WebRTC Signaling Server")
     print("==========================")
-    print("Starting server on ws://localhost:8765")
+    print(f"Starting server on ws://{args.host}:{args.port}")
+    if args.workers > 1:
+        print(f"Sharded across {args.workers} worker processes")
+    if args.metrics_port:
+        print(f"Metrics on http://{args.host}:{args.metrics_port}/metrics")
     print("Press Ctrl+C to stop")
     print()
     
@@ -22,7 +47,17 @@ def main():
     )
     
     # Create and start server
-    server = SignalingServer(host="localhost", port=8765)
+    options = {
+        "send_queue_size": args.send_queue,
+        "slow_consumer_policy": args.slow_consumer_policy,
+        "metrics_port": args.metrics_port,
+        "metrics_interval": args.metrics_interval,
+        "resume_timeout": args.resume_timeout,
+    }
+    if args.workers > 1:
+        server = SignalingCluster(host=args.host, port=args.port, workers=args.workers, **options)
+    else:
+        server = SignalingServer(host=args.host, port=args.port, **options)
     
     try:
         asyncio.run(server.start())
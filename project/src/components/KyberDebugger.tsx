@@ -3,13 +3,15 @@ import { Shield, Zap, Brain, AlertTriangle, CheckCircle, RefreshCw } from 'lucid
 import CodeEditor from './CodeEditor';
 import ZetasVisualization from './ZetasVisualization';
 import AIAnalysis from './AIAnalysis';
-import { mockPythonCode, mockCCode, mockPythonZetas, mockCZetas } from '../data/mockData';
+import { mockPythonCode, mockCCode } from '../data/mockData';
+// Generated by `python -m src.crypto.conformance --export src/data/zetas.json`
+import zetaTables from '../data/zetas.json';
 
 const KyberDebugger: React.FC = () => {
   const [pythonCode, setPythonCode] = useState(mockPythonCode);
   const [cCode, setCCode] = useState(mockCCode);
-  const [pythonZetas, setPythonZetas] = useState(mockPythonZetas);
-  const [cZetas, setCZetas] = useState(mockCZetas);
+  const [pythonZetas, setPythonZetas] = useState<number[]>(zetaTables.pythonZetas);
+  const [cZetas, setCZetas] = useState<number[]>(zetaTables.cZetas);
   const [isAnalyzing, setIsAnalyzing] = useState(false);
   const [aiSuggestions, setAiSuggestions] = useState<string | null>(null);
 
@@ -0,0 +1,164 @@
+"""
+NTT Conformance Runner
+Checks the precomputed tables and the vectorized NTT against known answers
+
+    python -m src.crypto.conformance [--count N] [--export src/data/zetas.json]
+"""
+import argparse
+import json
+import sys
+import numpy as np
+
+from . import ntt_tables as tables
+from .kyber import ntt, ntt_inverse, multiply_ntts
+
+# Known-answer zetas from the Kyber C reference (ref/ntt.c), signed Montgomery form
+REFERENCE_ZETAS_MONT = (
+    -1044, -758, -359, -1517, 1493, 1422, 287, 202,
+    -171, 622, 1577, 182, 962, -1202, -1474, 1468,
+    573, -1325, 264, 383, -829, 1458, -1602, -130,
+    -681, 1017, 732, 608, -1542, 411, -205, -1571,
+    1223, 652, -552, 1015, -1293, 1491, -282, -1544,
+    516, -8, -320, -666, -1618, -1162, 126, 1469,
+    -853, -90, -271, 830, 107, -1421, -247, -951,
+    -398, 961, -1508, -725, 448, -1065, 677, -1275,
+    -1103, 430, 555, 843, -1251, 871, 1550, 105,
+    422, 587, 177, -235, -291, -460, 1574, 1653,
+    -246, 778, 1159, -147, -777, 1483, -602, 1119,
+    -1590, 644, -872, 349, 418, 329, -156, -75,
+    817, 1097, 603, 610, 1322, -1285, -1465, 384,
+    -1215, -136, 1218, -1335, -874, 220, -1187, -1659,
+    -1185, -1530, -1278, 794, -1510, -854, -870, 478,
+    -108, -308, 996, 991, 958, -1460, 1522, 1628,
+)
+
+# Scalar constants from the same reference
+REFERENCE_CONSTANTS = {"MONT": 2285, "MONT_SQ": 1353, "QINV": 62209, "N_INV": 3303}
+
+
+def _mismatches(actual, expected):
+    """Indices where two arrays differ"""
+    return np.flatnonzero(np.asarray(actual) != np.asarray(expected)).tolist()
+
+
+def _reference_montgomery_reduce(a):
+    """Scalar port of the C reference, used as the oracle"""
+    t = (a * tables.QINV) & 0xFFFF
+    if t >= 0x8000:
+        t -= 0x10000
+    return (a - t * tables.KYBER_Q) >> 16
+
+
+def _schoolbook_multiply(f, g):
+    """Negacyclic product in Z_q[X]/(X^256 + 1), batched over the first axis"""
+    n = tables.KYBER_N
+    product = np.zeros((f.shape[0], 2 * n), dtype=np.int64)
+    for i in range(n):
+        product[:, i:i + n] = (product[:, i:i + n] + f[:, i:i + 1] * g) % tables.KYBER_Q
+    return (product[:, :n] - product[:, n:]) % tables.KYBER_Q
+
+
+def check_tables():
+    """Compare the import-time tables with the known-answer vectors"""
+    q = tables.KYBER_Q
+    results = []
+    for name, expected in REFERENCE_CONSTANTS.items():
+        actual = getattr(tables, name)
+        results.append((f"constant {name}", actual == expected, f"{actual} (expected {expected})"))
+
+    bad = _mismatches(tables.ZETAS_MONT, REFERENCE_ZETAS_MONT)
+    results.append(("zetas vs C reference", not bad, f"{len(bad)} mismatches {bad[:8]}"))
+
+    bad = _mismatches(tables.ZETAS * tables.MONT % q, np.asarray(REFERENCE_ZETAS_MONT) % q)
+    results.append(("zetas (plain) in Montgomery form", not bad, f"{len(bad)} mismatches {bad[:8]}"))
+
+    bad = _mismatches(tables.GAMMAS, tables.ZETAS * tables.ZETAS % q * tables.KYBER_ROOT_OF_UNITY % q)
+    results.append(("gammas == zeta^2 * 17", not bad, f"{len(bad)} mismatches {bad[:8]}"))
+
+    root_ok = pow(tables.KYBER_ROOT_OF_UNITY, tables.KYBER_N // 2, q) == q - 1
+    results.append(("17 is a primitive 256th root", root_ok, "17^128 == -1 mod q"))
+
+    involution = tables.BITREV7[tables.BITREV7]
+    bad = _mismatches(involution, np.arange(tables.KYBER_N // 2))
+    results.append(("bit-reversal permutation", not bad, f"{len(bad)} mismatches {bad[:8]}"))
+
+    writable = [name for name in ("BITREV7", "ZETAS", "GAMMAS", "ZETAS_MONT")
+                if getattr(tables, name).flags.writeable]
+    results.append(("tables are read-only", not writable, f"writable: {writable}"))
+    return results
+
+
+def check_montgomery(count, rng):
+    """Compare vectorized montgomery_reduce with the scalar reference in bulk"""
+    bound = tables.KYBER_Q << 15
+    a = rng.integers(-bound, bound, size=count, dtype=np.int64)
+    expected = np.array([_reference_montgomery_reduce(int(x)) for x in a], dtype=np.int64)
+    actual = tables.montgomery_reduce(a)
+    bad = _mismatches(actual, expected)
+    congruent = np.all((actual * tables.MONT - a) % tables.KYBER_Q == 0)
+    return [
+        (f"montgomery_reduce x{count}", not bad, f"{len(bad)} mismatches"),
+        ("montgomery_reduce == a * R^-1 mod q", bool(congruent), ""),
+    ]
+
+
+def check_ntt(count, rng):
+    """Round-trip and multiply random polynomials through the NTT in bulk"""
+    q = tables.KYBER_Q
+    f = rng.integers(0, q, size=(count, tables.KYBER_N), dtype=np.int64)
+    g = rng.integers(0, q, size=(count, tables.KYBER_N), dtype=np.int64)
+
+    round_trip = ntt_inverse(ntt(f))
+    bad_rt = np.flatnonzero(np.any(round_trip != f, axis=1)).tolist()
+
+    via_ntt = ntt_inverse(multiply_ntts(ntt(f), ntt(g)))
+    bad_mul = np.flatnonzero(np.any(via_ntt != _schoolbook_multiply(f, g), axis=1)).tolist()
+    return [
+        (f"NTT round trip x{count}", not bad_rt, f"{len(bad_rt)} failing polynomials"),
+        (f"NTT multiply vs schoolbook x{count}", not bad_mul, f"{len(bad_mul)} failing polynomials"),
+    ]
+
+
+def export_tables(path):
+    """Write the tables consumed by the KyberDebugger frontend"""
+    q = tables.KYBER_Q
+    data = {
+        "q": q,
+        "mont": tables.MONT,
+        "qinv": tables.QINV,
+        "pythonZetas": (tables.ZETAS_MONT % q).tolist(),
+        "cZetas": [z % q for z in REFERENCE_ZETAS_MONT],
+        "bitrev7": tables.BITREV7.tolist(),
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def main():
+    """Run all conformance checks and report pass/fail"""
+    parser = argparse.ArgumentParser(description="Kyber NTT table conformance runner")
+    parser.add_argument("--count", type=int, default=1000,
+                        help="random vectors per bulk check")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--export", metavar="PATH",
+                        help="write the tables as JSON for the debugger frontend")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    results = check_tables() + check_montgomery(args.count, rng) + check_ntt(args.count, rng)
+
+    for name, passed, detail in results:
+        print(f"{'✅' if passed else '❌'} {name}" + ("" if passed else f": {detail}"))
+
+    if args.export:
+        export_tables(args.export)
+        print(f"Tables written to {args.export}")
+
+    failed = sum(1 for _, passed, _ in results if not passed)
+    print(f"\n{len(results) - failed}/{len(results)} checks passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
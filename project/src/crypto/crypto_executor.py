@@ -0,0 +1,91 @@
+"""
+Crypto Executor Stage
+Runs frame encryption on worker threads instead of the event loop
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class CryptoExecutor:
+    """Bounded worker pool for media crypto
+
+    OpenSSL releases the GIL inside AEAD calls, so large payloads encrypt
+    in parallel on several cores while the asyncio loop keeps serving
+    signaling, ICE and audio. At most ``max_pending`` jobs are in flight;
+    further callers wait, which backpressures the media tracks. Each track
+    awaits its own frames one at a time, so output stays in order per track.
+    Payloads smaller than ``inline_threshold`` bytes are cheaper to handle
+    inline than to hand to a thread.
+    """
+
+    def __init__(self, max_workers=None, max_pending=32, inline_threshold=1024):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.inline_threshold = inline_threshold
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                           thread_name_prefix="crypto")
+        self._slots = asyncio.Semaphore(max_pending)
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_queue_depth = 0
+        self.jobs = 0
+        self.inline_jobs = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def queue_depth(self):
+        """Jobs running plus jobs waiting for a slot"""
+        return self.in_flight + self.waiting
+
+    async def run(self, func, *args, nbytes=0):
+        """Run func(*args) on the pool (or inline for small payloads)"""
+        start = time.perf_counter()
+        if nbytes < self.inline_threshold:
+            try:
+                return func(*args)
+            finally:
+                self.inline_jobs += 1
+                self._record(start)
+
+        self.waiting += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            self._record(start)
+
+    def _record(self, start):
+        latency = time.perf_counter() - start
+        self.jobs += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def stats(self):
+        """Queue depth and per-frame latency"""
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "jobs": self.jobs,
+            "inline_jobs": self.inline_jobs,
+            "avg_latency_ms": 1000 * self.total_latency / self.jobs if self.jobs else 0.0,
+            "max_latency_ms": 1000 * self.max_latency,
+        }
+
+    def shutdown(self):
+        """Stop the worker threads"""
+        self.executor.shutdown(wait=False)
+        logger.info(f"Crypto executor stopped: {self.stats()}")
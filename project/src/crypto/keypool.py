@@ -0,0 +1,124 @@
+"""
+Background ML-KEM Keypair Pool
+Keeps one-time keypairs ready so call setup never waits on keygen
+"""
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .kyber import ml_kem_keygen
+
+logger = logging.getLogger(__name__)
+
+class KeypairPool:
+    """Pre-generated pool of one-time ML-KEM keypairs
+
+    Keypairs are generated on a background executor (a thread pool by
+    default; pass a ``ProcessPoolExecutor`` to use more cores). ``acquire``
+    pops a ready keypair in O(1) and only falls back to inline keygen when
+    the pool is empty; on the event loop use ``acquire_async``, which runs
+    that keygen on a worker thread instead. Whenever the pool drops to
+    ``low_watermark`` it is topped back up to ``capacity``.
+    """
+
+    def __init__(self, capacity=8, low_watermark=2, executor=None):
+        if not 0 <= low_watermark < capacity:
+            raise ValueError("low_watermark must be in [0, capacity)")
+        self.capacity = capacity
+        self.low_watermark = low_watermark
+        self.executor = executor
+        self._owns_executor = executor is None
+        self._keypairs = deque()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._futures = set()
+        self.hits = 0
+        self.misses = 0
+        self.running = False
+
+    def start(self):
+        """Start filling the pool in the background"""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="keypool")
+        self.running = True
+        self._refill()
+
+    def stop(self):
+        """Stop refilling and drop any unused keypairs"""
+        self.running = False
+        for future in list(self._futures):
+            future.cancel()
+        if self._owns_executor and self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        self._keypairs.clear()
+        logger.info(f"Keypair pool stopped: {self.stats()}")
+
+    def acquire(self):
+        """Take a one-time (public_key, private_key) pair"""
+        keypair = self._take()
+        if keypair is None:
+            logger.debug("Keypair pool empty, generating inline")
+            keypair = ml_kem_keygen()
+        return keypair
+
+    async def acquire_async(self):
+        """Take a keypair without blocking the event loop on a miss"""
+        keypair = self._take()
+        if keypair is None:
+            logger.debug("Keypair pool empty, generating on a worker thread")
+            # Default executor, so the miss does not queue behind the refills
+            keypair = await asyncio.get_running_loop().run_in_executor(None, ml_kem_keygen)
+        return keypair
+
+    def _take(self):
+        """Pop a ready keypair (None on a miss) and trigger a refill if low"""
+        try:
+            keypair = self._keypairs.popleft()
+        except IndexError:
+            keypair = None
+
+        with self._lock:
+            if keypair is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if len(self._keypairs) <= self.low_watermark:
+            self._refill()
+        return keypair
+
+    def stats(self):
+        """Pool size and hit/miss counters"""
+        return {
+            "size": len(self._keypairs),
+            "pending": self._pending,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _refill(self):
+        """Schedule enough keygens to bring the pool back to capacity"""
+        if not self.running:
+            return
+        with self._lock:
+            needed = self.capacity - len(self._keypairs) - self._pending
+            self._pending += max(needed, 0)
+        for _ in range(needed):
+            future = self.executor.submit(ml_kem_keygen)
+            self._futures.add(future)
+            future.add_done_callback(self._on_generated)
+
+    def _on_generated(self, future):
+        """Add a finished keypair to the pool"""
+        with self._lock:
+            self._pending -= 1
+            self._futures.discard(future)
+        if future.cancelled() or future.exception() is not None:
+            if not future.cancelled():
+                logger.error(f"Background keygen failed: {future.exception()}")
+            return
+        if self.running:
+            self._keypairs.append(future.result())
@@ -1,33 +1,306 @@
 """
 Kyber Post-Quantum Key Exchange Implementation
+
+ML-KEM-768 (FIPS 203) over Z_3329[X]/(X^256 + 1). Polynomials are held as
+int64 NumPy arrays whose last axis is the 256 coefficients, so the NTT,
+pointwise multiplication and (de)serialisation run over whole vectors and
+matrices of polynomials at once instead of per coefficient.
 """
+import asyncio
 import os
+import hmac
 import hashlib
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
-import secrets
+import threading
+import time
+import numpy as np
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from .ntt_tables import KYBER_N, KYBER_Q, N_INV, ZETAS, GAMMAS
+from .ratchet import KeyRatchet
+from .sframe import MAX_HEADER_SIZE, ReplayWindow, decode_header, encode_header
+
+# ML-KEM-768 parameters
+KYBER_K = 3
+KYBER_ETA1 = 2
+KYBER_ETA2 = 2
+KYBER_DU = 10
+KYBER_DV = 4
+
+KYBER_SYMBYTES = 32
+KYBER_POLYBYTES = 384
+KYBER_PUBLICKEYBYTES = KYBER_K * KYBER_POLYBYTES + KYBER_SYMBYTES
+KYBER_SECRETKEYBYTES = 2 * KYBER_K * KYBER_POLYBYTES + 3 * KYBER_SYMBYTES
+KYBER_CIPHERTEXTBYTES = 32 * (KYBER_K * KYBER_DU + KYBER_DV)
+
+# Frame ciphers; one AEAD object is created per key and reused for every frame
+AEAD_CIPHERS = {
+    "aes-gcm": AESGCM,
+    "chacha20-poly1305": ChaCha20Poly1305,
+}
+# encrypt_into/decrypt_into (cryptography >= 47) write straight into caller buffers
+_AEAD_INTO = hasattr(AESGCM, "encrypt_into")
+
+
+def ntt(f):
+    """Forward NTT over the last axis of an array of polynomials"""
+    f = np.asarray(f, dtype=np.int64)
+    shape = f.shape
+    length = 128
+    while length >= 2:
+        blocks = KYBER_N // (2 * length)
+        f = f.reshape(shape[:-1] + (blocks, 2, length))
+        zeta = ZETAS[blocks:2 * blocks, None]
+        lo = f[..., 0, :]
+        t = (zeta * f[..., 1, :]) % KYBER_Q
+        f = np.stack(((lo + t) % KYBER_Q, (lo - t) % KYBER_Q), axis=-2)
+        length //= 2
+    return f.reshape(shape)
+
+
+def ntt_inverse(f):
+    """Inverse NTT over the last axis of an array of polynomials"""
+    f = np.asarray(f, dtype=np.int64)
+    shape = f.shape
+    length = 2
+    while length <= 128:
+        blocks = KYBER_N // (2 * length)
+        f = f.reshape(shape[:-1] + (blocks, 2, length))
+        zeta = ZETAS[blocks:2 * blocks][::-1, None]
+        lo = f[..., 0, :]
+        hi = f[..., 1, :]
+        f = np.stack(((lo + hi) % KYBER_Q, (zeta * (hi - lo)) % KYBER_Q), axis=-2)
+        length *= 2
+    return (f.reshape(shape) * N_INV) % KYBER_Q
+
+
+def multiply_ntts(f, g):
+    """Pointwise product of NTT-domain polynomials (broadcasts like NumPy)"""
+    a0, a1 = f[..., 0::2], f[..., 1::2]
+    b0, b1 = g[..., 0::2], g[..., 1::2]
+    h = np.empty(np.broadcast_shapes(f.shape, g.shape), dtype=np.int64)
+    h[..., 0::2] = (a0 * b0 + (a1 * b1 % KYBER_Q) * GAMMAS) % KYBER_Q
+    h[..., 1::2] = (a0 * b1 + a1 * b0) % KYBER_Q
+    return h
+
+
+def _byte_encode(f, d):
+    """Pack d-bit coefficients little-endian (ByteEncode_d)"""
+    f = np.asarray(f, dtype=np.int64)
+    bits = ((f[..., None] >> np.arange(d)) & 1).astype(np.uint8)
+    return np.packbits(bits.reshape(-1), bitorder="little").tobytes()
+
+
+def _byte_decode(data, d):
+    """Unpack d-bit coefficients into a (-1, 256) array (ByteDecode_d)"""
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder="little")
+    f = bits.reshape(-1, KYBER_N, d).astype(np.int64) @ (1 << np.arange(d, dtype=np.int64))
+    return f % KYBER_Q if d == 12 else f
+
+
+def _compress(x, d):
+    """Round (2^d / q) * x to d bits"""
+    return (((x << d) + KYBER_Q // 2) // KYBER_Q) & ((1 << d) - 1)
+
+
+def _decompress(y, d):
+    """Round (q / 2^d) * y"""
+    return (y * KYBER_Q + (1 << (d - 1))) >> d
+
+
+def _sample_ntt(seed):
+    """Rejection-sample an NTT-domain polynomial from SHAKE128(seed)"""
+    nbytes = 3 * 168
+    while True:
+        stream = np.frombuffer(hashlib.shake_128(seed).digest(nbytes), dtype=np.uint8)
+        b = stream.astype(np.int64).reshape(-1, 3)
+        candidates = np.empty((b.shape[0], 2), dtype=np.int64)
+        candidates[:, 0] = b[:, 0] + 256 * (b[:, 1] & 15)
+        candidates[:, 1] = (b[:, 1] >> 4) + 16 * b[:, 2]
+        candidates = candidates.reshape(-1)
+        candidates = candidates[candidates < KYBER_Q]
+        if candidates.size >= KYBER_N:
+            return candidates[:KYBER_N]
+        nbytes += 168
+
+
+def _expand_matrix(rho):
+    """Generate the k x k NTT-domain matrix A from its public seed"""
+    a_hat = np.empty((KYBER_K, KYBER_K, KYBER_N), dtype=np.int64)
+    for i in range(KYBER_K):
+        for j in range(KYBER_K):
+            a_hat[i, j] = _sample_ntt(rho + bytes((j, i)))
+    return a_hat
+
+
+def _sample_cbd(seed, nonces, eta):
+    """Sample one centred-binomial polynomial per nonce from SHAKE256 PRF output"""
+    stream = b"".join(hashlib.shake_256(seed + bytes((n,))).digest(64 * eta) for n in nonces)
+    bits = np.unpackbits(np.frombuffer(stream, dtype=np.uint8), bitorder="little")
+    bits = bits.reshape(len(nonces), KYBER_N, 2 * eta).astype(np.int64)
+    return (bits[..., :eta].sum(axis=-1) - bits[..., eta:].sum(axis=-1)) % KYBER_Q
+
+
+def _hash_g(data):
+    digest = hashlib.sha3_512(data).digest()
+    return digest[:32], digest[32:]
+
+
+def _hash_h(data):
+    return hashlib.sha3_256(data).digest()
+
+
+def _hash_j(data):
+    return hashlib.shake_256(data).digest(32)
+
+
+def _pke_keygen(d):
+    """K-PKE key generation from a 32-byte seed"""
+    rho, sigma = _hash_g(d + bytes((KYBER_K,)))
+    a_hat = _expand_matrix(rho)
+    s = _sample_cbd(sigma, range(KYBER_K), KYBER_ETA1)
+    e = _sample_cbd(sigma, range(KYBER_K, 2 * KYBER_K), KYBER_ETA1)
+    s_hat = ntt(s)
+    t_hat = (multiply_ntts(a_hat, s_hat[None]).sum(axis=1) + ntt(e)) % KYBER_Q
+    return _byte_encode(t_hat, 12) + rho, _byte_encode(s_hat, 12)
+
+
+def _pke_encrypt(ek, m, r):
+    """K-PKE encryption of a 32-byte message with explicit randomness"""
+    t_hat = _byte_decode(ek[:KYBER_K * KYBER_POLYBYTES], 12)
+    a_hat = _expand_matrix(ek[KYBER_K * KYBER_POLYBYTES:])
+    y = _sample_cbd(r, range(KYBER_K), KYBER_ETA1)
+    e = _sample_cbd(r, range(KYBER_K, 2 * KYBER_K + 1), KYBER_ETA2)
+    y_hat = ntt(y)
+
+    u = (ntt_inverse(multiply_ntts(a_hat.transpose(1, 0, 2), y_hat[None]).sum(axis=1))
+         + e[:KYBER_K]) % KYBER_Q
+    mu = _decompress(_byte_decode(m, 1)[0], 1)
+    v = (ntt_inverse(multiply_ntts(t_hat, y_hat).sum(axis=0)) + e[KYBER_K] + mu) % KYBER_Q
+
+    return _byte_encode(_compress(u, KYBER_DU), KYBER_DU) + _byte_encode(_compress(v, KYBER_DV), KYBER_DV)
+
+
+def _pke_decrypt(dk, c):
+    """K-PKE decryption back to the 32-byte message"""
+    split = 32 * KYBER_DU * KYBER_K
+    u = _decompress(_byte_decode(c[:split], KYBER_DU), KYBER_DU)
+    v = _decompress(_byte_decode(c[split:], KYBER_DV)[0], KYBER_DV)
+    s_hat = _byte_decode(dk, 12)
+    w = (v - ntt_inverse(multiply_ntts(s_hat, ntt(u)).sum(axis=0))) % KYBER_Q
+    return _byte_encode(_compress(w, 1), 1)
+
+
+def ml_kem_keygen(d=None, z=None):
+    """Generate an ML-KEM-768 (encapsulation key, decapsulation key) pair"""
+    d = os.urandom(KYBER_SYMBYTES) if d is None else d
+    z = os.urandom(KYBER_SYMBYTES) if z is None else z
+    ek, dk_pke = _pke_keygen(d)
+    return ek, dk_pke + ek + _hash_h(ek) + z
+
+
+def ml_kem_encaps(ek, m=None):
+    """Encapsulate a fresh 32-byte shared secret; returns (secret, ciphertext)"""
+    if len(ek) != KYBER_PUBLICKEYBYTES:
+        raise ValueError("Invalid encapsulation key length")
+    t_bytes = ek[:KYBER_K * KYBER_POLYBYTES]
+    if _byte_encode(_byte_decode(t_bytes, 12), 12) != t_bytes:
+        raise ValueError("Encapsulation key failed modulus check")
+
+    m = os.urandom(KYBER_SYMBYTES) if m is None else m
+    shared_secret, r = _hash_g(m + _hash_h(ek))
+    return shared_secret, _pke_encrypt(ek, m, r)
+
+
+def ml_kem_decaps(dk, c):
+    """Recover the shared secret from a ciphertext (implicit rejection on failure)"""
+    if len(dk) != KYBER_SECRETKEYBYTES:
+        raise ValueError("Invalid decapsulation key length")
+    if len(c) != KYBER_CIPHERTEXTBYTES:
+        raise ValueError("Invalid ciphertext length")
+
+    offset = KYBER_K * KYBER_POLYBYTES
+    dk_pke = dk[:offset]
+    ek = dk[offset:offset + KYBER_PUBLICKEYBYTES]
+    h = dk[offset + KYBER_PUBLICKEYBYTES:offset + KYBER_PUBLICKEYBYTES + 32]
+    z = dk[offset + KYBER_PUBLICKEYBYTES + 32:]
+
+    m = _pke_decrypt(dk_pke, c)
+    shared_secret, r = _hash_g(m + h)
+    rejection_secret = _hash_j(z + c)
+    if not hmac.compare_digest(_pke_encrypt(ek, m, r), c):
+        return rejection_secret
+    return shared_secret
+
 
 class KyberKeyExchange:
-    """Simplified Kyber-like key exchange for demonstration"""
-    
-    def __init__(self):
+    """ML-KEM-768 key encapsulation between two call peers
+
+    The caller publishes ``generate_keypair()``; the callee runs
+    ``encapsulate()`` on it and sends back the ciphertext, which the caller
+    passes to ``decapsulate()``. Both sides then share the same secret.
+    With a ``KeypairPool`` the keypair is taken pre-generated from the pool.
+    """
+
+    def __init__(self, keypair_pool=None):
+        self.keypair_pool = keypair_pool
         self.private_key = None
         self.public_key = None
         self.shared_secret = None
-    
+        self.ciphertext = None
+
     def generate_keypair(self):
         """Generate Kyber keypair"""
-        # Simplified implementation - in production use actual Kyber
-        self.private_key = secrets.randbits(256)
-        self.public_key = hashlib.sha256(str(self.private_key).encode()).hexdigest()
+        if self.keypair_pool:
+            self.public_key, self.private_key = self.keypair_pool.acquire()
+        else:
+            self.public_key, self.private_key = ml_kem_keygen()
+        self.shared_secret = None
+        self.ciphertext = None
         return self.public_key
-    
+
+    async def generate_keypair_async(self):
+        """Generate Kyber keypair without running keygen on the event loop"""
+        if self.keypair_pool:
+            self.public_key, self.private_key = await self.keypair_pool.acquire_async()
+        else:
+            loop = asyncio.get_running_loop()
+            self.public_key, self.private_key = await loop.run_in_executor(None, ml_kem_keygen)
+        self.shared_secret = None
+        self.ciphertext = None
+        return self.public_key
+
+    def encapsulate(self, peer_public_key):
+        """Encapsulate a new shared secret to the peer's public key"""
+        self.shared_secret, self.ciphertext = ml_kem_encaps(peer_public_key)
+        return self.ciphertext
+
+    def decapsulate(self, ciphertext):
+        """Recover the shared secret from the peer's ciphertext"""
+        if self.private_key is None:
+            raise ValueError("No keypair generated")
+        self.shared_secret = ml_kem_decaps(self.private_key, ciphertext)
+        return self.shared_secret
+
+    async def encapsulate_async(self, peer_public_key):
+        """``encapsulate`` on a worker thread, keeping the event loop free"""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.encapsulate, peer_public_key
+        )
+
+    async def decapsulate_async(self, ciphertext):
+        """``decapsulate`` on a worker thread, keeping the event loop free"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.decapsulate, ciphertext)
+
     def derive_shared_secret(self, peer_public_key):
-        """Derive shared secret from peer's public key"""
-        combined = f"{self.private_key}{peer_public_key}".encode()
-        self.shared_secret = hashlib.sha256(combined).digest()
+        """Derive shared secret from peer's public key
+
+        The ciphertext the peer needs to decapsulate is kept in ``self.ciphertext``.
+        """
+        self.encapsulate(peer_public_key)
         return self.shared_secret
-    
+
     def get_encryption_key(self):
         """Get AES key from shared secret"""
         if not self.shared_secret:
@@ -35,35 +308,244 @@ class KyberKeyExchange:
         return self.shared_secret[:32]  # 256-bit AES key
 
 class MediaEncryption:
-    """Handle encryption/decryption of media streams"""
-    
-    def __init__(self, key):
+    """Authenticated encryption of media frames with ratcheting keys
+
+    Frames use an SFrame-style layout, ``header || ciphertext || tag(16)``,
+    where the variable-length header carries a key ID (KID) and a frame
+    counter (CTR) and is authenticated as associated data. A 20ms Opus
+    frame costs two or three header bytes plus the tag, with no IV and no
+    padding.
+
+    The KID packs the HKDF ratchet epoch, the root key generation from a
+    Kyber exchange and the sender (0 for the caller, 1 for the callee).
+    Every KID has its own key and nonce salt, and the nonce is the salt XOR
+    the counter, so both peers can share one root key without nonce reuse.
+    The sender ratchets every ``rekey_frames`` frames or ``rekey_seconds``
+    seconds; receivers follow from the KID and keep a replay window per
+    KID, so replays and reorders are detected from the header alone. Use
+    separate instances for sending and receiving, since each keeps its own
+    ratchet position.
+
+    ``bytes_copied`` counts payload bytes the ``*_into`` methods had to copy
+    instead of writing in place.
+    """
+
+    TAG_SIZE = 16
+    MAX_OVERHEAD = MAX_HEADER_SIZE + TAG_SIZE
+    MAX_GENERATIONS = 2
+
+    def __init__(self, key, cipher="aes-gcm", rekey_frames=None, rekey_seconds=None,
+                 generation=0, sender_id=0):
+        if cipher not in AEAD_CIPHERS:
+            raise ValueError(f"Unsupported cipher: {cipher}")
         self.key = key
-        self.backend = default_backend()
-    
-    def encrypt_frame(self, frame_data):
+        self.cipher = cipher
+        self.rekey_frames = rekey_frames
+        self.rekey_seconds = rekey_seconds
+        self.sender_id = sender_id & 1
+        self._ratchets = {generation % 256: KeyRatchet(key)}
+        self._contexts = {}
+        self._windows = {}
+        self._lock = threading.RLock()  # frames may be encrypted on worker threads
+
+        self.generation = generation % 256
+        self.epoch = 0
+        self.counter = 0
+        self.bytes_copied = 0
+        self.replays = 0
+        self.reordered = 0
+        self._start_epoch(0)
+
+    @staticmethod
+    def make_kid(epoch, generation, sender_id):
+        """Pack (epoch, generation, sender) into a key ID"""
+        return epoch << 9 | (generation % 256) << 1 | sender_id
+
+    @staticmethod
+    def split_kid(kid):
+        """Unpack a key ID into (epoch, generation, sender)"""
+        return kid >> 9, (kid >> 1) & 0xFF, kid & 1
+
+    def _kid_context(self, base_key, kid):
+        """AEAD context and nonce salt for one key ID"""
+        label = b"SFrame 1.0 " + kid.to_bytes(8, "big") + self.cipher.encode()
+        material = HKDF(algorithm=hashes.SHA256(), length=len(base_key) + 12,
+                        salt=None, info=label).derive(base_key)
+        return AEAD_CIPHERS[self.cipher](material[:-12]), int.from_bytes(material[-12:], "big")
+
+    def _context(self, kid):
+        """Cached context for a KID whose epoch is committed in its ratchet"""
+        context = self._contexts.get(kid)
+        if context is None:
+            epoch, generation, _ = self.split_kid(kid)
+            key = self._ratchets[generation].commit(epoch)
+            context = self._contexts[kid] = self._kid_context(key, kid)
+            self._prune()
+        return context
+
+    def _prune(self):
+        """Drop contexts and replay windows whose keys are no longer held"""
+        for kid in list(self._contexts):
+            epoch, generation, _ = self.split_kid(kid)
+            ratchet = self._ratchets.get(generation)
+            if ratchet is None or epoch < ratchet.oldest:
+                del self._contexts[kid]
+                self._windows.pop(kid, None)
+
+    def install_key(self, key, generation):
+        """Add a new root key (e.g. from a Kyber re-exchange) for receiving
+
+        Only the newest generations are kept, but never the one currently
+        used for sending.
+        """
+        with self._lock:
+            generation %= 256
+            self._ratchets.pop(generation, None)
+            self._ratchets[generation] = KeyRatchet(key)
+            for old in list(self._ratchets):
+                if len(self._ratchets) <= self.MAX_GENERATIONS:
+                    break
+                if old != self.generation and old != generation:
+                    del self._ratchets[old]
+            self._prune()
+
+    def activate(self, generation):
+        """Start sending with an installed generation"""
+        with self._lock:
+            generation %= 256
+            if generation not in self._ratchets:
+                raise ValueError(f"Key generation {generation} not installed")
+            self.generation = generation
+            self._start_epoch(self._ratchets[generation].latest)
+
+    def rotate(self):
+        """Ratchet the sending key forward one epoch"""
+        with self._lock:
+            self._start_epoch(self.epoch + 1)
+
+    def _start_epoch(self, epoch):
+        self.epoch = epoch
+        self.kid = self.make_kid(epoch, self.generation, self.sender_id)
+        self.aead, self.salt = self._context(self.kid)
+        self.epoch_started = time.monotonic()
+        self.counter = 0
+
+    def _rotation_due(self):
+        if self.rekey_frames and self.counter >= self.rekey_frames:
+            return True
+        return bool(self.rekey_seconds) and time.monotonic() - self.epoch_started >= self.rekey_seconds
+
+    def next_nonce(self):
+        """Return (header, nonce, aead) for the next frame"""
+        with self._lock:
+            if self._rotation_due():
+                self._start_epoch(self.epoch + 1)
+            counter = self.counter
+            if counter >= 1 << 64:
+                raise OverflowError("Frame counter exhausted, rekey required")
+            self.counter = counter + 1
+            nonce = (self.salt ^ counter).to_bytes(12, "big")
+            return encode_header(self.kid, counter), nonce, self.aead
+
+    def encrypted_size(self, plaintext_size):
+        """Upper bound on the encrypted size of a plaintext of the given size"""
+        return plaintext_size + self.MAX_OVERHEAD
+
+    def encrypt_frame(self, frame_data, aad=None):
         """Encrypt video/audio frame"""
-        iv = os.urandom(16)
-        cipher = Cipher(algorithms.AES(self.key), modes.CBC(iv), backend=self.backend)
-        encryptor = cipher.encryptor()
-        
-        # Pad data to multiple of 16 bytes
-        padding_length = 16 - (len(frame_data) % 16)
-        padded_data = frame_data + bytes([padding_length] * padding_length)
-        
-        encrypted_data = encryptor.update(padded_data) + encryptor.finalize()
-        return iv + encrypted_data
-    
-    def decrypt_frame(self, encrypted_data):
-        """Decrypt video/audio frame"""
-        iv = encrypted_data[:16]
-        ciphertext = encrypted_data[16:]
-        
-        cipher = Cipher(algorithms.AES(self.key), modes.CBC(iv), backend=self.backend)
-        decryptor = cipher.decryptor()
-        
-        padded_data = decryptor.update(ciphertext) + decryptor.finalize()
-        
-        # Remove padding
-        padding_length = padded_data[-1]
-        return padded_data[:-padding_length]
\ No newline at end of file
+        header, nonce, aead = self.next_nonce()
+        return header + aead.encrypt(nonce, frame_data, header + (aad or b""))
+
+    def encrypt_frame_into(self, frame_data, out, aad=None):
+        """Encrypt a frame into a caller-supplied buffer, return bytes written"""
+        data = memoryview(frame_data).cast("B")
+        out = memoryview(out)
+        header, nonce, aead = self.next_nonce()
+        start = len(header)
+        size = start + data.nbytes + self.TAG_SIZE
+        if out.nbytes < size:
+            raise ValueError("Output buffer too small")
+
+        out[:start] = header
+        aad = header + (aad or b"")
+        if _AEAD_INTO:
+            aead.encrypt_into(nonce, data, aad, out[start:size])
+        else:
+            out[start:size] = aead.encrypt(nonce, data, aad)
+            self.bytes_copied += size - start
+        return size
+
+    def _decrypt(self, encrypted_data, aad, out):
+        """Decrypt with the KID's key; ratchet and replay state move only once authentic"""
+        data = memoryview(encrypted_data)
+        kid, counter, start = decode_header(data)
+        if data.nbytes < start + self.TAG_SIZE:
+            raise ValueError("Encrypted frame too short")
+        epoch, generation, sender_id = self.split_kid(kid)
+        if sender_id == self.sender_id:
+            raise ValueError("Frame carries our own sender ID")
+        header = bytes(data[:start])
+        aad = header + (aad or b"")
+
+        with self._lock:
+            window = self._windows.get(kid)
+            if window and window.check(counter) in (ReplayWindow.REPLAY, ReplayWindow.TOO_OLD):
+                self.replays += 1
+                raise ValueError(f"Replayed or stale frame {counter} for key {kid}")
+            context = self._contexts.get(kid)
+            committed = context is not None
+            if not committed:
+                ratchet = self._ratchets.get(generation)
+                if ratchet is None:
+                    raise ValueError(f"Unknown key generation {generation}")
+                key = ratchet.peek(epoch)
+                if key is None:
+                    raise ValueError(f"Key epoch {epoch} not available")
+                context = self._kid_context(key, kid)
+
+        aead, salt = context
+        nonce = (salt ^ counter).to_bytes(12, "big")
+        if out is None:
+            result = aead.decrypt(nonce, data[start:], aad)
+        else:
+            result = data.nbytes - start - self.TAG_SIZE
+            if out.nbytes < result:
+                raise ValueError("Output buffer too small")
+            if _AEAD_INTO:
+                aead.decrypt_into(nonce, data[start:], aad, out[:result])
+            else:
+                out[:result] = aead.decrypt(nonce, data[start:], aad)
+                self.bytes_copied += result
+
+        with self._lock:
+            if not committed and generation in self._ratchets:
+                self._contexts.setdefault(kid, context)
+                self._ratchets[generation].commit(epoch)
+                self._prune()
+            window = self._windows.setdefault(kid, ReplayWindow())
+            state = window.check(counter)
+            if state in (ReplayWindow.REPLAY, ReplayWindow.TOO_OLD):
+                self.replays += 1
+                raise ValueError(f"Replayed or stale frame {counter} for key {kid}")
+            if state == ReplayWindow.REORDERED:
+                self.reordered += 1
+            window.update(counter)
+        return result
+
+    def decrypt_frame(self, encrypted_data, aad=None):
+        """Decrypt video/audio frame (raises InvalidTag if it was tampered with)"""
+        return self._decrypt(encrypted_data, aad, None)
+
+    def decrypt_frame_into(self, encrypted_data, out, aad=None):
+        """Decrypt a frame into a caller-supplied buffer, return bytes written"""
+        return self._decrypt(encrypted_data, aad, memoryview(out))
+
+    def stats(self):
+        """Sending position and replay/reorder counters"""
+        return {
+            "generation": self.generation,
+            "epoch": self.epoch,
+            "counter": self.counter,
+            "replays": self.replays,
+            "reordered": self.reordered,
+        }
@@ -0,0 +1,73 @@
+"""
+Precomputed NTT Tables for Kyber
+
+Twiddle factors, Montgomery constants and the bit-reversal permutation are
+built once at import with vectorized modular exponentiation and exposed as
+read-only NumPy arrays, so nothing on the NTT path calls pow() per element.
+"""
+import numpy as np
+
+KYBER_N = 256
+KYBER_Q = 3329
+KYBER_ROOT_OF_UNITY = 17  # primitive 256th root of unity mod q
+
+# Montgomery arithmetic with R = 2^16, as in the C reference implementation
+MONT_BITS = 16
+MONT = (1 << MONT_BITS) % KYBER_Q             # 2285, R mod q
+MONT_SQ = (1 << 2 * MONT_BITS) % KYBER_Q      # 1353, R^2 mod q
+QINV = pow(KYBER_Q, -1, 1 << MONT_BITS)       # 62209, q^-1 mod R
+N_INV = pow(KYBER_N // 2, -1, KYBER_Q)        # 3303, 128^-1 mod q
+
+
+def bit_reverse(values, bits):
+    """Reverse the low `bits` bits of each value in an integer array"""
+    values = np.asarray(values, dtype=np.int64)
+    result = np.zeros_like(values)
+    for bit in range(bits):
+        result |= ((values >> bit) & 1) << (bits - 1 - bit)
+    return result
+
+
+def pow_mod(base, exponents, modulus=KYBER_Q):
+    """Vectorized base^e mod m over an array of exponents"""
+    exponents = np.array(exponents, dtype=np.int64)
+    result = np.ones_like(exponents)
+    square = np.full_like(exponents, base % modulus)
+    while exponents.any():
+        result = np.where(exponents & 1, result * square % modulus, result)
+        square = square * square % modulus
+        exponents >>= 1
+    return result
+
+
+def to_signed(values, modulus=KYBER_Q):
+    """Map residues in [0, q) to the centred range used by the C reference"""
+    values = np.asarray(values, dtype=np.int64) % modulus
+    return np.where(values > modulus // 2, values - modulus, values)
+
+
+def montgomery_reduce(a):
+    """Vectorized Montgomery reduction with C int16/int32 semantics
+
+    For |a| < q * 2^15 returns a * 2^-16 mod q in (-q, q), bit-for-bit
+    matching ``montgomery_reduce`` from the Kyber C reference.
+    """
+    a = np.asarray(a, dtype=np.int64)
+    t = (a * QINV) & 0xFFFF
+    t = np.where(t >= 0x8000, t - 0x10000, t)
+    return (a - t * KYBER_Q) >> MONT_BITS
+
+
+def _freeze(array):
+    array.setflags(write=False)
+    return array
+
+
+BITREV7 = _freeze(bit_reverse(np.arange(KYBER_N // 2), 7))
+
+# zetas[i] = 17^BitRev7(i) and gammas[i] = 17^(2*BitRev7(i)+1) mod q (FIPS 203)
+ZETAS = _freeze(pow_mod(KYBER_ROOT_OF_UNITY, BITREV7))
+GAMMAS = _freeze(pow_mod(KYBER_ROOT_OF_UNITY, 2 * BITREV7 + 1))
+
+# The same zetas in signed Montgomery form, laid out like ref/ntt.c
+ZETAS_MONT = _freeze(to_signed(ZETAS * MONT))
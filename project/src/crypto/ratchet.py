@@ -0,0 +1,52 @@
+"""
+Symmetric Key Ratchet for Media Keys
+"""
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+RATCHET_INFO = b"cryptobugger media key ratchet"
+
+# Receivers follow a sender at most this many epochs ahead of the newest key
+MAX_EPOCH_SKIP = 16
+
+def ratchet_key(key):
+    """Derive the next epoch's key from the current one (HKDF-SHA256)"""
+    return HKDF(algorithm=hashes.SHA256(), length=len(key), salt=None,
+                info=RATCHET_INFO).derive(key)
+
+class KeyRatchet:
+    """Epoch keys of one HKDF chain, keeping a small window of past epochs
+
+    Keys only move forward: once an epoch falls out of the window its key
+    is forgotten, so compromising a later key does not expose older media.
+    """
+
+    def __init__(self, root_key, window=2):
+        self.window = window
+        self.latest = 0
+        self._keys = {0: root_key}
+
+    @property
+    def oldest(self):
+        """Oldest epoch whose key is still held"""
+        return min(self._keys)
+
+    def peek(self, epoch):
+        """Key for `epoch` without moving the ratchet; None if unavailable"""
+        if epoch in self._keys:
+            return self._keys[epoch]
+        if epoch < self.latest or epoch - self.latest > MAX_EPOCH_SKIP:
+            return None
+        key = self._keys[self.latest]
+        for _ in range(epoch - self.latest):
+            key = ratchet_key(key)
+        return key
+
+    def commit(self, epoch):
+        """Move the ratchet forward to `epoch` and forget keys outside the window"""
+        while self.latest < epoch:
+            self._keys[self.latest + 1] = ratchet_key(self._keys[self.latest])
+            self.latest += 1
+        for old in [e for e in self._keys if e < self.latest - self.window]:
+            del self._keys[old]
+        return self._keys.get(epoch)
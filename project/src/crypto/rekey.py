@@ -0,0 +1,98 @@
+"""
+Background Kyber Re-exchange
+Replaces the media root key during a call without SDP renegotiation
+"""
+import asyncio
+import base64
+import logging
+
+from .kyber import KyberKeyExchange
+
+logger = logging.getLogger(__name__)
+
+class KemRekeyer:
+    """Periodic ML-KEM re-exchange over the signaling channel
+
+    The initiator sends ``rekey_offer`` with a fresh public key every
+    ``interval`` seconds. The responder encapsulates, installs the new key
+    for receiving and replies with ``rekey_answer``. The initiator installs
+    the key, switches its sender to it and confirms with ``rekey_done``,
+    on which the responder switches too. Both sides accept the old and the
+    new key throughout, so media never pauses.
+    """
+
+    def __init__(self, signaling_client, peer_id, peer_connection, initiator,
+                 interval=600, keypair_pool=None):
+        self.signaling = signaling_client
+        self.peer_id = peer_id
+        self.peer_connection = peer_connection
+        self.initiator = initiator
+        self.interval = interval
+        self.keypair_pool = keypair_pool
+        self.generation = 0
+        self.pending = {}
+        self.task = None
+
+    def start(self):
+        """Start periodic re-exchange (initiator only)"""
+        if self.initiator and self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        """Stop periodic re-exchange"""
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        self.pending.clear()
+
+    async def run(self):
+        """Send a rekey offer every interval"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.send_offer()
+            except Exception as e:
+                logger.error(f"Error sending rekey offer: {e}")
+
+    async def send_offer(self):
+        """Start a re-exchange with a fresh keypair"""
+        generation = (self.generation + 1) % 256
+        exchange = KyberKeyExchange(self.keypair_pool)
+        public_key = await exchange.generate_keypair_async()
+        self.pending = {generation: exchange}
+        await self.signaling.rekey_offer(
+            self.peer_id, generation, base64.b64encode(public_key).decode()
+        )
+
+    async def on_rekey_offer(self, data):
+        """Responder: encapsulate and accept the new key for receiving"""
+        generation = data.get("generation")
+        exchange = KyberKeyExchange()
+        ciphertext = await exchange.encapsulate_async(base64.b64decode(data.get("public_key")))
+        self.peer_connection.install_key(exchange.get_encryption_key(), generation)
+        self.pending = {generation: exchange}
+        await self.signaling.rekey_answer(
+            self.peer_id, generation, base64.b64encode(ciphertext).decode()
+        )
+
+    async def on_rekey_answer(self, data):
+        """Initiator: decapsulate, switch sending and tell the peer"""
+        generation = data.get("generation")
+        exchange = self.pending.pop(generation, None)
+        if exchange is None:
+            logger.warning(f"Unexpected rekey answer for generation {generation}")
+            return
+        await exchange.decapsulate_async(base64.b64decode(data.get("ciphertext")))
+        self.peer_connection.install_key(exchange.get_encryption_key(), generation)
+        self.peer_connection.activate_key(generation)
+        self.generation = generation
+        await self.signaling.rekey_done(self.peer_id, generation)
+
+    async def on_rekey_done(self, data):
+        """Responder: switch sending to the new key"""
+        generation = data.get("generation")
+        if self.pending.pop(generation, None) is None:
+            logger.warning(f"Unexpected rekey confirmation for generation {generation}")
+            return
+        self.peer_connection.activate_key(generation)
+        self.generation = generation
@@ -0,0 +1,83 @@
+"""
+SFrame-Style Frame Header and Replay Window
+
+Header layout (as in RFC 9605): one config byte ``|X|K K K|Y|C C C|``
+followed by the extended key ID and counter. When X (Y) is clear the
+key ID (counter) is the 3-bit value K (C) itself; when set, K (C) + 1 is
+the length of the big-endian value that follows. A small key ID with a
+counter below 256 costs two bytes.
+"""
+
+MAX_HEADER_SIZE = 1 + 8 + 8
+
+def _encode_value(value, flag):
+    """Config bits and extension bytes for one header field"""
+    if value < 0:
+        raise ValueError("Header values must be non-negative")
+    if value < 8:
+        return value, b""
+    length = (value.bit_length() + 7) // 8
+    if length > 8:
+        raise ValueError("Header value too large")
+    return flag | (length - 1), value.to_bytes(length, "big")
+
+def encode_header(kid, ctr):
+    """Build the header for a key ID and frame counter"""
+    kid_bits, kid_bytes = _encode_value(kid, 0x8)
+    ctr_bits, ctr_bytes = _encode_value(ctr, 0x8)
+    return bytes((kid_bits << 4 | ctr_bits,)) + kid_bytes + ctr_bytes
+
+def decode_header(data):
+    """Parse a header, return (kid, ctr, header_length)"""
+    if len(data) < 1:
+        raise ValueError("Empty frame")
+    config = data[0]
+    position = 1
+    values = []
+    for bits in (config >> 4, config & 0xF):
+        if bits & 0x8:
+            length = (bits & 0x7) + 1
+            if position + length > len(data):
+                raise ValueError("Truncated frame header")
+            values.append(int.from_bytes(data[position:position + length], "big"))
+            position += length
+        else:
+            values.append(bits)
+    return values[0], values[1], position
+
+class ReplayWindow:
+    """Sliding window over frame counters, as SRTP uses for replay protection
+
+    ``check`` classifies a counter without changing state; ``update`` is
+    called only once the frame has authenticated.
+    """
+
+    NEW = "new"
+    REORDERED = "reordered"
+    REPLAY = "replay"
+    TOO_OLD = "too_old"
+
+    def __init__(self, size=128):
+        self.size = size
+        self.highest = -1
+        self.mask = 0
+
+    def check(self, ctr):
+        """Classify a counter as new, reordered, replayed or too old"""
+        if ctr > self.highest:
+            return self.NEW
+        offset = self.highest - ctr
+        if offset >= self.size:
+            return self.TOO_OLD
+        if (self.mask >> offset) & 1:
+            return self.REPLAY
+        return self.REORDERED
+
+    def update(self, ctr):
+        """Mark a counter as seen"""
+        if ctr > self.highest:
+            shift = ctr - self.highest
+            self.mask = ((self.mask << shift) | 1) & ((1 << self.size) - 1)
+            self.highest = ctr
+        else:
+            self.mask |= 1 << (self.highest - ctr)
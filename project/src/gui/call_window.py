@@ -3,21 +3,22 @@ Call Window for Active Video/Audio Calls
 """
 import tkinter as tk
 from tkinter import ttk
+import asyncio
 import cv2
-from PIL import Image, ImageTk
-import numpy as np
-import threading
 import time
 
+from .video_pipeline import VideoPipeline
+
 class CallWindow:
     """Window for active video/audio calls"""
     
-    def __init__(self, parent, peer_id, call_type, peer_connection, end_call_callback):
+    def __init__(self, parent, peer_id, call_type, peer_connection, end_call_callback, loop=None):
         self.parent = parent
         self.peer_id = peer_id
         self.call_type = call_type
         self.peer_connection = peer_connection
         self.end_call_callback = end_call_callback
+        self.loop = loop  # asyncio loop the peer connection runs on
         
         # Create window
         self.window = tk.Toplevel(parent)
@@ -33,7 +34,10 @@ class CallWindow:
         
         # Video capture for local preview
         self.local_cap = None
-        self.video_thread = None
+        self.local_pipeline = None
+        self.local_consumer = None
+        self.remote_pipeline = None
+        self.remote_consumer = None
         
         self.setup_gui()
         self.setup_video()
@@ -63,6 +67,13 @@ class CallWindow:
                                   font=('Arial', 12))
         duration_label.pack(side=tk.RIGHT)
         
+        # Live call quality readout
+        self.stats_var = tk.StringVar(value="")
+        stats_label = ttk.Label(main_frame,
+                               textvariable=self.stats_var,
+                               font=('Courier', 9))
+        stats_label.pack(fill=tk.X, pady=(0, 5))
+        
         # Video frame (if video call)
         if self.video_enabled:
             video_frame = ttk.Frame(main_frame)
@@ -133,39 +144,54 @@ class CallWindow:
     def setup_video(self):
         """Setup video capture and display"""
         if self.video_enabled:
+            if self.peer_connection and self.loop and self.peer_connection.local_video_source:
+                self.setup_shared_preview()
+            else:
+                self.setup_camera_preview()
+            self.setup_remote_video()
+    
+    def setup_camera_preview(self):
+        """Open the webcam just for the preview (no call media to share)"""
+        try:
+            self.local_cap = cv2.VideoCapture(0)
+            if self.local_cap.isOpened():
+                # Mirrored preview; capture and processing stay off the Tk thread
+                self.local_pipeline = VideoPipeline(self.local_video_label,
+                                                    source=self.local_cap.read,
+                                                    size=(160, 120), mirror=True)
+                self.local_pipeline.start()
+        except Exception as e:
+            print(f"Error setting up video: {e}")
+    
+    def setup_shared_preview(self):
+        """Preview the camera the call is already sending, scaled down before conversion"""
+        self.local_pipeline = VideoPipeline(self.local_video_label, size=(160, 120), mirror=True)
+        self.local_pipeline.start()
+        
+        async def consume():
+            track = self.peer_connection.local_preview_track()
+            if track is None:
+                return
             try:
-                # Try to open webcam
-                self.local_cap = cv2.VideoCapture(0)
-                if self.local_cap.isOpened():
-                    self.video_thread = threading.Thread(target=self.video_loop, daemon=True)
-                    self.video_thread.start()
-            except Exception as e:
-                print(f"Error setting up video: {e}")
+                await self.local_pipeline.consume(track)
+            finally:
+                track.stop()  # Unsubscribe from the relay
+        
+        self.local_consumer = asyncio.run_coroutine_threadsafe(consume(), self.loop)
     
-    def video_loop(self):
-        """Video capture and display loop"""
-        while self.call_active and self.local_cap and self.local_cap.isOpened():
-            ret, frame = self.local_cap.read()
-            if ret:
-                # Flip frame horizontally for mirror effect
-                frame = cv2.flip(frame, 1)
-                
-                # Convert BGR to RGB
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
-                # Resize for local preview
-                local_frame = cv2.resize(frame_rgb, (160, 120))
-                
-                # Convert to PIL Image
-                local_image = Image.fromarray(local_frame)
-                local_photo = ImageTk.PhotoImage(local_image)
-                
-                # Update local video preview
-                if hasattr(self, 'local_video_label'):
-                    self.local_video_label.configure(image=local_photo, text="")
-                    self.local_video_label.image = local_photo
-            
-            time.sleep(1/30)  # 30 FPS
+    def setup_remote_video(self):
+        """Render the peer's video track, scaled to the remote video area"""
+        if not (self.peer_connection and self.loop):
+            return
+        self.remote_pipeline = VideoPipeline(self.remote_video_label, size=(640, 480), fit=True)
+        self.remote_pipeline.start()
+        
+        async def consume():
+            track = await self.peer_connection.wait_remote_video()
+            await self.remote_pipeline.consume(track)
+        
+        # Only recv() runs on the signaling loop; decoding to RGB is on the pipeline thread
+        self.remote_consumer = asyncio.run_coroutine_threadsafe(consume(), self.loop)
     
     def update_duration(self):
         """Update call duration display"""
@@ -174,10 +200,30 @@ class CallWindow:
             minutes = elapsed // 60
             seconds = elapsed % 60
             self.duration_var.set(f"{minutes:02d}:{seconds:02d}")
+            self.update_stats()
             
             # Schedule next update
             self.window.after(1000, self.update_duration)
     
+    def update_stats(self):
+        """Show the newest call quality sample"""
+        sample = self.peer_connection.call_stats.latest() if self.peer_connection else None
+        if sample is None:
+            return
+        
+        def show(value, unit, digits=0):
+            return "-" if value != value else f"{value:.{digits}f}{unit}"  # NaN: not measured
+        
+        self.stats_var.set(
+            f"↑ {show(sample['send_kbps'], ' kbps')} {show(sample['send_fps'], ' fps')}  "
+            f"↓ {show(sample['recv_kbps'], ' kbps')} {show(sample['recv_fps'], ' fps')}  "
+            f"rtt {show(sample['rtt_ms'], ' ms')}  "
+            f"loss {show(sample['send_loss_pct'], '%', 1)}/{show(sample['recv_loss_pct'], '%', 1)}  "
+            f"jitter {show(sample['jitter_ms'], ' ms')}\n"
+            f"enc {show(sample['encode_ms'], ' ms', 1)} dec {show(sample['decode_ms'], ' ms', 1)}  "
+            f"crypto {show(sample['encrypt_ms'], ' ms', 2)}/{show(sample['decrypt_ms'], ' ms', 2)}"
+        )
+    
     def toggle_mute(self):
         """Toggle audio mute"""
         self.muted = not self.muted
@@ -197,7 +243,12 @@ class CallWindow:
         
         if not self.video_enabled:
             # Show "Video Off" message
-            self.local_video_label.configure(image="", text="Video Off")
+            if self.local_pipeline:
+                self.local_pipeline.pause("Video Off")
+            else:
+                self.local_video_label.configure(image="", text="Video Off")
+        elif self.local_pipeline:
+            self.local_pipeline.resume()
         
         # TODO: Actually enable/disable video in peer connection
     
@@ -216,6 +267,18 @@ class CallWindow:
         self.call_active = False
         
         # Cleanup video capture
+        if self.local_consumer:
+            self.local_consumer.cancel()
+            self.local_consumer = None
+        if self.remote_consumer:
+            self.remote_consumer.cancel()
+            self.remote_consumer = None
+        if self.remote_pipeline:
+            self.remote_pipeline.stop()
+            self.remote_pipeline = None
+        if self.local_pipeline:
+            self.local_pipeline.stop()
+            self.local_pipeline = None
         if self.local_cap:
             self.local_cap.release()
         
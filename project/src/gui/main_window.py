@@ -4,6 +4,7 @@ Main GUI Window for WebRTC Calling Application
 import tkinter as tk
 from tkinter import ttk, messagebox
 import asyncio
+import base64
 import threading
 import logging
 from typing import Optional
@@ -14,8 +15,10 @@ import numpy as np
 from ..webrtc.peer_connection import WebRTCPeerConnection
 from ..signaling.websocket_client import SignalingClient
 from ..crypto.kyber import KyberKeyExchange
+from ..crypto.keypool import KeypairPool
+from ..crypto.rekey import KemRekeyer
 from .call_window import CallWindow
-from .settings_window import SettingsWindow
+from .settings_window import SettingsWindow, load_settings
 
 logger = logging.getLogger(__name__)
 
@@ -32,10 +35,13 @@ class MainWindow:
         self.user_id = None
         self.signaling_client = None
         self.peer_connection = None
-        self.kyber_exchange = KyberKeyExchange()
+        self.keypair_pool = KeypairPool()
+        self.keypair_pool.start()
+        self.kyber_exchange = KyberKeyExchange(self.keypair_pool)
         self.connected_users = []
         self.current_call = None
         self.call_window = None
+        self.rekeyer = None
         
         # Async event loop
         self.loop = None
@@ -198,25 +204,37 @@ class MainWindow:
         """Setup signaling event callbacks"""
         
         async def on_user_list(data):
-            users = data.get("users", [])
             # Remove self from list
-            users = [u for u in users if u != self.user_id]
-            self.connected_users = users
+            users = [u for u in data.get("users", []) if u != self.user_id]
             
-            # Update GUI in main thread
-            self.root.after(0, self.update_users_list)
+            # Update GUI in main thread, in order with the deltas
+            self.root.after(0, lambda: self.update_users_list(users=users))
+        
+        async def on_presence_delta(data):
+            joined = [u for u in data.get("joined", []) if u != self.user_id]
+            left = [u for u in data.get("left", []) if u != self.user_id]
+            self.root.after(0, lambda: self.update_users_list(joined=joined, left=left))
         
         async def on_call_offer(data):
             caller_id = data.get("from")
             offer = data.get("offer")
             call_type = data.get("call_type", "video")
+            public_key = data.get("public_key")
             
             # Show incoming call dialog in main thread
-            self.root.after(0, lambda: self.show_incoming_call(caller_id, offer, call_type))
+            self.root.after(0, lambda: self.show_incoming_call(caller_id, offer, call_type, public_key))
         
         async def on_call_answer(data):
             answer = data.get("answer")
+            ciphertext = data.get("ciphertext")
             if self.peer_connection:
+                # Finish the Kyber exchange before any media can flow
+                if ciphertext:
+                    await self.kyber_exchange.decapsulate_async(base64.b64decode(ciphertext))
+                    self.peer_connection.set_encryption_key(self.kyber_exchange.get_encryption_key())
+                    self.start_rekeying(data.get("from"), initiator=True)
+                else:
+                    logger.warning("Call answer has no Kyber ciphertext, media stays blocked")
                 await self.peer_connection.set_remote_description(answer)
         
         async def on_call_reject(data):
@@ -232,27 +250,72 @@ class MainWindow:
             if self.peer_connection:
                 await self.peer_connection.add_ice_candidate(candidate)
         
+        async def on_ice_candidates(data):
+            candidates = data.get("candidates", [])
+            if self.peer_connection:
+                await self.peer_connection.add_ice_candidate(candidates)
+        
+        async def on_rekey_offer(data):
+            if self.rekeyer:
+                await self.rekeyer.on_rekey_offer(data)
+        
+        async def on_rekey_answer(data):
+            if self.rekeyer:
+                await self.rekeyer.on_rekey_answer(data)
+        
+        async def on_rekey_done(data):
+            if self.rekeyer:
+                await self.rekeyer.on_rekey_done(data)
+        
         # Register callbacks
         self.signaling_client.on("user_list", on_user_list)
+        self.signaling_client.on("presence_delta", on_presence_delta)
         self.signaling_client.on("call_offer", on_call_offer)
         self.signaling_client.on("call_answer", on_call_answer)
         self.signaling_client.on("call_reject", on_call_reject)
         self.signaling_client.on("call_end", on_call_end)
         self.signaling_client.on("ice_candidate", on_ice_candidate)
+        self.signaling_client.on("ice_candidates", on_ice_candidates)
+        self.signaling_client.on("rekey_offer", on_rekey_offer)
+        self.signaling_client.on("rekey_answer", on_rekey_answer)
+        self.signaling_client.on("rekey_done", on_rekey_done)
         
-        # Connection established
+        # Connection established (again after each reconnect)
         def on_connected():
             self.status_var.set(f"Connected as {self.user_id}")
             self.video_call_btn.configure(state=tk.NORMAL)
             self.audio_call_btn.configure(state=tk.NORMAL)
         
-        self.root.after(2000, on_connected)  # Simulate connection delay
+        async def on_registered(data):
+            self.root.after(0, on_connected)
+        
+        async def on_disconnected(data):
+            if not data.get("final"):
+                status = "Connection lost, reconnecting..."
+            elif data.get("reason") == "replaced":
+                status = "Disconnected: signed in from another window"
+            else:
+                status = "Disconnected by the server"
+            self.root.after(0, lambda: self.status_var.set(status))
+        
+        self.signaling_client.on("registered", on_registered)
+        self.signaling_client.on("disconnected", on_disconnected)
     
-    def update_users_list(self):
-        """Update the users listbox"""
-        self.users_listbox.delete(0, tk.END)
-        for user in self.connected_users:
-            self.users_listbox.insert(tk.END, user)
+    def update_users_list(self, users=None, joined=None, left=None):
+        """Update the users listbox from a snapshot or a presence delta (Tk thread only)"""
+        if users is not None:
+            self.users_listbox.delete(0, tk.END)
+            for user in users:
+                self.users_listbox.insert(tk.END, user)
+        
+        for user in left or []:
+            shown = self.users_listbox.get(0, tk.END)
+            if user in shown:
+                self.users_listbox.delete(shown.index(user))
+        for user in joined or []:
+            if user not in self.users_listbox.get(0, tk.END):
+                self.users_listbox.insert(tk.END, user)
+        self.connected_users = list(self.users_listbox.get(0, tk.END))
     
     def initiate_call(self, call_type):
         """Initiate a call to selected user"""
@@ -265,11 +328,14 @@ class MainWindow:
         
         async def make_call():
             try:
-                # Generate Kyber keypair
-                public_key = self.kyber_exchange.generate_keypair()
+                # Take a pre-generated Kyber keypair from the pool
+                public_key = await self.kyber_exchange.generate_keypair_async()
                 
                 # Create peer connection
-                self.peer_connection = WebRTCPeerConnection(self.signaling_client)
+                self.peer_connection = WebRTCPeerConnection(
+                    self.signaling_client, sender_id=0,
+                    video_quality=load_settings()["video_quality"]
+                )
                 
                 # Start local media
                 video = call_type == "video"
@@ -278,8 +344,11 @@ class MainWindow:
                 # Create offer
                 offer = await self.peer_connection.create_offer()
                 
-                # Send call offer
-                await self.signaling_client.call_user(target_user, offer, call_type)
+                # Send call offer with our Kyber public key
+                await self.signaling_client.call_user(
+                    target_user, offer, call_type,
+                    base64.b64encode(public_key).decode()
+                )
                 
                 # Open call window
                 self.root.after(0, lambda: self.open_call_window(target_user, call_type))
@@ -290,7 +359,7 @@ class MainWindow:
         
         asyncio.run_coroutine_threadsafe(make_call(), self.loop)
     
-    def show_incoming_call(self, caller_id, offer, call_type):
+    def show_incoming_call(self, caller_id, offer, call_type, public_key=None):
         """Show incoming call dialog"""
         result = messagebox.askyesno(
             "Incoming Call", 
@@ -298,19 +367,29 @@ class MainWindow:
         )
         
         if result:
-            self.accept_call(caller_id, offer, call_type)
+            self.accept_call(caller_id, offer, call_type, public_key)
         else:
             self.reject_call(caller_id)
     
-    def accept_call(self, caller_id, offer, call_type):
+    def accept_call(self, caller_id, offer, call_type, public_key=None):
         """Accept incoming call"""
         async def accept():
             try:
-                # Generate Kyber keypair
-                public_key = self.kyber_exchange.generate_keypair()
+                # Encapsulate a media key to the caller's Kyber public key
+                ciphertext = None
+                encryption_key = None
+                if public_key:
+                    ciphertext = await self.kyber_exchange.encapsulate_async(
+                        base64.b64decode(public_key)
+                    )
+                    encryption_key = self.kyber_exchange.get_encryption_key()
+                else:
+                    logger.warning(f"Call offer from {caller_id} has no Kyber public key, media stays blocked")
                 
                 # Create peer connection
-                self.peer_connection = WebRTCPeerConnection(self.signaling_client)
+                self.peer_connection = WebRTCPeerConnection(self.signaling_client, encryption_key,
+                                                             sender_id=1,
+                                                             video_quality=load_settings()["video_quality"])
                 
                 # Start local media
                 video = call_type == "video"
@@ -319,8 +398,13 @@ class MainWindow:
                 # Create answer
                 answer = await self.peer_connection.create_answer(offer)
                 
-                # Send answer
-                await self.signaling_client.answer_call(caller_id, answer)
+                # Send answer with the Kyber ciphertext
+                await self.signaling_client.answer_call(
+                    caller_id, answer,
+                    base64.b64encode(ciphertext).decode() if ciphertext else None
+                )
+                if encryption_key:
+                    self.start_rekeying(caller_id, initiator=False)
                 
                 # Open call window
                 self.root.after(0, lambda: self.open_call_window(caller_id, call_type))
@@ -331,6 +415,16 @@ class MainWindow:
         
         asyncio.run_coroutine_threadsafe(accept(), self.loop)
     
+    def start_rekeying(self, peer_id, initiator):
+        """Start background Kyber re-exchange for the current call (on the async loop)"""
+        if self.rekeyer:
+            self.rekeyer.stop()
+        self.rekeyer = KemRekeyer(
+            self.signaling_client, peer_id, self.peer_connection,
+            initiator=initiator, keypair_pool=self.keypair_pool
+        )
+        self.rekeyer.start()
+    
     def reject_call(self, caller_id):
         """Reject incoming call"""
         async def reject():
@@ -348,7 +442,8 @@ class MainWindow:
             peer_id, 
             call_type, 
             self.peer_connection,
-            self.end_call
+            self.end_call,
+            loop=self.loop
         )
         self.current_call = peer_id
     
@@ -368,9 +463,24 @@ class MainWindow:
             self.call_window.destroy()
             self.call_window = None
         
+        if self.rekeyer:
+            self.loop.call_soon_threadsafe(self.rekeyer.stop)
+            self.rekeyer = None
+        
         if self.peer_connection:
+            peer_connection, peer_id = self.peer_connection, self.current_call
+            stats_dir = load_settings()["call_stats_dir"]
+            
             async def cleanup():
-                await self.peer_connection.close()
+                try:
+                    await peer_connection.close()
+                    if stats_dir:
+                        # File I/O off the event loop; sampling stopped with close()
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, peer_connection.call_stats.export, stats_dir, peer_id
+                        )
+                except Exception as e:
+                    logger.error(f"Error cleaning up call: {e}")
             
             asyncio.run_coroutine_threadsafe(cleanup(), self.loop)
             self.peer_connection = None
@@ -387,6 +497,7 @@ class MainWindow:
             self.root.mainloop()
         finally:
             # Cleanup
+            self.keypair_pool.stop()
             if self.loop:
                 self.loop.call_soon_threadsafe(self.loop.stop)
             if self.signaling_client:
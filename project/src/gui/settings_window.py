@@ -6,12 +6,38 @@ from tkinter import ttk, filedialog, messagebox
 import json
 import os
 
+SETTINGS_FILE = "settings.json"
+
+DEFAULT_SETTINGS = {
+    "video_device": 0,
+    "audio_device": "default",
+    "video_quality": "720p",
+    "audio_quality": "high",
+    "encryption_enabled": True,
+    "auto_answer": False,
+    "notification_sound": True,
+    "server_url": "ws://localhost:8765",
+    "call_stats_dir": "call_stats"  # per-call quality stats, empty to disable
+}
+
+def load_settings(settings_file=SETTINGS_FILE):
+    """Saved settings merged over the defaults"""
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        if os.path.exists(settings_file):
+            with open(settings_file, 'r') as f:
+                # Merge with defaults to ensure all keys exist
+                settings.update(json.load(f))
+    except Exception as e:
+        print(f"Error loading settings: {e}")
+    return settings
+
 class SettingsWindow:
     """Settings configuration window"""
     
     def __init__(self, parent):
         self.parent = parent
-        self.settings_file = "settings.json"
+        self.settings_file = SETTINGS_FILE
         
         # Load current settings
         self.settings = self.load_settings()
@@ -34,27 +60,7 @@ class SettingsWindow:
     
     def load_settings(self):
         """Load settings from file"""
-        default_settings = {
-            "video_device": 0,
-            "audio_device": "default",
-            "video_quality": "720p",
-            "audio_quality": "high",
-            "encryption_enabled": True,
-            "auto_answer": False,
-            "notification_sound": True,
-            "server_url": "ws://localhost:8765"
-        }
-        
-        try:
-            if os.path.exists(self.settings_file):
-                with open(self.settings_file, 'r') as f:
-                    settings = json.load(f)
-                    # Merge with defaults to ensure all keys exist
-                    default_settings.update(settings)
-            return default_settings
-        except Exception as e:
-            print(f"Error loading settings: {e}")
-            return default_settings
+        return load_settings(self.settings_file)
     
     def save_settings(self):
         """Save settings to file"""
@@ -0,0 +1,344 @@
+"""
+Video Display Pipeline
+capture -> process -> render with drop-to-latest hand-offs
+"""
+import asyncio
+import logging
+import threading
+import time
+import tkinter as tk
+from collections import deque
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+from ..webrtc.buffer_pool import FrameBufferPool
+
+logger = logging.getLogger(__name__)
+
+def interpolation_for(source_size, target_size):
+    """INTER_AREA for whole-number downscales (its fast path), INTER_LINEAR otherwise"""
+    (source_width, source_height), (target_width, target_height) = source_size, target_size
+    if source_width % target_width == 0 and source_height % target_height == 0:
+        return cv2.INTER_AREA
+    return cv2.INTER_LINEAR
+
+class LatestFrame:
+    """Single-slot mailbox between two pipeline stages
+
+    ``put`` replaces a frame nobody has taken yet, so a slow consumer
+    always gets the newest frame and never a backlog. ``on_discard`` is
+    called with each replaced item so its buffer can be recycled.
+    """
+
+    def __init__(self, on_discard=None):
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.item = None
+        self.on_discard = on_discard
+        self.dropped = 0
+
+    def put(self, frame, captured_at, buffer=None):
+        with self.lock:
+            replaced = self.item
+            self.item = (frame, captured_at, buffer)
+            self.ready.set()
+        if replaced is not None:
+            self.dropped += 1
+            if self.on_discard:
+                self.on_discard(replaced)
+
+    def take(self):
+        """The waiting (frame, captured_at, buffer), or None"""
+        with self.lock:
+            item, self.item = self.item, None
+            self.ready.clear()
+        return item
+
+    def wait(self, timeout=None):
+        """Block until a frame is waiting"""
+        return self.ready.wait(timeout)
+
+class FrameStats:
+    """Displayed frames per second and capture-to-display latency"""
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.samples = deque()
+
+    def record(self, now, captured_at):
+        self.samples.append((now, now - captured_at))
+        while self.samples and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+
+    @property
+    def fps(self):
+        if len(self.samples) < 2:
+            return 0.0
+        span = self.samples[-1][0] - self.samples[0][0]
+        return (len(self.samples) - 1) / span if span > 0 else 0.0
+
+    @property
+    def latency_ms(self):
+        if not self.samples:
+            return 0.0
+        return 1000 * sum(latency for _, latency in self.samples) / len(self.samples)
+
+class VideoPipeline:
+    """Shows a video stream in a Tk label without blocking or racing the UI
+
+    A capture thread reads frames from ``source`` (a callable returning
+    ``(ok, frame)`` like ``cv2.VideoCapture.read``), or frames are pushed
+    with ``submit``. A process thread scales, mirrors and converts the
+    latest one into a pooled RGB buffer of ``size``, and the Tk thread
+    pastes it into a single reused PhotoImage from ``root.after`` at up to
+    ``fps``. Each hand-off is a ``LatestFrame``, so when any stage falls
+    behind old frames are dropped rather than queued. With ``overlay`` the
+    measured FPS, capture-to-display latency and dropped frames are shown
+    in a corner.
+
+    Frames may be BGR/gray arrays or PyAV ``VideoFrame``s from an aiortc
+    track (see ``consume``); for the latter the YUV planes are scaled to
+    display size first, so the RGB conversion only touches display
+    pixels. With ``fit`` the display size follows the label, keeping the
+    frame's aspect ratio.
+    """
+
+    def __init__(self, label: tk.Label, source=None, size=(160, 120), mirror=False,
+                 fps=30, overlay=True, bgr=True, fit=False):
+        self.label = label
+        self.source = source
+        self.size = size
+        self.fit = fit
+        self.mirror = mirror
+        self.bgr = bgr
+        self.period = 1.0 / fps
+        self.pool = FrameBufferPool()
+        self.captured = LatestFrame()
+        self.processed = LatestFrame(on_discard=lambda item: self.pool.release(item[2]))
+        self.stats = FrameStats()
+        self.photo = None
+        self.paused = False
+        self.running = False
+        self.threads = []
+        self.after_id = None
+        self.next_due = 0.0
+        self.overlay = None
+        if overlay:
+            self.overlay = tk.Label(label, bg="#000000", fg="#00ff00", font=('Courier', 8))
+            self.overlay.place(relx=1.0, rely=1.0, anchor="se")
+        self.overlay_due = 0.0
+        self.rendered = 0
+        # Scratch images for the process thread, reallocated if the input size changes
+        self._scaled = None
+        self._mirrored = None
+        self._i420 = None
+
+    def start(self):
+        """Start the capture/process threads and the render timer"""
+        self.running = True
+        if self.source is not None:
+            self.threads.append(threading.Thread(target=self.capture_loop, daemon=True))
+        self.threads.append(threading.Thread(target=self.process_loop, daemon=True))
+        for thread in self.threads:
+            thread.start()
+        self.next_due = time.perf_counter()
+        self.after_id = self.label.after(0, self.render)
+
+    def stop(self):
+        """Stop all stages (call from the Tk thread)"""
+        self.running = False
+        if self.after_id is not None:
+            self.label.after_cancel(self.after_id)
+            self.after_id = None
+        self.captured.ready.set()  # Wake the process thread
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+        self.threads.clear()
+        self.pool.clear()
+
+    def submit(self, frame, captured_at=None):
+        """Hand the pipeline a frame from another thread"""
+        self.captured.put(frame, captured_at or time.perf_counter())
+
+    async def consume(self, track):
+        """Feed frames from an aiortc video track until it ends
+
+        Runs on the asyncio loop but only awaits ``recv`` and hands the
+        frame over; all pixel work happens on the process thread.
+        """
+        try:
+            while self.running:
+                frame = await track.recv()
+                self.submit(frame)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.info(f"Remote video ended: {e}")
+
+    def capture_loop(self):
+        """Read frames as fast as the source delivers them"""
+        while self.running:
+            try:
+                ok, frame = self.source()
+            except Exception as e:
+                logger.error(f"Video capture failed: {e}")
+                break
+            if not ok:
+                time.sleep(self.period)
+                continue
+            self.captured.put(frame, time.perf_counter())
+
+    def process_loop(self):
+        """Scale, mirror and convert the latest captured frame"""
+        while self.running:
+            if not self.captured.wait(timeout=0.5):
+                continue
+            item = self.captured.take()
+            if item is None or self.paused:
+                continue
+            frame, captured_at, _ = item
+            try:
+                rgb, buffer = self.process(frame)
+            except Exception as e:
+                logger.error(f"Video processing failed: {e}")
+                continue
+            self.processed.put(rgb, captured_at, buffer)
+
+    def display_size(self, frame_width, frame_height):
+        """Output size for a frame: ``size``, or the largest fit inside it with ``fit``"""
+        width, height = self.size
+        if self.fit:
+            scale = min(width / frame_width, height / frame_height)
+            width = max(2, int(frame_width * scale) & ~1)
+            height = max(2, int(frame_height * scale) & ~1)
+        return width, height
+
+    def scale_yuv420(self, frame, width, height):
+        """Scale the Y, U and V planes of a yuv420p frame into one display-size I420 image"""
+        shape = (height * 3 // 2, width)
+        if self._i420 is None or self._i420.shape != shape:
+            self._i420 = np.empty(shape, np.uint8)
+        flat = self._i420.reshape(-1)
+        luma = width * height
+        chroma = luma // 4
+        targets = (flat[:luma].reshape(height, width),
+                   flat[luma:luma + chroma].reshape(height // 2, width // 2),
+                   flat[luma + chroma:].reshape(height // 2, width // 2))
+        for plane, target in zip(frame.planes, targets):
+            # Read the decoder's buffer in place; rows may be padded to line_size
+            rows = np.frombuffer(plane, np.uint8, count=plane.height * plane.line_size)
+            rows = rows.reshape(plane.height, plane.line_size)[:, :plane.width]
+            size = (target.shape[1], target.shape[0])
+            cv2.resize(rows, size, dst=target,
+                       interpolation=interpolation_for((plane.width, plane.height), size))
+        return self._i420
+
+    def process(self, frame):
+        """Frame -> display-size RGB array in a pooled buffer"""
+        if hasattr(frame, "to_ndarray"):
+            # PyAV frame from a track: convert to RGB only after scaling to display size
+            width, height = self.display_size(frame.width, frame.height)
+            if frame.format.name == "yuv420p":
+                image = self.scale_yuv420(frame, width, height)
+                conversion = cv2.COLOR_YUV2RGB_I420
+            else:
+                image = frame.to_ndarray(width=width, height=height, format="rgb24")
+                conversion = None
+        else:
+            width, height = self.display_size(frame.shape[1], frame.shape[0])
+            shape = (height, width) + frame.shape[2:]
+            if self._scaled is None or self._scaled.shape != shape:
+                self._scaled = np.empty(shape, np.uint8)
+                self._mirrored = np.empty_like(self._scaled)
+            # Scale first so the per-pixel work below runs on the small image
+            cv2.resize(frame, (width, height), dst=self._scaled,
+                       interpolation=interpolation_for((frame.shape[1], frame.shape[0]),
+                                                       (width, height)))
+            image = self._scaled
+            if image.ndim == 2:
+                conversion = cv2.COLOR_GRAY2RGB
+            else:
+                conversion = cv2.COLOR_BGR2RGB if self.bgr else None
+
+        buffer = self.pool.acquire(width * height * 3)
+        rgb = np.frombuffer(buffer, np.uint8).reshape(height, width, 3)
+        if conversion is None:
+            if self.mirror:
+                cv2.flip(image, 1, dst=rgb)
+            else:
+                rgb[...] = image
+        elif conversion == cv2.COLOR_YUV2RGB_I420:
+            # Planar image: mirror after converting
+            cv2.cvtColor(image, conversion, dst=rgb)
+            if self.mirror:
+                rgb[...] = rgb[:, ::-1]
+        else:
+            if self.mirror:
+                cv2.flip(image, 1, dst=self._mirrored)
+                image = self._mirrored
+            cv2.cvtColor(image, conversion, dst=rgb)
+        return rgb, buffer
+
+    def render(self):
+        """Tk thread: show the newest processed frame and reschedule"""
+        self.after_id = None
+        if not self.running:
+            return
+        item = self.processed.take()
+        if item is not None:
+            frame, captured_at, buffer = item
+            if not self.paused:
+                self.show(frame)
+                self.rendered += 1
+                self.stats.record(time.perf_counter(), captured_at)
+            self.pool.release(buffer)
+
+        now = time.perf_counter()
+        if now >= self.overlay_due:
+            self.overlay_due = now + 0.5
+            if self.fit:
+                width, height = self.label.winfo_width(), self.label.winfo_height()
+                if width > 1 and height > 1:
+                    self.size = (width, height)
+            if self.overlay is not None:
+                text = f"{self.stats.fps:.0f} fps {self.stats.latency_ms:.0f} ms"
+                if self.dropped:
+                    text += f" {self.dropped} dropped"
+                self.overlay.configure(text=text)
+        # Pace by deadline so render time does not stretch the period
+        self.next_due = max(self.next_due + self.period, now)
+        delay = int(1000 * (self.next_due - now))
+        self.after_id = self.label.after(delay, self.render)
+
+    @property
+    def dropped(self):
+        """Frames replaced before the next stage took them"""
+        return self.captured.dropped + self.processed.dropped
+
+    def stats_summary(self):
+        """Render FPS, latency and frame counters"""
+        return {
+            "fps": self.stats.fps,
+            "latency_ms": self.stats.latency_ms,
+            "rendered": self.rendered,
+            "dropped": self.dropped,
+        }
+
+    def show(self, frame):
+        image = Image.fromarray(frame)
+        if self.photo is None or (self.photo.width(), self.photo.height()) != image.size:
+            self.photo = ImageTk.PhotoImage(image)
+            self.label.configure(image=self.photo, text="")
+        else:
+            self.photo.paste(image)
+
+    def pause(self, text=""):
+        """Stop updating the label and show `text` instead"""
+        self.paused = True
+        self.label.configure(image="", text=text)
+
+    def resume(self):
+        self.paused = False
+        if self.photo is not None:
+            self.label.configure(image=self.photo, text="")
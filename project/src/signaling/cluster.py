@@ -0,0 +1,91 @@
+"""
+Sharded Signaling Server
+Runs several SignalingServer worker processes on one port (SO_REUSEPORT)
+joined by a RoutingHub
+"""
+import asyncio
+import logging
+import multiprocessing
+import socket
+import tempfile
+
+from .routing import RoutingHub, SocketRoutingBackend, default_hub_address
+from .websocket_server import SignalingServer
+
+logger = logging.getLogger(__name__)
+
+def run_worker(host: str, port: int, hub_address, worker_id: int, log_level: int,
+               server_options: dict):
+    """Worker process entry point"""
+    logging.basicConfig(level=log_level,
+                        format=f'%(asctime)s - worker {worker_id} - %(levelname)s - %(message)s')
+    backend = SocketRoutingBackend(hub_address, worker_id)
+    server_options = dict(server_options)
+    if server_options.get("metrics_port"):
+        # Each worker serves its own metrics, on consecutive ports
+        server_options["metrics_port"] += worker_id
+    server = SignalingServer(host, port, backend=backend, reuse_port=True, **server_options)
+    try:
+        asyncio.run(server.start())
+    except KeyboardInterrupt:
+        pass
+
+class SignalingCluster:
+    """N signaling worker processes sharing one listening port
+
+    The kernel spreads incoming connections across the workers through
+    SO_REUSEPORT. The parent process runs the RoutingHub on a local socket,
+    so users connected to different workers still see each other and can
+    call each other. ``server_options`` are passed on to each worker's
+    SignalingServer; with ``metrics_port`` set, worker N serves its metrics
+    on ``metrics_port + N``.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 8765, workers: int = None,
+                 hub_address=None, **server_options):
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise RuntimeError("SO_REUSEPORT is not supported on this platform")
+        self.host = host
+        self.port = port
+        self.workers = workers or multiprocessing.cpu_count()
+        self._tempdir = None
+        if hub_address is None:
+            self._tempdir = tempfile.TemporaryDirectory(prefix="signaling-")
+            hub_address = default_hub_address(self._tempdir.name, port + 1)
+        self.hub_address = hub_address
+        self.server_options = server_options
+        self.hub = RoutingHub(hub_address)
+        self.processes = []
+
+    async def start(self):
+        """Start the hub and the workers, then run until cancelled"""
+        await self.hub.start()
+        context = multiprocessing.get_context("spawn")
+        log_level = logging.getLogger().getEffectiveLevel()
+        for worker_id in range(self.workers):
+            process = context.Process(
+                target=run_worker,
+                args=(self.host, self.port, self.hub_address, worker_id, log_level,
+                      self.server_options),
+                name=f"signaling-worker-{worker_id}",
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+        logger.info(f"Started {self.workers} signaling workers on {self.host}:{self.port}")
+        try:
+            await asyncio.Future()  # Run forever
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        """Terminate the workers and close the hub"""
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join(timeout=5)
+        self.processes.clear()
+        await self.hub.stop()
+        if self._tempdir:
+            self._tempdir.cleanup()
+            self._tempdir = None
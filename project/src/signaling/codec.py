@@ -0,0 +1,126 @@
+"""
+Signaling Message Codecs
+stdlib JSON always; orjson and msgpack when installed
+
+Routed messages may also travel as an envelope: a binary frame holding a
+small JSON routing header (type, from, to, codec) followed by the message
+body encoded with the sender's codec. The relay reads only the header.
+"""
+import json
+import struct
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+def json_loads(data):
+    """Parse JSON text or UTF-8 bytes with the fastest parser available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return json.loads(data)
+
+class JsonCodec:
+    """stdlib JSON in text frames (the default every peer understands)"""
+
+    name = "json"
+    binary = False
+
+    def encode(self, message):
+        return json.dumps(message)
+
+    def decode(self, data):
+        return json_loads(data)
+
+class OrjsonCodec:
+    """orjson-encoded JSON in binary frames"""
+
+    name = "orjson"
+    binary = True
+
+    def encode(self, message):
+        return orjson.dumps(message)
+
+    def decode(self, data):
+        return orjson.loads(data)
+
+class MsgpackCodec:
+    """MessagePack in binary frames"""
+
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message):
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+JSON = JsonCodec()
+
+CODECS = {JSON.name: JSON}
+if orjson is not None:
+    CODECS[OrjsonCodec.name] = OrjsonCodec()
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+# Most preferred first
+PREFERENCE = ("orjson", "msgpack", "json")
+
+def available_codecs():
+    """Names of the installed codecs, most preferred first"""
+    return [name for name in PREFERENCE if name in CODECS]
+
+def get_codec(name):
+    """Codec by name, falling back to stdlib JSON"""
+    return CODECS.get(name, JSON)
+
+def negotiate(offered):
+    """First codec in the peer's preference list that is installed here"""
+    for name in offered or ():
+        if name in CODECS:
+            return CODECS[name]
+    return JSON
+
+def decode_frame(frame, codec):
+    """Decode a websocket frame: text frames are always JSON, envelopes name
+    their codec, other binary frames use `codec`"""
+    if isinstance(frame, str):
+        return json_loads(frame)
+    if is_envelope(frame):
+        return decode_envelope(frame)
+    return codec.decode(frame)
+
+ENVELOPE_MAGIC = 0xE5
+ENVELOPE_PREFIX = struct.Struct(">BH")
+
+def is_envelope(frame):
+    """True for an envelope frame (binary, starting with the magic byte)"""
+    return not isinstance(frame, str) and len(frame) > ENVELOPE_PREFIX.size \
+        and frame[0] == ENVELOPE_MAGIC
+
+def pack_envelope(header, body):
+    """Build an envelope from a routing header and an encoded body"""
+    if isinstance(body, str):
+        body = body.encode()
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    return b"".join((ENVELOPE_PREFIX.pack(ENVELOPE_MAGIC, len(encoded)), encoded, body))
+
+def unpack_envelope(frame):
+    """Split an envelope into (header, body) without decoding the body"""
+    view = memoryview(frame)
+    _, length = ENVELOPE_PREFIX.unpack_from(view)
+    start = ENVELOPE_PREFIX.size + length
+    return json_loads(bytes(view[ENVELOPE_PREFIX.size:start])), view[start:]
+
+def decode_envelope(frame):
+    """Decode the message carried in an envelope"""
+    header, body = unpack_envelope(frame)
+    return get_codec(header.get("codec")).decode(body)
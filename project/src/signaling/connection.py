@@ -0,0 +1,144 @@
+"""
+Signaling Client Connection
+Bounded per-connection send queue drained by its own writer task
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+import websockets
+
+from .codec import JSON
+
+logger = logging.getLogger(__name__)
+
+class ClientConnection:
+    """Outbound side of one signaling client
+
+    ``send`` only enqueues, so a broadcast never waits on a slow socket;
+    the writer task drains the queue in order. When the queue reaches
+    ``max_queue`` messages the slow-consumer policy applies:
+
+    - ``"snapshot"``: queued presence messages are discarded and the
+      client gets one fresh user list (from ``snapshot()``) once it catches
+      up; presence updates are skipped until then. If the queue is still
+      full of other messages the client is disconnected.
+    - ``"disconnect"``: the client is disconnected.
+
+    ``codec`` is the wire format negotiated at register; payloads are
+    queued already encoded with it. ``envelope`` is True if the client
+    accepts routed messages as envelopes. With ``metrics`` set, routed
+    messages queued with ``received_at`` feed the forward latency histogram.
+    """
+
+    SNAPSHOT = "snapshot"
+    DISCONNECT = "disconnect"
+    POLICIES = (SNAPSHOT, DISCONNECT)
+
+    def __init__(self, websocket, user_id, snapshot=None, max_queue=256, policy=SNAPSHOT,
+                 codec=JSON, envelope=False, metrics=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.websocket = websocket
+        self.user_id = user_id
+        self.snapshot = snapshot
+        self.codec = codec
+        self.envelope = envelope
+        self.metrics = metrics
+        self.max_queue = max_queue
+        self.policy = policy
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.needs_snapshot = False
+        self.closing = False
+        self.slow = False
+        self.max_depth = 0
+        self.sent = 0
+        self.dropped = 0
+        self.snapshots = 0
+        self.task = asyncio.ensure_future(self.run())
+
+    @property
+    def depth(self):
+        """Messages waiting to be written"""
+        return len(self.queue)
+
+    def send(self, payload, presence=False, received_at=None):
+        """Queue a payload without waiting, False if it was dropped"""
+        if self.closing:
+            return False
+        if len(self.queue) >= self.max_queue and not self.shed_load():
+            self.dropped += 1
+            return False
+        if presence and self.needs_snapshot:
+            self.dropped += 1
+            return False
+
+        self.queue.append((payload, presence, received_at))
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self.ready.set()
+        return True
+
+    def shed_load(self):
+        """Apply the slow-consumer policy to a full queue, True if there is room now"""
+        if self.policy == self.SNAPSHOT and self.snapshot is not None:
+            kept = deque(item for item in self.queue if not item[1])
+            self.dropped += len(self.queue) - len(kept)
+            self.queue = kept
+            self.needs_snapshot = True
+            self.ready.set()
+            if len(self.queue) < self.max_queue:
+                return True
+        logger.warning(f"Disconnecting slow client {self.user_id} ({len(self.queue)} queued)")
+        self.slow = True
+        self.close(code=1013, reason="Send queue full")
+        return False
+
+    async def run(self):
+        """Write queued payloads to the socket in order"""
+        try:
+            while True:
+                while not self.queue and not self.needs_snapshot:
+                    self.ready.clear()
+                    await self.ready.wait()
+                if self.needs_snapshot:
+                    # Presence caught up in one message, at the current version
+                    self.needs_snapshot = False
+                    self.snapshots += 1
+                    payload = self.snapshot(self.codec)
+                    received_at = None
+                else:
+                    payload, _, received_at = self.queue.popleft()
+                await self.websocket.send(payload)
+                self.sent += 1
+                if received_at is not None and self.metrics is not None:
+                    self.metrics.observe("forward_latency_seconds",
+                                         time.perf_counter() - received_at)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Error writing to {self.user_id}: {e}")
+        finally:
+            self.queue.clear()
+
+    def close(self, code=1000, reason=""):
+        """Stop writing and close the socket; the read loop then unregisters the client"""
+        if self.closing:
+            return
+        self.closing = True
+        self.queue.clear()
+        self.task.cancel()
+        asyncio.ensure_future(self.websocket.close(code=code, reason=reason))
+
+    def stats(self):
+        """Queue depth and drop counters"""
+        return {
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "snapshots": self.snapshots,
+        }
@@ -0,0 +1,135 @@
+"""
+Signaling Callback Dispatch
+Runs event handlers off the receive loop, in order within each lane
+"""
+import asyncio
+import inspect
+import logging
+import time
+from collections import defaultdict, deque
+from typing import Callable, Dict, Hashable, List
+
+logger = logging.getLogger(__name__)
+
+class HandlerStats:
+    """Run time and queueing delay of one event's handlers"""
+
+    def __init__(self, window: int = 256):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.max_wait = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record(self, elapsed: float, wait: float):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.max_wait = max(self.max_wait, wait)
+        self.recent.append(elapsed)
+
+    def summary(self):
+        recent = sorted(self.recent)
+        p99 = recent[min(len(recent) - 1, int(0.99 * len(recent)))] if recent else 0.0
+        return {
+            "count": self.count,
+            "mean_ms": 1000 * self.total / self.count if self.count else 0.0,
+            "p99_ms": 1000 * p99,
+            "max_ms": 1000 * self.max,
+            "max_wait_ms": 1000 * self.max_wait,
+        }
+
+class CallbackDispatcher:
+    """Event handlers run as tasks, one lane at a time
+
+    ``dispatch`` only queues, so a slow handler never holds up reading the
+    socket. Events in the same lane are handled in arrival order; lanes run
+    concurrently. Several handlers may be registered for an event, and they
+    run in registration order. Handlers may be plain functions or
+    coroutines; one that takes longer than ``slow_threshold`` seconds is
+    logged, and ``stats()`` reports run time per event.
+    """
+
+    def __init__(self, slow_threshold: float = 0.1):
+        self.handlers: Dict[str, List[Callable]] = defaultdict(list)
+        self.lanes: Dict[Hashable, deque] = {}
+        self.tasks: Dict[Hashable, asyncio.Task] = {}
+        self.latency: Dict[str, HandlerStats] = defaultdict(HandlerStats)
+        self.slow_threshold = slow_threshold
+
+    def on(self, event: str, callback: Callable):
+        """Add a handler for an event"""
+        self.handlers[event].append(callback)
+
+    def off(self, event: str, callback: Callable = None):
+        """Remove one handler, or every handler for the event"""
+        if callback is None:
+            self.handlers.pop(event, None)
+        elif callback in self.handlers.get(event, ()):
+            self.handlers[event].remove(callback)
+
+    def has(self, event: str) -> bool:
+        return bool(self.handlers.get(event))
+
+    def dispatch(self, event: str, data: dict, lane: Hashable = None):
+        """Queue an event for its handlers (default lane: the event), False if it has none"""
+        if not self.handlers.get(event):
+            return False
+        lane = event if lane is None else lane
+        queue = self.lanes.get(lane)
+        if queue is None:
+            queue = self.lanes[lane] = deque()
+            self.tasks[lane] = asyncio.ensure_future(self.drain(lane, queue))
+        queue.append((event, data, time.perf_counter()))
+        return True
+
+    async def drain(self, lane: Hashable, queue: deque):
+        """Run a lane's events in order, then retire the lane"""
+        try:
+            while queue:
+                event, data, queued_at = queue.popleft()
+                for callback in list(self.handlers.get(event, ())):
+                    await self.run(event, callback, data, queued_at)
+        finally:
+            if self.lanes.get(lane) is queue:
+                del self.lanes[lane]
+                del self.tasks[lane]
+
+    async def run(self, event: str, callback: Callable, data: dict, queued_at: float):
+        started = time.perf_counter()
+        try:
+            result = callback(data)
+            if inspect.isawaitable(result):
+                await result
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in {event} handler {getattr(callback, '__name__', callback)}: {e}")
+        elapsed = time.perf_counter() - started
+        self.latency[event].record(elapsed, started - queued_at)
+        if elapsed > self.slow_threshold:
+            logger.warning(f"Slow {event} handler {getattr(callback, '__name__', callback)}: "
+                           f"{1000 * elapsed:.0f} ms")
+
+    def pending(self) -> int:
+        """Events queued but not yet handled"""
+        return sum(len(queue) for queue in self.lanes.values())
+
+    async def join(self):
+        """Wait until every queued event has been handled"""
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks.values()), return_exceptions=True)
+
+    def close(self):
+        """Drop queued events and cancel running handlers (except the caller's own)"""
+        current = asyncio.current_task()
+        for lane, task in self.tasks.items():
+            self.lanes[lane].clear()
+            if task is not current:
+                task.cancel()
+        self.lanes.clear()
+        self.tasks.clear()
+
+    def stats(self):
+        """Handler latency per event"""
+        return {event: stats.summary() for event, stats in sorted(self.latency.items())}
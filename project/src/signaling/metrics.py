@@ -0,0 +1,171 @@
+"""
+Signaling Server Metrics
+Counters, gauges and histograms in the Prometheus text format, served over
+HTTP and/or dumped to the log
+"""
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+def format_labels(labels):
+    """Render a sorted label tuple as {name="value",...}"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+class Histogram:
+    """Cumulative-bucket histogram"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+class Metrics:
+    """Metric registry for one signaling server process
+
+    The server only creates one when metrics are enabled and guards every
+    hot-path call with ``if self.metrics is not None``, so disabled metrics
+    cost a single attribute check. Gauges, and counters kept elsewhere, can
+    be registered as callables evaluated at scrape time. ``start`` also
+    runs an event-loop lag probe, an HTTP ``/metrics`` endpoint on ``port``
+    and a log dump every ``log_interval`` seconds, when those are set.
+    """
+
+    def __init__(self, namespace="signaling", host="localhost", port=None, log_interval=None,
+                 lag_interval=0.25):
+        self.namespace = namespace
+        self.host = host
+        self.port = port
+        self.log_interval = log_interval
+        self.lag_interval = lag_interval
+        self.counters = defaultdict(int)
+        self.histograms = {}
+        self.readers = {}
+        self.help = {}
+        self.server = None
+        self.tasks = []
+
+    def describe(self, name, kind, text):
+        """Set HELP/TYPE for a metric"""
+        self.help[name] = (kind, text)
+
+    def inc(self, name, value=1, **labels):
+        """Add to a counter"""
+        self.counters[name, tuple(sorted(labels.items()))] += value
+
+    def observe(self, name, value):
+        """Record a value in a histogram"""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name, func, text=""):
+        """Register a gauge read from func() at scrape time"""
+        self.readers[name] = func
+        self.describe(name, "gauge", text)
+
+    def counter(self, name, func, text=""):
+        """Register a counter read from func() at scrape time (it must never decrease)"""
+        self.readers[name] = func
+        self.describe(name, "counter", text)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        by_name = defaultdict(list)
+        for (name, labels), value in sorted(self.counters.items()):
+            by_name[name].append(f"{self.namespace}_{name}{format_labels(labels)} {value}")
+        for name, func in sorted(self.readers.items()):
+            try:
+                by_name[name].append(f"{self.namespace}_{name} {func()}")
+            except Exception as e:
+                logger.error(f"Error reading metric {name}: {e}")
+        for name, histogram in sorted(self.histograms.items()):
+            by_name[name].extend(histogram.render(f"{self.namespace}_{name}"))
+
+        for name, samples in by_name.items():
+            kind, text = self.help.get(name, ("untyped", ""))
+            if text:
+                lines.append(f"# HELP {self.namespace}_{name} {text}")
+            lines.append(f"# TYPE {self.namespace}_{name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    async def start(self):
+        """Start the lag probe, HTTP endpoint and log dump as configured"""
+        self.tasks.append(asyncio.ensure_future(self.probe_loop_lag()))
+        if self.log_interval:
+            self.tasks.append(asyncio.ensure_future(self.log_periodically()))
+        if self.port:
+            self.server = await asyncio.start_server(self.handle_http, self.host, self.port)
+            logger.info(f"Metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks.clear()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def probe_loop_lag(self):
+        """Measure how late the event loop wakes a sleeping task"""
+        self.describe("event_loop_lag_seconds", "histogram", "Event loop scheduling delay")
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            self.observe("event_loop_lag_seconds",
+                         max(0.0, time.perf_counter() - start - self.lag_interval))
+
+    async def log_periodically(self):
+        while True:
+            await asyncio.sleep(self.log_interval)
+            logger.info("Metrics:\n" + self.render())
+
+    async def handle_http(self, reader, writer):
+        """Minimal HTTP/1.0 responder for GET /metrics"""
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass  # skip headers
+            parts = request.decode(errors="replace").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                body = self.render().encode()
+                status = "200 OK"
+            else:
+                body = b"Not found\n"
+                status = "404 Not Found"
+            writer.write(f"HTTP/1.0 {status}\r\n"
+                         f"Content-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+        except Exception as e:
+            logger.error(f"Error serving metrics: {e}")
+        finally:
+            writer.close()
@@ -0,0 +1,288 @@
+"""
+Signaling Routing Backends
+Presence directory and message routing between signaling server workers
+"""
+import asyncio
+import json
+import logging
+import socket
+import struct
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Frames between workers and the hub: lengths of a JSON header and an opaque payload
+FRAME_PREFIX = struct.Struct(">II")
+
+async def read_frame(reader: asyncio.StreamReader):
+    """Read one (header, payload) frame"""
+    header_length, payload_length = FRAME_PREFIX.unpack(
+        await reader.readexactly(FRAME_PREFIX.size)
+    )
+    header = json.loads(await reader.readexactly(header_length))
+    payload = await reader.readexactly(payload_length) if payload_length else b""
+    return header, payload
+
+def write_frame(writer: asyncio.StreamWriter, header: dict, payload: bytes = b""):
+    """Queue one (header, payload) frame on a stream"""
+    encoded = json.dumps(header).encode()
+    writer.write(FRAME_PREFIX.pack(len(encoded), len(payload)) + encoded + payload)
+
+async def open_connection(address):
+    """Connect to a hub at a Unix socket path or a (host, port) pair"""
+    if isinstance(address, str):
+        return await asyncio.open_unix_connection(address)
+    return await asyncio.open_connection(*address)
+
+async def start_server(callback, address):
+    """Listen on a Unix socket path or a (host, port) pair"""
+    if isinstance(address, str):
+        return await asyncio.start_unix_server(callback, address)
+    return await asyncio.start_server(callback, *address)
+
+def default_hub_address(directory: str, port: int):
+    """Unix socket in `directory` where available, else a loopback TCP port"""
+    if hasattr(socket, "AF_UNIX"):
+        return f"{directory}/signaling-hub.sock"
+    return ("127.0.0.1", port)
+
+class RoutingBackend(ABC):
+    """Presence directory and cross-worker delivery for a SignalingServer
+
+    The server calls ``register``/``unregister`` for its own clients and
+    ``route(header, payload)`` for messages to users it does not hold, where
+    ``header`` carries type, from, to and the payload's codec. The backend
+    calls ``deliver(header, payload)`` for messages routed to this worker's
+    clients and ``presence_changed()`` whenever the set of online users
+    may have changed, on any worker; the server diffs ``users()`` itself.
+    ``wait_closed`` returns once the backend can no longer route, which
+    ends the server.
+    """
+
+    def __init__(self):
+        self.deliver: Optional[Callable[[dict, bytes], Awaitable[None]]] = None
+        self.presence_changed: Optional[Callable[[], Awaitable[None]]] = None
+        self.closed = None
+
+    async def start(self, deliver, presence_changed):
+        """Attach the server callbacks"""
+        self.deliver = deliver
+        self.presence_changed = presence_changed
+        self.closed = asyncio.Event()
+
+    async def wait_closed(self):
+        """Wait until the backend shuts down"""
+        await self.closed.wait()
+
+    async def stop(self):
+        """Release backend resources"""
+
+    @abstractmethod
+    async def register(self, user_id: str):
+        """Announce a user connected to this worker"""
+
+    @abstractmethod
+    async def unregister(self, user_id: str):
+        """Announce a user left this worker"""
+
+    @abstractmethod
+    async def route(self, header: dict, payload: bytes) -> bool:
+        """Send a payload to a user on another worker, False if unknown"""
+
+    @abstractmethod
+    def users(self) -> List[str]:
+        """All online users across workers"""
+
+class LocalRoutingBackend(RoutingBackend):
+    """Single-process backend: every user is on this server"""
+
+    def __init__(self):
+        super().__init__()
+        self._users: Dict[str, None] = {}
+
+    async def register(self, user_id: str):
+        self._users[user_id] = None
+        await self.presence_changed()
+
+    async def unregister(self, user_id: str):
+        if self._users.pop(user_id, 0) is None:
+            await self.presence_changed()
+
+    async def route(self, header: dict, payload: bytes) -> bool:
+        return False
+
+    def users(self) -> List[str]:
+        return list(self._users)
+
+class SocketRoutingBackend(RoutingBackend):
+    """Worker side of a RoutingHub reached over a local socket"""
+
+    def __init__(self, address, worker_id: int = 0, connect_attempts: int = 50):
+        super().__init__()
+        self.address = address
+        self.worker_id = worker_id
+        self.connect_attempts = connect_attempts
+        self.directory: Dict[str, None] = {}
+        self.reader = None
+        self.writer = None
+        self.task = None
+
+    async def start(self, deliver, presence_changed):
+        await super().start(deliver, presence_changed)
+        for attempt in range(self.connect_attempts):
+            try:
+                self.reader, self.writer = await open_connection(self.address)
+                break
+            except OSError:
+                if attempt == self.connect_attempts - 1:
+                    raise
+                await asyncio.sleep(0.1)
+        write_frame(self.writer, {"op": "hello", "worker": self.worker_id})
+        await self.writer.drain()
+        self.task = asyncio.create_task(self.receive())
+        logger.info(f"Worker {self.worker_id} connected to routing hub")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+    async def receive(self):
+        """Apply presence updates and deliveries from the hub"""
+        try:
+            while True:
+                header, payload = await read_frame(self.reader)
+                op = header.get("op")
+                if op == "presence":
+                    if "users" in header:
+                        self.directory = dict.fromkeys(header["users"])
+                    for user in header.get("joined", ()):
+                        self.directory[user] = None
+                    for user in header.get("left", ()):
+                        self.directory.pop(user, None)
+                    await self.presence_changed()
+                elif op == "deliver":
+                    await self.deliver(header, payload)
+                else:
+                    logger.warning(f"Unknown hub operation: {op}")
+        except asyncio.IncompleteReadError:
+            logger.error(f"Worker {self.worker_id} lost its routing hub")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error reading from routing hub: {e}")
+        # Without the hub this worker cannot route, so shut it down
+        self.closed.set()
+
+    async def _send(self, header: dict, payload: bytes = b""):
+        if self.writer is None:
+            return
+        write_frame(self.writer, header, payload)
+        await self.writer.drain()
+
+    async def register(self, user_id: str):
+        await self._send({"op": "register", "user": user_id})
+
+    async def unregister(self, user_id: str):
+        await self._send({"op": "unregister", "user": user_id})
+
+    async def route(self, header: dict, payload: bytes) -> bool:
+        if header.get("to") not in self.directory:
+            return False
+        await self._send(dict(header, op="route"), payload)
+        return True
+
+    def users(self) -> List[str]:
+        return list(self.directory)
+
+class RoutingHub:
+    """Presence directory shared by the workers of a sharded signaling server
+
+    Each worker holds one connection. The hub maps users to the worker
+    that registered them, forwards routed payloads to the owning worker
+    untouched. Workers get the full user list when they connect and
+    ``joined``/``left`` deltas after that.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.owners: Dict[str, asyncio.StreamWriter] = {}
+        self.workers: Dict[asyncio.StreamWriter, int] = {}
+        self.server = None
+
+    async def start(self):
+        """Listen for worker connections"""
+        self.server = await start_server(self.handle_worker, self.address)
+        logger.info(f"Routing hub listening on {self.address}")
+
+    async def stop(self):
+        """Close the hub and all worker connections"""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for writer in list(self.workers):
+            writer.close()
+
+    async def handle_worker(self, reader, writer):
+        """Serve one worker connection"""
+        worker_id = None
+        try:
+            while True:
+                header, payload = await read_frame(reader)
+                op = header.get("op")
+                if op == "hello":
+                    worker_id = header.get("worker")
+                    self.workers[writer] = worker_id
+                    write_frame(writer, {"op": "presence", "users": list(self.owners)})
+                elif op == "register":
+                    self.owners[header["user"]] = writer
+                    await self.broadcast_presence(joined=[header["user"]])
+                elif op == "unregister":
+                    if self.owners.get(header["user"]) is writer:
+                        del self.owners[header["user"]]
+                        await self.broadcast_presence(left=[header["user"]])
+                elif op == "route":
+                    self.route(header, payload)
+                else:
+                    logger.warning(f"Unknown worker operation: {op}")
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception as e:
+            logger.error(f"Error handling worker {worker_id}: {e}")
+        finally:
+            self.workers.pop(writer, None)
+            orphaned = [user for user, owner in self.owners.items() if owner is writer]
+            for user in orphaned:
+                del self.owners[user]
+            if orphaned:
+                await self.broadcast_presence(left=orphaned)
+            writer.close()
+            logger.info(f"Worker {worker_id} disconnected from routing hub")
+
+    def route(self, header: dict, payload: bytes):
+        """Pass a payload to the worker holding its recipient"""
+        owner = self.owners.get(header["to"])
+        if owner is not None:
+            write_frame(owner, dict(header, op="deliver"), payload)
+            return
+        sender = self.owners.get(header.get("from"))
+        if sender is not None:
+            error_message = {"type": "error", "message": f"User {header['to']} not found"}
+            write_frame(sender, {"op": "deliver", "type": "error", "to": header["from"],
+                                 "codec": "json"}, json.dumps(error_message).encode())
+
+    async def broadcast_presence(self, joined=(), left=()):
+        """Send a presence delta to every worker"""
+        header = {"op": "presence", "joined": list(joined), "left": list(left)}
+        for writer in list(self.workers):
+            write_frame(writer, header)
+        for writer in list(self.workers):
+            try:
+                await writer.drain()
+            except ConnectionError:
+                self.workers.pop(writer, None)
@@ -0,0 +1,54 @@
+"""
+Resumable Signaling Sessions
+Lets a client that lost its connection pick up where it left off
+"""
+import hmac
+import secrets
+from collections import deque
+
+# Close code for a connection replaced by a newer registration of the same user;
+# clients treat it (like a normal 1000 close) as final and do not reconnect
+CLOSE_REPLACED = 4000
+
+class ResumableSession:
+    """Resume state the server keeps for one registered user
+
+    The client gets ``token`` at register. If its connection drops without
+    a clean close, the session is detached: the user stays registered and
+    routed messages for it are held (the newest ``max_held``) until it
+    registers again with the token, or ``expiry`` fires. Sessions are kept
+    in the memory of the server process that issued the token, so with
+    several workers only a reconnect to the same worker resumes.
+    """
+
+    def __init__(self, user_id: str, max_held: int = 64):
+        self.user_id = user_id
+        self.token = secrets.token_urlsafe(16)
+        self.held = deque(maxlen=max_held)
+        self.dropped = 0
+        self.expiry = None
+
+    @property
+    def detached(self):
+        """True while waiting for the client to come back"""
+        return self.expiry is not None
+
+    def matches(self, token) -> bool:
+        return isinstance(token, str) and hmac.compare_digest(self.token, token)
+
+    def hold(self, header: dict, body, envelope=None):
+        """Keep a routed message for replay, dropping the oldest when full"""
+        if len(self.held) == self.held.maxlen:
+            self.dropped += 1
+        if isinstance(body, memoryview):
+            body = bytes(body)
+        self.held.append((header, body, envelope))
+
+    def attach(self):
+        """Stop the expiry timer and hand over the held messages"""
+        if self.expiry is not None:
+            self.expiry.cancel()
+            self.expiry = None
+        held = list(self.held)
+        self.held.clear()
+        return held
@@ -2,94 +2,326 @@
 WebSocket Signaling Client
 """
 import asyncio
-import json
 import logging
+import random
 import websockets
-from typing import Callable, Optional
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from .codec import JSON, available_codecs, decode_frame, get_codec, pack_envelope
+from .dispatch import CallbackDispatcher
+from .session import CLOSE_REPLACED
 
 logger = logging.getLogger(__name__)
 
+ICE_TYPES = ("ice_candidate", "ice_candidates")
+
+# Server closes that mean "do not come back": a normal close, or a newer
+# registration of the same user taking over
+FINAL_CLOSE_CODES = (1000, CLOSE_REPLACED)
+
 class SignalingClient:
-    """WebSocket-based signaling client"""
+    """WebSocket-based signaling client
+    
+    ``self.users`` tracks who is online: a ``user_list`` snapshot replaces
+    it and each ``presence_delta`` is applied on top. A delta whose version
+    does not follow the last one means something was missed, so it is
+    dropped and a fresh snapshot is requested instead.
+    
+    ``codecs`` (default: every installed codec, fastest first) is offered
+    at register; messages use JSON until the server's ``registered`` reply
+    names the codec it picked. With ``envelope`` (and a server that agrees)
+    messages to another user go out as envelopes so the server can route
+    them without decoding the body.
+    
+    ICE candidates are micro-batched per peer: the first one goes out at
+    once, and any sent within the next ``ice_batch_delay`` seconds follow
+    together in one ``ice_candidates`` message (sooner if
+    ``ice_batch_size`` pile up). Set ``ice_batch_delay`` to 0 to send each
+    candidate on its own. Any other message to the peer flushes its
+    pending candidates first, so per-peer order is unchanged.
+    
+    ``connect`` tries up to ``connect_attempts`` times. Once connected, a
+    dropped connection is retried with exponential backoff (jittered,
+    ``backoff_initial`` doubling up to ``backoff_max`` seconds) until
+    ``disconnect``, and the server's resume token brings back messages
+    sent to us in the meantime. Messages sent while disconnected wait in
+    an outbox of ``outbox_size`` (oldest dropped first) and go out once the
+    server confirms the registration. A normal close from the server, or
+    one because the same user registered elsewhere (``CLOSE_REPLACED``),
+    is final and is not retried. A ``disconnected`` callback, if set, runs
+    when the link drops (with ``final`` set if it will not be retried);
+    ``registered`` runs each time it is back.
     
-    def __init__(self, server_url: str):
+    Callbacks run through a ``CallbackDispatcher``, not on the receive
+    loop: messages from the same peer are handled in order, one at a time,
+    and so are peerless events of the same type, but a slow handler for one
+    peer does not hold up reading or anyone else. ``on`` adds a handler
+    (an event may have several) and ``handler_stats()`` reports their
+    latency.
+    """
+    
+    def __init__(self, server_url: str, codecs: Optional[List[str]] = None,
+                 envelope: bool = True, ice_batch_delay: float = 0.005,
+                 ice_batch_size: int = 32, reconnect: bool = True, connect_attempts: int = 3,
+                 backoff_initial: float = 0.5, backoff_max: float = 30.0,
+                 outbox_size: int = 256):
         self.server_url = server_url
         self.websocket = None
         self.user_id = None
-        self.callbacks = {}
+        self.codecs = codecs if codecs is not None else available_codecs()
+        self.codec = JSON
+        self.offer_envelope = envelope
+        self.envelope = False
+        self.dispatcher = CallbackDispatcher()
+        self.users: Dict[str, None] = {}
+        self.presence_version = None
+        self.ice_batch_delay = ice_batch_delay
+        self.ice_batch_size = ice_batch_size
+        self.pending_candidates: Dict[str, list] = {}
+        self.candidate_flushes: Dict[str, asyncio.Task] = {}
+        self.auto_reconnect = reconnect
+        self.connect_attempts = connect_attempts
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.resume_token = None
+        self.registered = False
+        self.outbox = deque()
+        self.outbox_size = outbox_size
+        self.outbox_dropped = 0
+        self.handler_task = None
         self.running = False
     
     def on(self, event: str, callback: Callable):
-        """Register event callback"""
-        self.callbacks[event] = callback
+        """Register event callback (in addition to any already registered)"""
+        self.dispatcher.on(event, callback)
+    
+    def off(self, event: str, callback: Optional[Callable] = None):
+        """Remove an event callback, or all of them"""
+        self.dispatcher.off(event, callback)
+    
+    def dispatch(self, event: str, data: dict):
+        """Queue an event for its callbacks, in the lane of the peer it came from"""
+        peer = data.get("from")
+        return self.dispatcher.dispatch(event, data, lane=("peer", peer) if peer else ("event", event))
+    
+    def handler_stats(self):
+        """Callback run time per event"""
+        return self.dispatcher.stats()
     
     async def connect(self, user_id: str):
         """Connect to signaling server"""
+        self.user_id = user_id
+        self.resume_token = None
+        self.running = True
         try:
-            self.websocket = await websockets.connect(self.server_url)
-            self.user_id = user_id
-            self.running = True
-            
-            # Register with server
-            await self.send_message({
-                "type": "register",
-                "user_id": user_id
-            })
-            
-            # Start message handler
-            asyncio.create_task(self.message_handler())
-            
-            logger.info(f"Connected to signaling server as {user_id}")
-            
+            await self.open_with_backoff(self.connect_attempts)
         except Exception as e:
+            self.running = False
             logger.error(f"Failed to connect to signaling server: {e}")
             raise
+        
+        # Start message handler
+        self.handler_task = asyncio.create_task(self.message_handler())
+        logger.info(f"Connected to signaling server as {user_id}")
+    
+    async def open(self):
+        """Open the websocket and register, resuming our session if we have one"""
+        self.registered = False
+        self.codec = JSON
+        self.envelope = False
+        self.websocket = await websockets.connect(self.server_url)
+        register = {
+            "type": "register",
+            "user_id": self.user_id,
+            "codecs": self.codecs,
+            "envelope": self.offer_envelope
+        }
+        if self.resume_token:
+            register["resume"] = self.resume_token
+        await self.websocket.send(JSON.encode(register))
+    
+    async def open_with_backoff(self, attempts: Optional[int] = None) -> bool:
+        """Retry open() with exponential backoff, False if disconnect() was called meanwhile"""
+        delay = self.backoff_initial
+        attempt = 0
+        while self.running:
+            attempt += 1
+            try:
+                await self.open()
+                return True
+            except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+                if attempts is not None and attempt >= attempts:
+                    raise
+                wait = random.uniform(delay / 2, delay)
+                logger.warning(f"Signaling connection attempt {attempt} failed ({e}), "
+                               f"retrying in {wait:.1f}s")
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, self.backoff_max)
+        return False
     
     async def disconnect(self):
         """Disconnect from signaling server"""
         self.running = False
+        self.registered = False
+        self.outbox.clear()
+        self.dispatcher.close()
+        for peer_id in list(self.candidate_flushes):
+            self.discard_ice_candidates(peer_id)
         if self.websocket:
             await self.websocket.close()
     
     async def send_message(self, message: dict):
-        """Send message to signaling server"""
-        if self.websocket:
-            await self.websocket.send(json.dumps(message))
-    
-    async def message_handler(self):
-        """Handle incoming messages"""
+        """Send message to signaling server, or queue it until we are connected"""
+        to_user = message.get("to")
+        if self.pending_candidates.get(to_user) and message.get("type") not in ICE_TYPES:
+            # Batched candidates keep their place ahead of later messages to the peer
+            await self.flush_ice_candidates(to_user)
+        if not self.running:
+            logger.debug(f"Not connected, dropping {message.get('type')}")
+            return
+        if not self.registered or self.outbox:
+            self.queue_offline(message)
+            return
         try:
-            async for message in self.websocket:
-                data = json.loads(message)
-                message_type = data.get("type")
-                
-                if message_type in self.callbacks:
-                    await self.callbacks[message_type](data)
-                else:
-                    logger.warning(f"Unhandled message type: {message_type}")
-                    
+            await self.send_now(message)
         except websockets.exceptions.ConnectionClosed:
-            logger.info("WebSocket connection closed")
-        except Exception as e:
-            logger.error(f"Error in message handler: {e}")
+            self.queue_offline(message)
+    
+    async def send_now(self, message: dict):
+        """Encode and write a message on the current websocket"""
+        payload = self.codec.encode(message)
+        if self.envelope and "to" in message:
+            header = {
+                "type": message.get("type"),
+                "from": message.get("from"),
+                "to": message.get("to"),
+                "codec": self.codec.name
+            }
+            payload = pack_envelope(header, payload)
+        await self.websocket.send(payload)
+    
+    def queue_offline(self, message: dict):
+        """Hold a message for the next connection, dropping the oldest when full"""
+        if message.get("type") == "presence_resync":
+            return  # Every registration starts with a fresh snapshot anyway
+        if len(self.outbox) >= self.outbox_size:
+            dropped = self.outbox.popleft()
+            self.outbox_dropped += 1
+            logger.warning(f"Signaling outbox full, dropped {dropped.get('type')}")
+        self.outbox.append(message)
+    
+    async def flush_outbox(self):
+        """Send the messages queued while disconnected, in order"""
+        while self.outbox and self.registered:
+            try:
+                await self.send_now(self.outbox[0])
+            except websockets.exceptions.ConnectionClosed:
+                return
+            self.outbox.popleft()
+    
+    async def message_handler(self):
+        """Handle incoming messages, reconnecting whenever the connection drops"""
+        while True:
+            try:
+                async for message in self.websocket:
+                    try:
+                        await self.handle_message(message)
+                    except Exception as e:
+                        logger.error(f"Error in message handler: {e}")
+                logger.info("WebSocket connection closed")
+            except websockets.exceptions.ConnectionClosed:
+                logger.info("WebSocket connection lost")
+            self.registered = False
+            if not self.running:
+                break
+            code = self.websocket.close_code
+            if code in FINAL_CLOSE_CODES or not self.auto_reconnect:
+                reason = self.websocket.close_reason
+                logger.info(f"Signaling connection closed by the server ({code} {reason})")
+                self.running = False
+                self.dispatch("disconnected", {"type": "disconnected", "final": True,
+                                               "code": code, "reason": reason})
+                break
+            self.dispatch("disconnected", {"type": "disconnected", "final": False})
+            if not await self.open_with_backoff():
+                break
+    
+    async def handle_message(self, message):
+        """Decode one message and run its callback"""
+        data = decode_frame(message, self.codec)
+        message_type = data.get("type")
+        
+        if message_type == "registered":
+            self.codec = get_codec(data.get("codec"))
+            self.envelope = bool(data.get("envelope")) and self.offer_envelope
+            if self.resume_token and not data.get("resumed"):
+                logger.warning("Signaling session was not resumed, messages sent to us "
+                               "while disconnected are lost")
+            self.resume_token = data.get("resume_token")
+            self.registered = True
+            logger.info(f"Signaling codec: {self.codec.name}, envelopes: {self.envelope}")
+            await self.flush_outbox()
+        elif message_type == "user_list":
+            self.apply_user_list(data)
+        elif message_type == "presence_delta" and not self.apply_presence_delta(data):
+            await self.resync_presence()
+            return
+        
+        if message_type == "ice_candidates" and not self.dispatcher.has(message_type) \
+                and self.dispatcher.has("ice_candidate"):
+            # Handlers that only know single candidates get them one at a time
+            for candidate in data.get("candidates", []):
+                self.dispatch("ice_candidate", dict(data, type="ice_candidate",
+                                                    candidate=candidate))
+        elif self.dispatch(message_type, data):
+            pass
+        elif message_type not in ("registered", "user_list", "presence_delta"):
+            logger.warning(f"Unhandled message type: {message_type}")
     
-    async def call_user(self, target_user: str, offer: dict, call_type: str = "video"):
+    def apply_user_list(self, data: dict):
+        """Replace the online users with a snapshot"""
+        self.users = dict.fromkeys(data.get("users", []))
+        self.presence_version = data.get("version")
+    
+    def apply_presence_delta(self, data: dict) -> bool:
+        """Apply a presence delta, False if it does not follow the last version"""
+        version = data.get("version")
+        if self.presence_version is None or version != self.presence_version + 1:
+            logger.info(f"Presence version {version} after {self.presence_version}, resyncing")
+            return False
+        for user in data.get("joined", []):
+            self.users[user] = None
+        for user in data.get("left", []):
+            self.users.pop(user, None)
+        self.presence_version = version
+        return True
+    
+    async def resync_presence(self):
+        """Ask the server for a full user list"""
+        self.presence_version = None
+        await self.send_message({"type": "presence_resync"})
+    
+    async def call_user(self, target_user: str, offer: dict, call_type: str = "video",
+                        public_key: Optional[str] = None):
         """Initiate call to another user"""
         await self.send_message({
             "type": "call_offer",
             "from": self.user_id,
             "to": target_user,
             "offer": offer,
-            "call_type": call_type
+            "call_type": call_type,
+            "public_key": public_key
         })
     
-    async def answer_call(self, caller_id: str, answer: dict):
+    async def answer_call(self, caller_id: str, answer: dict, ciphertext: Optional[str] = None):
         """Answer incoming call"""
         await self.send_message({
             "type": "call_answer",
             "from": self.user_id,
             "to": caller_id,
-            "answer": answer
+            "answer": answer,
+            "ciphertext": ciphertext
         })
     
     async def reject_call(self, caller_id: str):
@@ -109,10 +341,92 @@ class SignalingClient:
         })
     
     async def send_ice_candidate(self, peer_id: str, candidate: dict):
-        """Send ICE candidate"""
+        """Send ICE candidate, batched with the ones that follow it closely"""
+        if self.ice_batch_delay <= 0:
+            await self.send_ice_candidates(peer_id, [candidate])
+            return
+        pending = self.pending_candidates.get(peer_id)
+        if pending is None:
+            # First of a burst: send now and open a batching window
+            self.pending_candidates[peer_id] = []
+            self.candidate_flushes[peer_id] = asyncio.ensure_future(
+                self.flush_ice_candidates_later(peer_id))
+            await self.send_ice_candidates(peer_id, [candidate])
+            return
+        pending.append(candidate)
+        if len(pending) >= self.ice_batch_size:
+            await self.flush_ice_candidates(peer_id)
+    
+    async def send_ice_candidates(self, peer_id: str, candidates: list):
+        """Send candidates in one message (a lone one as a plain ice_candidate)"""
+        if len(candidates) == 1:
+            await self.send_message({
+                "type": "ice_candidate",
+                "from": self.user_id,
+                "to": peer_id,
+                "candidate": candidates[0]
+            })
+        elif candidates:
+            await self.send_message({
+                "type": "ice_candidates",
+                "from": self.user_id,
+                "to": peer_id,
+                "candidates": candidates
+            })
+    
+    async def flush_ice_candidates(self, peer_id: str):
+        """Send the candidates waiting for `peer_id` now"""
+        candidates = self.pending_candidates.get(peer_id)
+        if candidates:
+            self.pending_candidates[peer_id] = []
+            await self.send_ice_candidates(peer_id, candidates)
+    
+    async def flush_ice_candidates_later(self, peer_id: str):
+        """Flush at the end of each window until a window passes with nothing new"""
+        try:
+            while True:
+                await asyncio.sleep(self.ice_batch_delay)
+                if not self.pending_candidates.get(peer_id):
+                    break
+                await self.flush_ice_candidates(peer_id)
+        except Exception as e:
+            logger.error(f"Error sending ICE candidates to {peer_id}: {e}")
+        finally:
+            self.pending_candidates.pop(peer_id, None)
+            self.candidate_flushes.pop(peer_id, None)
+    
+    def discard_ice_candidates(self, peer_id: str):
+        """Drop candidates still waiting for `peer_id`"""
+        task = self.candidate_flushes.pop(peer_id, None)
+        if task:
+            task.cancel()
+        self.pending_candidates.pop(peer_id, None)
+    
+    async def rekey_offer(self, peer_id: str, generation: int, public_key: str):
+        """Offer a new Kyber public key for in-call rekeying"""
+        await self.send_message({
+            "type": "rekey_offer",
+            "from": self.user_id,
+            "to": peer_id,
+            "generation": generation,
+            "public_key": public_key
+        })
+    
+    async def rekey_answer(self, peer_id: str, generation: int, ciphertext: str):
+        """Answer a rekey offer with the Kyber ciphertext"""
+        await self.send_message({
+            "type": "rekey_answer",
+            "from": self.user_id,
+            "to": peer_id,
+            "generation": generation,
+            "ciphertext": ciphertext
+        })
+    
+    async def rekey_done(self, peer_id: str, generation: int):
+        """Confirm that outgoing media uses the new key"""
         await self.send_message({
-            "type": "ice_candidate",
+            "type": "rekey_done",
             "from": self.user_id,
             "to": peer_id,
-            "candidate": candidate
+            "generation": generation
         })
\ No newline at end of file
@@ -2,88 +2,396 @@
 WebSocket Signaling Server
 """
 import asyncio
-import json
 import logging
+import time
 import websockets
-from typing import Dict, Set
+from typing import Dict, Optional
+
+from .codec import JSON, decode_frame, get_codec, is_envelope, negotiate, pack_envelope, unpack_envelope
+from .connection import ClientConnection
+from .metrics import Metrics
+from .routing import LocalRoutingBackend, RoutingBackend
+from .session import CLOSE_REPLACED, ResumableSession
 
 logger = logging.getLogger(__name__)
 
 class SignalingServer:
-    """WebSocket-based signaling server"""
+    """WebSocket-based signaling server
+    
+    ``self.clients`` holds the users connected to this process. Presence
+    and messages for users elsewhere go through the routing ``backend``;
+    the default ``LocalRoutingBackend`` keeps everything in-process, while
+    a ``SocketRoutingBackend`` joins a sharded server (see ``cluster.py``).
+    
+    Presence is versioned: a client gets the full ``user_list`` when it
+    registers or asks with ``presence_resync``, then ``presence_delta``
+    messages listing who joined and left. Churn within one
+    ``presence_interval`` is coalesced into a single delta.
+    
+    Every client has a bounded send queue with its own writer task (see
+    ``ClientConnection``), so sends never wait on a slow socket. Clients
+    that fall ``send_queue_size`` messages behind get only the latest
+    snapshot or are disconnected, per ``slow_consumer_policy``.
+    
+    Clients list the codecs they support at register and the server
+    answers with the one it picked in a ``registered`` message (always
+    JSON text); after that it sends in that codec. Broadcasts are encoded
+    once per codec in use, and messages between clients using the same
+    codec are forwarded as the original frame without re-encoding.
+    
+    Clients that accept envelopes at register send routed messages as an
+    envelope (see ``codec.py``): the server routes on its small header and
+    relays the body bytes untouched, never parsing the SDP or candidate.
+    
+    Each registration gets a resume token. When a client drops without a
+    clean close it stays registered for ``resume_timeout`` seconds and
+    messages routed to it are held; registering again with the token
+    replays them (see ``ResumableSession``), so a signaling blip does not
+    break call setup. Sessions live in this process only: in a sharded
+    server a client that reconnects to another worker registers afresh,
+    and what the old worker held is dropped when the session expires.
+    Both are logged and counted (``resume_failures``,
+    ``held_messages_expired``).
+    
+    Metrics (see ``metrics.py``) are off unless ``metrics_port`` or
+    ``metrics_interval`` is set; when off, the hot paths skip them after a
+    single ``self.metrics is not None`` check.
+    """
+    
+    FORWARDED_TYPES = {"call_offer", "call_answer", "call_reject", "call_end", "ice_candidate",
+                       "ice_candidates", "rekey_offer", "rekey_answer", "rekey_done"}
+    CONTROL_TYPES = {"register", "presence_resync"}
+    CLEAN_CLOSE = 1000
     
-    def __init__(self, host: str = "localhost", port: int = 8765):
+    def __init__(self, host: str = "localhost", port: int = 8765,
+                 backend: Optional[RoutingBackend] = None, reuse_port: bool = False,
+                 presence_interval: float = 0.05, send_queue_size: int = 256,
+                 slow_consumer_policy: str = ClientConnection.SNAPSHOT,
+                 metrics_port: Optional[int] = None, metrics_interval: Optional[float] = None,
+                 resume_timeout: float = 30.0, resume_buffer: int = 64):
+        if slow_consumer_policy not in ClientConnection.POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {slow_consumer_policy}")
         self.host = host
         self.port = port
-        self.clients: Dict[str, websockets.WebSocketServerProtocol] = {}
+        self.clients: Dict[str, ClientConnection] = {}
+        self.backend = backend or LocalRoutingBackend()
+        self.reuse_port = reuse_port
+        self.presence_interval = presence_interval
+        self.presence_version = 0
+        self.announced_users: Dict[str, None] = {}
+        self.presence_flush = None
+        self.send_queue_size = send_queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.closed_dropped = 0
+        self.closed_snapshots = 0
+        self.slow_disconnects = 0
+        self.sessions: Dict[str, ResumableSession] = {}
+        self.resume_timeout = resume_timeout
+        self.resume_buffer = resume_buffer
+        self.resumed = 0
+        self.resume_failures = 0
+        self.held_messages_expired = 0
         self.running = False
+        self.metrics = None
+        if metrics_port or metrics_interval:
+            self.metrics = Metrics(host=host, port=metrics_port, log_interval=metrics_interval)
+            self.register_metrics(self.metrics)
     
-    async def register_client(self, websocket, user_id: str):
-        """Register a new client"""
-        self.clients[user_id] = websocket
-        logger.info(f"Client {user_id} registered")
+    def register_metrics(self, metrics: Metrics):
+        """Describe the server's metrics and expose stats() as gauges and counters"""
+        metrics.describe("messages_total", "counter", "Messages received, by type")
+        metrics.describe("routed_total", "counter", "Routed messages, by destination")
+        metrics.describe("route_failures_total", "counter", "Messages that could not be routed")
+        metrics.describe("forward_latency_seconds", "histogram",
+                         "Receipt of a routed message to its write on the recipient's socket")
+        metrics.describe("broadcast_fanout_seconds", "histogram",
+                         "Time to encode and queue a broadcast for every client")
+        for name, text in (("clients", "Connected clients"),
+                           ("send_queue_depth", "Messages queued across all clients"),
+                           ("max_send_queue_depth", "Deepest client send queue"),
+                           ("detached_sessions", "Disconnected clients waiting to resume")):
+            metrics.gauge(name, lambda name=name: self.stats()[name], text)
+        for name, text in (("dropped_messages", "Messages dropped by slow consumer handling"),
+                           ("snapshots_resent", "Presence snapshots resent to slow consumers"),
+                           ("slow_consumer_disconnects", "Clients disconnected as slow consumers"),
+                           ("resumed_sessions", "Sessions resumed after a reconnect"),
+                           ("resume_failures", "Resume tokens not recognised by this worker"),
+                           ("held_messages_expired",
+                            "Held messages dropped because the client did not resume here")):
+            metrics.counter(f"{name}_total", lambda name=name: self.stats()[name], text)
+    
+    def record_message(self, message_type):
+        """Count a received message, folding unexpected types into one label"""
+        if message_type not in self.FORWARDED_TYPES and message_type not in self.CONTROL_TYPES:
+            message_type = "other"
+        self.metrics.inc("messages_total", type=message_type)
+    
+    async def register_client(self, websocket, user_id: str, codecs=None, envelope=False,
+                              resume=None):
+        """Register a new client, resuming its session if `resume` is its token"""
+        codec = negotiate(codecs)
+        connection = ClientConnection(websocket, user_id, snapshot=self.encode_user_list,
+                                      max_queue=self.send_queue_size,
+                                      policy=self.slow_consumer_policy, codec=codec,
+                                      envelope=bool(envelope), metrics=self.metrics)
+        session = self.sessions.get(user_id)
+        resumed = session is not None and session.matches(resume)
+        held = session.attach() if session is not None else []
+        if not resumed:
+            if resume:
+                # Expired, or held by another worker of a sharded server
+                self.resume_failures += 1
+                logger.warning(f"Client {user_id} sent an unknown resume token, "
+                               f"registering afresh")
+            held = []
+            session = self.sessions[user_id] = ResumableSession(user_id, self.resume_buffer)
+        
+        previous = self.clients.get(user_id)
+        carried = []
+        if previous:
+            if resumed and previous.codec is codec and previous.envelope == connection.envelope:
+                # The old socket is dead but not yet noticed: keep what it had not written
+                carried = [payload for payload, presence, _ in previous.queue if not presence]
+            self.closed_dropped += previous.dropped
+            self.closed_snapshots += previous.snapshots
+            previous.close(code=CLOSE_REPLACED, reason="replaced")
+        self.clients[user_id] = connection
+        if resumed:
+            self.resumed += 1
+            logger.info(f"Client {user_id} resumed ({len(held) + len(carried)} messages replayed)")
+        else:
+            logger.info(f"Client {user_id} registered")
         
-        # Send user list to all clients
-        await self.broadcast_user_list()
-    
-    async def unregister_client(self, user_id: str):
-        """Unregister a client"""
-        if user_id in self.clients:
-            del self.clients[user_id]
-            logger.info(f"Client {user_id} unregistered")
-            await self.broadcast_user_list()
-    
-    async def broadcast_user_list(self):
-        """Broadcast current user list to all clients"""
-        user_list = list(self.clients.keys())
-        message = {
+        connection.send(JSON.encode({"type": "registered", "codec": codec.name,
+                                     "envelope": connection.envelope,
+                                     "resume_token": session.token, "resumed": resumed}))
+        # Snapshot first; the client's own join arrives in the next delta
+        connection.send(self.encode_user_list(codec), presence=True)
+        for payload in carried:
+            connection.send(payload)
+        for header, body, envelope in held:
+            self.send_routed(connection, header, body, envelope)
+        await self.backend.register(user_id)
+        return connection
+    
+    async def unregister_client(self, user_id: str, connection: Optional[ClientConnection] = None,
+                                detach: bool = False):
+        """Unregister a client (only if `connection` is still the current one)
+        
+        With `detach` the session is kept for ``resume_timeout`` seconds
+        instead, and the user stays registered until it expires.
+        """
+        current = self.clients.get(user_id)
+        if current is None or (connection is not None and current is not connection):
+            return
+        del self.clients[user_id]
+        if current.slow:
+            self.slow_disconnects += 1
+        self.closed_dropped += current.dropped
+        self.closed_snapshots += current.snapshots
+        current.close()
+        session = self.sessions.get(user_id)
+        if detach and session is not None and self.resume_timeout > 0:
+            session.expiry = asyncio.ensure_future(self.expire_session(session))
+            logger.info(f"Client {user_id} disconnected, holding its session for "
+                        f"{self.resume_timeout}s")
+            return
+        self.sessions.pop(user_id, None)
+        logger.info(f"Client {user_id} unregistered")
+        await self.backend.unregister(user_id)
+    
+    async def expire_session(self, session: ResumableSession):
+        """Unregister a detached user that did not come back in time"""
+        await asyncio.sleep(self.resume_timeout)
+        session.expiry = None
+        user_id = session.user_id
+        if self.sessions.get(user_id) is not session or user_id in self.clients:
+            return
+        del self.sessions[user_id]
+        if session.held or session.dropped:
+            self.held_messages_expired += len(session.held) + session.dropped
+            logger.warning(f"Dropping {len(session.held) + session.dropped} held messages "
+                           f"for {user_id}")
+        logger.info(f"Client {user_id} unregistered (session expired)")
+        await self.backend.unregister(user_id)
+    
+    def encode_user_list(self, codec=JSON):
+        """Presence snapshot at the current version"""
+        return codec.encode({
             "type": "user_list",
-            "users": user_list
-        }
+            "version": self.presence_version,
+            "users": list(self.announced_users)
+        })
+    
+    async def presence_changed(self):
+        """Schedule a presence delta for the end of the current interval"""
+        if self.presence_flush is None:
+            self.presence_flush = asyncio.ensure_future(self.flush_presence())
+    
+    async def flush_presence(self):
+        """Broadcast everything that joined or left since the last delta"""
+        await asyncio.sleep(self.presence_interval)
+        self.presence_flush = None
+        users = self.backend.users()
+        current = set(users)
+        joined = [user for user in users if user not in self.announced_users]
+        left = [user for user in self.announced_users if user not in current]
+        if not joined and not left:
+            return
         
-        disconnected_clients = []
-        for user_id, websocket in self.clients.items():
-            try:
-                await websocket.send(json.dumps(message))
-            except websockets.exceptions.ConnectionClosed:
-                disconnected_clients.append(user_id)
+        self.announced_users = dict.fromkeys(users)
+        self.presence_version += 1
+        self.broadcast({
+            "type": "presence_delta",
+            "version": self.presence_version,
+            "joined": joined,
+            "left": left
+        }, presence=True)
+    
+    def broadcast(self, message: dict, presence: bool = False):
+        """Queue a message for all clients, encoding it once per codec"""
+        started = time.perf_counter() if self.metrics is not None else None
+        encoded = {}
+        for connection in list(self.clients.values()):
+            codec = connection.codec
+            payload = encoded.get(codec.name)
+            if payload is None:
+                payload = encoded[codec.name] = codec.encode(message)
+            connection.send(payload, presence)
+        if started is not None:
+            self.metrics.observe("broadcast_fanout_seconds", time.perf_counter() - started)
+    
+    async def forward_message(self, header: dict, body, envelope=None, received_at=None):
+        """Forward message between users
         
-        # Clean up disconnected clients
-        for user_id in disconnected_clients:
-            await self.unregister_client(user_id)
-    
-    async def forward_message(self, from_user: str, to_user: str, message: dict):
-        """Forward message between users"""
-        if to_user in self.clients:
-            try:
-                await self.clients[to_user].send(json.dumps(message))
-            except websockets.exceptions.ConnectionClosed:
-                await self.unregister_client(to_user)
+        `header` holds the routing fields (type, from, to and the codec of
+        `body`, the encoded message). `envelope` is the frame it arrived
+        in, if it was one. `received_at` (perf_counter) is set when metrics
+        are on, to time the message until it is written.
+        """
+        to_user = header.get("to")
+        recipient = self.clients.get(to_user)
+        metrics = self.metrics
+        if recipient is not None:
+            self.send_routed(recipient, header, body, envelope, received_at)
+            if metrics is not None:
+                metrics.inc("routed_total", destination="local")
+        elif await self.backend.route(header, body.encode() if isinstance(body, str) else body):
+            if metrics is not None:
+                metrics.inc("routed_total", destination="remote")
+        elif self.hold_message(header, body, envelope):
+            if metrics is not None:
+                metrics.inc("routed_total", destination="held")
         else:
+            if metrics is not None:
+                metrics.inc("route_failures_total", reason="unknown_user")
             # Send error back to sender
             error_message = {
                 "type": "error",
                 "message": f"User {to_user} not found"
             }
-            if from_user in self.clients:
-                await self.clients[from_user].send(json.dumps(error_message))
+            sender = self.clients.get(header.get("from"))
+            if sender is not None:
+                sender.send(sender.codec.encode(error_message))
+    
+    def send_routed(self, connection: ClientConnection, header: dict, body, envelope=None,
+                    received_at=None):
+        """Queue a routed message in the form the recipient reads, re-encoding only if needed"""
+        codec = get_codec(header.get("codec"))
+        if connection.envelope:
+            # Every client reads JSON; other codecs only if it negotiated them
+            if codec is not JSON and connection.codec is not codec:
+                body = connection.codec.encode(codec.decode(body))
+                header = dict(header, codec=connection.codec.name)
+                envelope = None
+            payload = envelope if envelope is not None else pack_envelope(header, body)
+        elif codec is JSON:
+            payload = body if isinstance(body, str) else bytes(body).decode()
+        elif connection.codec is codec:
+            payload = bytes(body)
+        else:
+            payload = connection.codec.encode(codec.decode(body))
+        connection.send(payload, received_at=received_at)
+    
+    def hold_message(self, header: dict, body, envelope=None) -> bool:
+        """Keep a message for a detached recipient, False if there is none"""
+        session = self.sessions.get(header.get("to"))
+        if session is None or not session.detached:
+            return False
+        session.hold(header, body, envelope)
+        return True
     
-    async def handle_client(self, websocket, path):
+    async def deliver(self, header: dict, payload: bytes):
+        """Send a payload routed from another worker to a local client"""
+        connection = self.clients.get(header.get("to"))
+        if connection is not None:
+            received_at = time.perf_counter() if self.metrics is not None else None
+            self.send_routed(connection, header, payload, received_at=received_at)
+        elif self.hold_message(header, payload):
+            pass
+        elif self.metrics is not None:
+            # The recipient left this worker after the hub routed to it
+            self.metrics.inc("route_failures_total", reason="recipient_gone")
+    
+    def stats(self):
+        """Client count, send queue depth and slow consumer counters"""
+        connections = list(self.clients.values())
+        return {
+            "clients": len(connections),
+            "send_queue_depth": sum(c.depth for c in connections),
+            "max_send_queue_depth": max((c.depth for c in connections), default=0),
+            "dropped_messages": self.closed_dropped + sum(c.dropped for c in connections),
+            "snapshots_resent": self.closed_snapshots + sum(c.snapshots for c in connections),
+            "slow_consumer_disconnects": self.slow_disconnects,
+            "detached_sessions": sum(1 for s in self.sessions.values() if s.detached),
+            "resumed_sessions": self.resumed,
+            "resume_failures": self.resume_failures,
+            "held_messages_expired": self.held_messages_expired,
+        }
+    
+    async def handle_client(self, websocket, path=None):
         """Handle client connection"""
         user_id = None
+        connection = None
+        codec = JSON
         try:
             async for message in websocket:
-                data = json.loads(message)
+                received_at = time.perf_counter() if self.metrics is not None else None
+                if is_envelope(message):
+                    # Route on the header alone; the body is passed on as-is
+                    header, body = unpack_envelope(message)
+                    if received_at is not None:
+                        self.record_message(header.get("type"))
+                    if header.get("type") in self.FORWARDED_TYPES:
+                        await self.forward_message(header, body, message, received_at)
+                    else:
+                        logger.warning(f"Unknown envelope type: {header.get('type')}")
+                    continue
+                
+                data = decode_frame(message, codec)
                 message_type = data.get("type")
+                if received_at is not None:
+                    self.record_message(message_type)
                 
                 if message_type == "register":
                     user_id = data.get("user_id")
-                    await self.register_client(websocket, user_id)
+                    connection = await self.register_client(websocket, user_id, data.get("codecs"),
+                                                            data.get("envelope"), data.get("resume"))
+                    codec = connection.codec
+                
+                elif message_type == "presence_resync" and connection:
+                    connection.send(self.encode_user_list(codec), presence=True)
                 
-                elif message_type in ["call_offer", "call_answer", "call_reject", "call_end", "ice_candidate"]:
-                    from_user = data.get("from")
-                    to_user = data.get("to")
-                    await self.forward_message(from_user, to_user, data)
+                elif message_type in self.FORWARDED_TYPES:
+                    # Text frames are JSON whatever the negotiated codec
+                    frame_codec = JSON if isinstance(message, str) else codec
+                    header = {
+                        "type": message_type,
+                        "from": data.get("from"),
+                        "to": data.get("to"),
+                        "codec": frame_codec.name
+                    }
+                    await self.forward_message(header, message, received_at=received_at)
                 
                 else:
                     logger.warning(f"Unknown message type: {message_type}")
@@ -94,16 +402,27 @@ class SignalingServer:
             logger.error(f"Error handling client: {e}")
         finally:
             if user_id:
-                await self.unregister_client(user_id)
+                # Anything but a clean close may be a blip the client recovers from
+                await self.unregister_client(user_id, connection,
+                                             detach=websocket.close_code != self.CLEAN_CLOSE)
     
     async def start(self):
         """Start the signaling server"""
         self.running = True
         logger.info(f"Starting signaling server on {self.host}:{self.port}")
         
-        async with websockets.serve(self.handle_client, self.host, self.port):
-            logger.info("Signaling server started")
-            await asyncio.Future()  # Run forever
+        await self.backend.start(self.deliver, self.presence_changed)
+        if self.metrics is not None:
+            await self.metrics.start()
+        try:
+            async with websockets.serve(self.handle_client, self.host, self.port,
+                                        reuse_port=self.reuse_port):
+                logger.info("Signaling server started")
+                await self.backend.wait_closed()  # Run until the backend shuts down
+        finally:
+            if self.metrics is not None:
+                await self.metrics.stop()
+            await self.backend.stop()
     
     def stop(self):
         """Stop the signaling server"""
@@ -0,0 +1,375 @@
+"""
+Adaptive Video Quality
+Adjusts encoder bitrate, resolution and framerate of the outgoing video to
+the RTT, loss and available bitrate reported by the peer connection
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from aiortc import MediaStreamTrack
+from aiortc.rtp import RTCP_PSFB_APP, RtcpPsfbPacket, unpack_remb_fci
+
+logger = logging.getLogger(__name__)
+
+class QualityLevel:
+    """One rung of the quality ladder: frame size/rate and its bitrate range"""
+
+    def __init__(self, name, height, fps, bitrate, min_bitrate):
+        self.name = name
+        self.height = height
+        self.fps = fps
+        self.bitrate = bitrate
+        self.min_bitrate = min_bitrate
+
+    def __repr__(self):
+        return f"QualityLevel({self.name}, {self.fps} fps, {self.min_bitrate}-{self.bitrate} bps)"
+
+# Highest first. Each level's bitrate range overlaps the next one's, which is
+# the hysteresis band: a level is left only once the target falls below its
+# range and is re-entered only from the top of the range below. The encoder
+# clamps the target to its own limits (250 kbps-1.5 Mbps for VP8).
+QUALITY_LADDER = (
+    QualityLevel("1080p", 1080, 30, 2_500_000, 1_200_000),
+    QualityLevel("720p", 720, 30, 1_500_000, 700_000),
+    QualityLevel("480p", 480, 30, 800_000, 400_000),
+    QualityLevel("360p", 360, 24, 500_000, 250_000),
+    QualityLevel("240p", 240, 15, 300_000, 150_000),
+)
+
+def ladder_from(max_quality):
+    """The ladder from `max_quality` ("720p", ...) down"""
+    names = [level.name for level in QUALITY_LADDER]
+    if max_quality not in names:
+        logger.warning(f"Unknown video quality {max_quality!r}, using 720p")
+        max_quality = "720p"
+    return QUALITY_LADDER[names.index(max_quality):]
+
+def format_bitrate(bitrate):
+    if bitrate >= 1_000_000:
+        return f"{bitrate / 1_000_000:.2f} Mbps"
+    return f"{bitrate / 1000:.0f} kbps"
+
+class LinkSample:
+    """Network conditions seen over one polling interval
+
+    ``loss`` is a fraction (0-1), ``rtt`` seconds, ``available_bitrate``
+    the receiver's estimate (REMB) and ``send_bitrate`` what was actually
+    sent; any of them may be None when not reported yet.
+    """
+
+    def __init__(self, rtt=None, loss=None, available_bitrate=None, send_bitrate=None):
+        self.rtt = rtt
+        self.loss = loss
+        self.available_bitrate = available_bitrate
+        self.send_bitrate = send_bitrate
+
+    def describe(self):
+        parts = []
+        if self.loss is not None:
+            parts.append(f"loss {100 * self.loss:.1f}%")
+        if self.rtt is not None:
+            parts.append(f"rtt {1000 * self.rtt:.0f} ms")
+        if self.available_bitrate is not None:
+            parts.append(f"available {format_bitrate(self.available_bitrate)}")
+        if self.send_bitrate is not None:
+            parts.append(f"sending {format_bitrate(self.send_bitrate)}")
+        return ", ".join(parts) or "no stats"
+
+class Decision:
+    """What the controller chose after one sample, and why"""
+
+    def __init__(self, at, level, bitrate, action, reason, sample):
+        self.at = at
+        self.level = level
+        self.bitrate = bitrate
+        self.action = action  # "hold", "increase", "decrease", "upgrade", "downgrade"
+        self.reason = reason
+        self.sample = sample
+
+    def __str__(self):
+        return (f"{self.action} to {self.level.name} @ {format_bitrate(self.bitrate)}: "
+                f"{self.reason} ({self.sample.describe()})")
+
+class AdaptiveVideoTrack(MediaStreamTrack):
+    """Passes frames on at no more than the current level's height and frame rate
+
+    Larger frames are scaled down (keeping the aspect ratio) and converted
+    to yuv420p in the same step, so the encoder does not convert again.
+    The scaling runs on a worker thread, as aiortc's encoding does, so the
+    event loop stays free. Frames arriving faster than ``fps`` are skipped
+    by presentation time.
+    """
+
+    kind = "video"
+
+    def __init__(self, track, level=QUALITY_LADDER[1]):
+        super().__init__()
+        self.track = track
+        self.level = level
+        self.next_due = None
+        self.skipped = 0
+
+    def set_level(self, level):
+        self.level = level
+        self.next_due = None
+
+    async def recv(self):
+        while True:
+            frame = await self.track.recv()
+            if self.keep(frame):
+                break
+            self.skipped += 1
+        height = self.level.height
+        if frame.height > height:
+            width = max(2, round(frame.width * height / frame.height / 2) * 2)
+            frame = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: frame.reformat(width=width, height=height, format="yuv420p")
+            )
+        return frame
+
+    def keep(self, frame):
+        """Frame-rate limit by presentation time"""
+        if frame.pts is None or frame.time_base is None:
+            return True
+        at = float(frame.pts * frame.time_base)
+        period = 1.0 / self.level.fps
+        if self.next_due is not None and at < self.next_due - 0.002:
+            return False
+        self.next_due = at + period if self.next_due is None else max(self.next_due + period, at)
+        return True
+
+    def stop(self):
+        super().stop()
+        self.track.stop()
+
+class BitrateController:
+    """Hysteresis controller for the outgoing video quality
+
+    Every ``interval`` seconds ``poll`` reads ``pc.getStats()`` (RTT and
+    fraction lost from the receiver reports, bytes sent) plus the latest
+    REMB estimate, and ``update`` turns that into a target bitrate:
+    multiplicative decrease on loss above ``loss_high`` or RTT above
+    ``rtt_high``, a slow increase while loss stays under ``loss_low`` and
+    RTT under ``rtt_low``, never above the available bitrate once the link
+    shows queueing delay or loss (an application-limited stream, e.g. a
+    static scene, gets a REMB estimate that only tracks what it sends, so
+    the estimate alone is not a limit). Loss below
+    ``loss_high`` while the RTT stays within ``queue_delay`` of the lowest
+    seen is taken as random (e.g. Wi-Fi) loss rather than congestion, and
+    does not stop the increase.
+
+    The level (resolution and frame rate) follows the target with
+    hysteresis: it drops once the target has been below the level's range
+    for ``down_after`` polls, and climbs one rung only after ``up_after``
+    clean polls at the top of the range and ``hold_after_down`` seconds
+    after the last drop. Every decision is logged and kept in ``history``.
+
+    Without a ``pc`` the controller can be fed ``LinkSample``s directly,
+    e.g. from a simulated link (see abr_sim.py).
+    """
+
+    def __init__(self, pc=None, sender=None, track=None, max_quality="720p", interval=1.0,
+                 loss_high=0.10, loss_low=0.02, rtt_high=0.4, rtt_low=0.25,
+                 queue_delay=0.025, down_after=2, up_after=5, hold_after_down=10.0,
+                 history=256):
+        self.pc = pc
+        self.sender = sender
+        self.track = track
+        self.ladder = ladder_from(max_quality)
+        self.interval = interval
+        self.loss_high = loss_high
+        self.loss_low = loss_low
+        self.rtt_high = rtt_high
+        self.rtt_low = rtt_low
+        self.queue_delay = queue_delay
+        self.min_rtt = None
+        self.down_after = down_after
+        self.up_after = up_after
+        self.hold_after_down = hold_after_down
+        self.index = 0
+        self.bitrate = self.level.min_bitrate  # ramp up from the bottom of the range
+        self.below = 0
+        self.clean = 0
+        self.last_down = None
+        self.upgrades = 0
+        self.downgrades = 0
+        self.available_bitrate = None
+        self.last_bytes = None
+        self.last_poll = None
+        self.history = deque(maxlen=history)
+        self.task = None
+        if track is not None:
+            track.set_level(self.level)
+        if sender is not None:
+            self.watch_remb(sender)
+
+    @property
+    def level(self):
+        return self.ladder[self.index]
+
+    def watch_remb(self, sender):
+        """Record REMB estimates and keep them from overriding the controller's target
+
+        aiortc's sender applies each REMB straight to the encoder; the
+        controller restores its own target and weighs the estimate as the
+        available bitrate at the next poll instead.
+        """
+        handle_rtcp_packet = sender._handle_rtcp_packet
+
+        async def handle_capped(packet):
+            await handle_rtcp_packet(packet)
+            if isinstance(packet, RtcpPsfbPacket) and packet.fmt == RTCP_PSFB_APP:
+                try:
+                    bitrate, ssrcs = unpack_remb_fci(packet.fci)
+                except ValueError:
+                    return
+                if sender._ssrc in ssrcs:
+                    self.available_bitrate = bitrate
+                    self.apply_bitrate(int(self.bitrate))
+
+        sender._handle_rtcp_packet = handle_capped
+
+    def encoder(self):
+        """The sender's encoder, created by aiortc with the first frame"""
+        return getattr(self.sender, "_RTCRtpSender__encoder", None)
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error polling video stats: {e}")
+
+    async def poll(self):
+        """Read the connection stats and act on them"""
+        report = await self.pc.getStats()
+        now = time.monotonic()
+        sample = LinkSample(available_bitrate=self.available_bitrate)
+        for stats in report.values():
+            if getattr(stats, "kind", None) != "video":
+                continue
+            if stats.type == "remote-inbound-rtp":
+                sample.rtt = stats.roundTripTime
+                sample.loss = stats.fractionLost / 256  # 8-bit fixed point
+            elif stats.type == "outbound-rtp":
+                if self.last_bytes is not None and now > self.last_poll:
+                    sample.send_bitrate = 8 * (stats.bytesSent - self.last_bytes) / (now - self.last_poll)
+                self.last_bytes = stats.bytesSent
+        self.last_poll = now
+        return self.update(sample, now)
+
+    def update(self, sample, now=None):
+        """Fold one sample into the target bitrate and level, apply and log the result"""
+        now = time.monotonic() if now is None else now
+        level = self.level
+        loss = sample.loss or 0.0
+        rtt = sample.rtt or 0.0
+        if sample.available_bitrate is not None:
+            self.available_bitrate = sample.available_bitrate
+        if sample.rtt is not None:
+            self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        congested = loss > self.loss_high or rtt > self.rtt_high
+        clean = (sample.loss is not None and loss < self.loss_low and rtt < self.rtt_low)
+        random_loss = (not clean and sample.loss is not None and sample.rtt is not None
+                       and loss <= self.loss_high and rtt - self.min_rtt < self.queue_delay)
+
+        previous = self.bitrate
+        if congested:
+            if loss > self.loss_high:
+                self.bitrate *= max(0.5, 1 - 0.5 * loss)
+                reason = f"loss above {100 * self.loss_high:.0f}%"
+            else:
+                self.bitrate *= 0.85
+                reason = f"rtt above {1000 * self.rtt_high:.0f} ms"
+            self.clean = 0
+        elif clean or random_loss:
+            self.bitrate *= 1.08
+            reason = "clean link" if clean else "loss without queueing"
+            self.clean += 1
+        else:
+            reason = "no stats" if sample.loss is None else "within thresholds"
+            self.clean = 0
+
+        # The estimate only limits a sender once the link pushes back
+        available = sample.available_bitrate
+        queueing = sample.rtt is not None and rtt - self.min_rtt >= self.queue_delay
+        limiting = bool(available) and (queueing or loss > self.loss_low)
+        ceiling = level.bitrate
+        if limiting and 0.95 * available < ceiling:
+            ceiling = 0.95 * available
+            if self.bitrate > ceiling:
+                reason = "capped by available bitrate"
+        elif self.bitrate > ceiling:
+            reason = "at level maximum"
+        self.bitrate = max(self.ladder[-1].min_bitrate, min(self.bitrate, ceiling))
+        if self.bitrate < previous:
+            action = "decrease"
+        elif self.bitrate > previous:
+            action = "increase"
+        else:
+            action = "hold"
+
+        # Level changes, with hysteresis
+        self.below = self.below + 1 if self.bitrate < level.min_bitrate else 0
+        if self.below >= self.down_after and self.index < len(self.ladder) - 1:
+            while self.index < len(self.ladder) - 1 and self.bitrate < self.level.min_bitrate:
+                self.index += 1
+            action = "downgrade"
+            reason = f"{format_bitrate(self.bitrate)} below {level.name} minimum"
+            self.below = 0
+            self.clean = 0
+            self.last_down = now
+            self.downgrades += 1
+        elif (self.clean >= self.up_after and self.index > 0 and self.bitrate >= level.bitrate
+              and (self.last_down is None or now - self.last_down >= self.hold_after_down)
+              and (not limiting or available >= self.ladder[self.index - 1].min_bitrate)):
+            self.index -= 1
+            action = "upgrade"
+            reason = f"clean for {self.clean} samples"
+            self.clean = 0
+            self.upgrades += 1
+
+        decision = Decision(now, self.level, int(self.bitrate), action, reason, sample)
+        self.history.append(decision)
+        if action == "hold":
+            logger.debug(f"Video quality: {decision}")
+        else:
+            logger.info(f"Video quality: {decision}")
+        self.apply(decision)
+        return decision
+
+    def apply(self, decision):
+        """Push the decision to the track and encoder"""
+        if self.track is not None and self.track.level is not decision.level:
+            self.track.set_level(decision.level)
+        self.apply_bitrate(decision.bitrate)
+
+    def apply_bitrate(self, bitrate):
+        """Set the encoder target (it clamps to its own range and reconfigures on >10% changes)"""
+        encoder = self.encoder()
+        if encoder is not None and hasattr(encoder, "target_bitrate"):
+            encoder.target_bitrate = bitrate
+
+    def stats(self):
+        """Current level and bitrate, and how often each changed"""
+        return {
+            "level": self.level.name,
+            "bitrate": int(self.bitrate),
+            "available_bitrate": self.available_bitrate,
+            "upgrades": self.upgrades,
+            "downgrades": self.downgrades,
+            "skipped_frames": self.track.skipped if self.track is not None else 0,
+        }
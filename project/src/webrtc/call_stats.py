@@ -0,0 +1,320 @@
+"""
+Call Quality Telemetry
+Samples per-call media statistics into a fixed-size ring buffer and exports
+them as JSON or CSV
+"""
+import asyncio
+import csv
+import json
+import logging
+import math
+import os
+import re
+import time
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# One float32 per field per sample; NaN where a value was not available
+FIELDS = (
+    "t_s",            # seconds since the collector started
+    "send_kbps",      # all media sent on the transport
+    "recv_kbps",      # all media received on the transport
+    "send_fps",       # video frames encoded
+    "recv_fps",       # video frames decoded
+    "rtt_ms",         # from the peer's receiver reports
+    "send_loss_pct",  # lost on the way to the peer (receiver reports)
+    "recv_loss_pct",  # lost on the way from the peer
+    "jitter_ms",      # incoming interarrival jitter
+    "encode_ms",      # per video frame
+    "decode_ms",      # per video frame
+    "encrypt_ms",     # per outgoing video frame
+    "decrypt_ms",     # per incoming video frame
+    "target_kbps",    # bitrate controller target
+    "height",         # outgoing video height
+)
+SAMPLE_DTYPE = np.dtype([(name, np.float32) for name in FIELDS])
+
+CLOCK_RATES = {"video": 90000, "audio": 48000}
+
+def rate(delta, seconds):
+    return delta / seconds if seconds > 0 else math.nan
+
+def per_frame_ms(seconds, frames):
+    return 1000 * seconds / frames if frames else math.nan
+
+class StatsRing:
+    """The newest ``capacity`` samples in one preallocated structured array"""
+
+    def __init__(self, capacity=3600):
+        self.samples = np.full(capacity, np.nan, dtype=SAMPLE_DTYPE)
+        self.count = 0
+
+    @property
+    def capacity(self):
+        return len(self.samples)
+
+    @property
+    def overwritten(self):
+        """Samples lost to wrap-around"""
+        return max(0, self.count - self.capacity)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, values):
+        """Store a sample given as a dict of field values (missing fields are NaN)"""
+        row = self.samples[self.count % self.capacity]
+        for name in FIELDS:
+            row[name] = values.get(name, math.nan)
+        self.count += 1
+
+    def latest(self):
+        """The newest sample as a dict, or None"""
+        if not self.count:
+            return None
+        row = self.samples[(self.count - 1) % self.capacity]
+        return {name: float(row[name]) for name in FIELDS}
+
+    def rows(self):
+        """Kept samples, oldest first (a copy)"""
+        if self.count <= self.capacity:
+            return self.samples[:self.count].copy()
+        start = self.count % self.capacity
+        return np.concatenate((self.samples[start:], self.samples[:start]))
+
+class EncodeTimer:
+    """Time from a frame leaving the sender's track to its encoded payloads
+
+    Install before any encryption hook on the same sender so encryption is
+    not counted as encoding.
+    """
+
+    def __init__(self, sender):
+        self.frames = 0
+        self.seconds = 0.0
+        self.frame_at = None
+
+        track = sender.track
+        recv = track.recv
+        next_encoded_frame = sender._next_encoded_frame
+
+        async def timed_recv():
+            frame = await recv()
+            self.frame_at = time.perf_counter()
+            return frame
+
+        async def timed_next_encoded_frame(codec):
+            encoded_frame = await next_encoded_frame(codec)
+            if encoded_frame is not None and self.frame_at is not None:
+                self.seconds += time.perf_counter() - self.frame_at
+                self.frames += 1
+            return encoded_frame
+
+        track.recv = timed_recv
+        sender._next_encoded_frame = timed_next_encoded_frame
+
+class DecodeTimer:
+    """Decoder time per frame on a receiver
+
+    aiortc decodes on one thread that takes encoded frames from a queue, so
+    the time between two ``get`` calls is one decode (and hand-off).
+    """
+
+    def __init__(self, receiver):
+        self.frames = 0
+        self.seconds = 0.0
+        self.started = None
+
+        decoder_queue = receiver._RTCRtpReceiver__decoder_queue
+        get = decoder_queue.get
+
+        def timed_get(*args, **kwargs):
+            if self.started is not None:
+                self.seconds += time.perf_counter() - self.started
+                self.frames += 1
+            task = get(*args, **kwargs)
+            self.started = time.perf_counter() if task is not None else None
+            return task
+
+        decoder_queue.get = timed_get
+
+class CallStatsCollector:
+    """Samples a WebRTCPeerConnection's media stats every ``interval`` seconds
+
+    Each sample combines ``pc.getStats()`` (transport bytes, RTT, loss,
+    jitter) with encode/decode timers on the video sender and receiver,
+    the encryption stages' crypto time and the bitrate controller's
+    target, as per-interval rates. Samples go into a ``StatsRing`` of
+    ``capacity`` (an hour at one per second is about 200 KB); ``export``
+    writes them as JSON and CSV.
+    """
+
+    def __init__(self, peer_connection, interval=1.0, capacity=3600):
+        self.peer_connection = peer_connection
+        self.interval = interval
+        self.ring = StatsRing(capacity)
+        self.encode_timers = []
+        self.decode_timers = []
+        self.started = None
+        self.started_wall = None
+        self.previous = None
+        self.task = None
+
+    def watch_sender(self, sender):
+        if sender.track is not None and sender.track.kind == "video":
+            self.encode_timers.append(EncodeTimer(sender))
+
+    def watch_receiver(self, receiver):
+        if receiver.track is not None and receiver.track.kind == "video":
+            self.decode_timers.append(DecodeTimer(receiver))
+
+    def start(self):
+        self.started = time.monotonic()
+        self.started_wall = datetime.now()
+        self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sample()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error sampling call stats: {e}")
+
+    def counters(self):
+        """Cumulative counters kept outside getStats()"""
+        peer_connection = self.peer_connection
+        video_tracks = [track for track in peer_connection.encrypted_tracks if track.kind == "video"]
+        video_receivers = [receiver for receiver in peer_connection.decrypting_receivers
+                           if receiver.receiver.track.kind == "video"]
+        return {
+            "encoded": sum(timer.frames for timer in self.encode_timers),
+            "encode_seconds": sum(timer.seconds for timer in self.encode_timers),
+            "decoded": sum(timer.frames for timer in self.decode_timers),
+            "decode_seconds": sum(timer.seconds for timer in self.decode_timers),
+            "encrypted": sum(track.frames for track in video_tracks),
+            "encrypt_seconds": sum(track.crypto_seconds for track in video_tracks),
+            "decrypt_seconds": sum(receiver.crypto_seconds for receiver in video_receivers),
+        }
+
+    async def sample(self):
+        """Take one sample and add it to the ring"""
+        report = await self.peer_connection.pc.getStats()
+        now = time.monotonic()
+        current = self.counters()
+        current.update(bytes_sent=0, bytes_received=0, packets_received=0, packets_lost=0)
+        values = {"t_s": now - self.started}
+        rtts, send_losses, jitters = [], [], {}
+        for stats in report.values():
+            if stats.type == "transport":
+                current["bytes_sent"] += stats.bytesSent
+                current["bytes_received"] += stats.bytesReceived
+            elif stats.type == "inbound-rtp":
+                current["packets_received"] += stats.packetsReceived
+                current["packets_lost"] += stats.packetsLost
+                jitters[stats.kind] = 1000 * stats.jitter / CLOCK_RATES.get(stats.kind, 90000)
+            elif stats.type == "remote-inbound-rtp":
+                if stats.roundTripTime is not None:
+                    rtts.append(stats.roundTripTime)
+                send_losses.append(stats.fractionLost / 256)  # 8-bit fixed point
+        if rtts:
+            values["rtt_ms"] = 1000 * max(rtts)
+        if send_losses:
+            values["send_loss_pct"] = 100 * max(send_losses)
+        if jitters:
+            values["jitter_ms"] = jitters.get("video", jitters.get("audio"))
+
+        controller = self.peer_connection.bitrate_controller
+        if controller is not None:
+            values["target_kbps"] = controller.bitrate / 1000
+            values["height"] = controller.level.height
+
+        if self.previous is not None:
+            previous, elapsed = self.previous
+            delta = {name: current[name] - previous[name] for name in current}
+            seconds = now - elapsed
+            values["send_kbps"] = rate(8 * delta["bytes_sent"], seconds) / 1000
+            values["recv_kbps"] = rate(8 * delta["bytes_received"], seconds) / 1000
+            values["send_fps"] = rate(delta["encoded"], seconds)
+            values["recv_fps"] = rate(delta["decoded"], seconds)
+            packets = delta["packets_received"] + delta["packets_lost"]
+            if packets > 0:
+                values["recv_loss_pct"] = 100 * max(0, delta["packets_lost"]) / packets
+            values["encode_ms"] = per_frame_ms(delta["encode_seconds"], delta["encoded"])
+            values["decode_ms"] = per_frame_ms(delta["decode_seconds"], delta["decoded"])
+            if self.peer_connection.encrypted:
+                values["encrypt_ms"] = per_frame_ms(delta["encrypt_seconds"], delta["encrypted"])
+                values["decrypt_ms"] = per_frame_ms(delta["decrypt_seconds"], delta["decoded"])
+        self.previous = (current, now)
+        self.ring.append(values)
+        return values
+
+    def latest(self):
+        """Newest sample for a live readout (safe to call from another thread)"""
+        return self.ring.latest()
+
+    def summary(self):
+        """Mean, 95th percentile and maximum of each field over the kept samples"""
+        rows = self.ring.rows()
+        summary = {}
+        for name in FIELDS[1:]:
+            values = rows[name][~np.isnan(rows[name])]
+            if len(values):
+                summary[name] = {
+                    "mean": round(float(values.mean()), 3),
+                    "p95": round(float(np.percentile(values, 95)), 3),
+                    "max": round(float(values.max()), 3),
+                }
+        return summary
+
+    def to_dict(self):
+        rows = self.ring.rows()
+        return {
+            "started": self.started_wall.isoformat() if self.started_wall else None,
+            "interval_s": self.interval,
+            "samples": len(rows),
+            "overwritten": self.ring.overwritten,
+            "summary": self.summary(),
+            "fields": list(FIELDS),
+            "rows": [[None if math.isnan(value) else round(float(value), 3) for value in row]
+                     for row in rows.tolist()],
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    def write_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            for row in self.ring.rows().tolist():
+                writer.writerow(["" if math.isnan(value) else round(value, 3) for value in row])
+
+    def export(self, directory, label=None):
+        """Write call-<start time>[-label].json and .csv into `directory`, return their paths
+
+        `label` (e.g. the remote peer's ID) is reduced to filename-safe characters.
+        """
+        if not self.ring.count:
+            return []
+        os.makedirs(directory, exist_ok=True)
+        started = self.started_wall or datetime.now()
+        name = f"call-{started:%Y%m%d-%H%M%S}"
+        if label:
+            name += "-" + re.sub(r"[^\w.-]", "_", label)
+        paths = [os.path.join(directory, name + ".json"), os.path.join(directory, name + ".csv")]
+        self.write_json(paths[0])
+        self.write_csv(paths[1])
+        logger.info(f"Call stats ({len(self.ring)} samples) written to {paths[0]} and {paths[1]}")
+        return paths
@@ -4,47 +4,209 @@ WebRTC Peer Connection Handler
 import asyncio
 import json
 import logging
-from aiortc import RTCPeerConnection, RTCSessionDescription, RTCIceCandidate
-from aiortc.contrib.media import MediaPlayer, MediaRecorder
+import time
+from aiortc import RTCPeerConnection, RTCSessionDescription, RTCIceCandidate, MediaStreamTrack
+from aiortc.contrib.media import MediaPlayer, MediaRecorder, MediaRelay
 from aiortc.contrib.signaling import BYE
 import cv2
 import numpy as np
+from cryptography.exceptions import InvalidTag
 from ..crypto.kyber import MediaEncryption
+from ..crypto.crypto_executor import CryptoExecutor
+from .bitrate_controller import AdaptiveVideoTrack, BitrateController
+from .call_stats import CallStatsCollector
 
 logger = logging.getLogger(__name__)
 
-class EncryptedVideoStreamTrack:
-    """Custom video track with encryption"""
+class EncryptedVideoStreamTrack(MediaStreamTrack):
+    """Outgoing track whose encoded payloads are encrypted before packetization
+
+    Frames are passed through untouched to the sender's encoder. Once the
+    track is attached to its RTCRtpSender, every encoded payload (a few KB
+    per video frame, ~100 bytes per Opus frame) is encrypted before it goes
+    into an RTP packet, written straight into its own buffer. Works for
+    audio sources as well as video. With a ``crypto_executor`` the
+    encryption runs on worker threads.
+    """
+    
+    kind = "video"
     
-    def __init__(self, track, encryption):
+    def __init__(self, track, encryption=None, crypto_executor=None):
+        super().__init__()
+        self.kind = track.kind
         self.track = track
         self.encryption = encryption
+        self.crypto_executor = crypto_executor
+        self.frames = 0
+        self.payload_bytes = 0
+        self.dropped_frames = 0
+        self.crypto_seconds = 0.0
     
     async def recv(self):
-        frame = await self.track.recv()
+        return await self.track.recv()
+    
+    def attach(self, sender):
+        """Insert the encryption stage into `sender`'s encoded-frame path
+
+        aiortc has no insertable-streams API; RTCRtpSender._next_encoded_frame
+        is the one place that sees encoded payloads before packetization.
+        """
+        next_encoded_frame = sender._next_encoded_frame
         
-        # Convert frame to bytes
-        frame_bytes = frame.to_ndarray().tobytes()
+        async def next_encrypted_frame(codec):
+            encoded_frame = await next_encoded_frame(codec)
+            payloads = encoded_frame.payloads
+            if self.crypto_executor:
+                nbytes = sum(len(payload) for payload in payloads)
+                encoded_frame.payloads = await self.crypto_executor.run(
+                    self.encrypt_payloads, payloads, nbytes=nbytes
+                )
+            else:
+                encoded_frame.payloads = self.encrypt_payloads(payloads)
+            return encoded_frame
         
-        # Encrypt frame
-        encrypted_bytes = self.encryption.encrypt_frame(frame_bytes)
+        sender._next_encoded_frame = next_encrypted_frame
+    
+    def encrypt_payloads(self, payloads):
+        """Encrypt each encoded payload; nothing is sent until a key is set"""
+        if self.encryption is None:
+            self.dropped_frames += 1
+            return []
+        started = time.perf_counter()
+        encrypted = []
+        for payload in payloads:
+            # One exact-size buffer per payload: aiortc keeps sent packets for
+            # retransmission, so pooled buffers could be overwritten under it
+            out = bytearray(self.encryption.encrypted_size(len(payload)))
+            del out[self.encryption.encrypt_frame_into(payload, out):]
+            encrypted.append(out)
+        self.crypto_seconds += time.perf_counter() - started
+        self.frames += 1
+        self.payload_bytes += sum(len(payload) for payload in payloads)
+        return encrypted
+    
+    def stats(self):
+        """Encrypted frame and payload counters"""
+        return {
+            "frames": self.frames,
+            "payload_bytes": self.payload_bytes,
+            "dropped_frames": self.dropped_frames,
+            "crypto_seconds": self.crypto_seconds,
+        }
+
+class DecryptingReceiver:
+    """Receive-side stage decrypting RTP payloads before depacketization
+
+    Decryption runs inline: the DTLS transport awaits each packet before
+    reading the next, so a worker thread would add a round-trip per packet
+    (stalling every bundled track and RTCP) without any parallelism.
+    """
+    
+    def __init__(self, receiver, encryption=None):
+        self.receiver = receiver
+        self.encryption = encryption
+        self.rtx_payload_types = set()
+        self.packets = 0
+        self.auth_failures = 0
+        self.crypto_seconds = 0.0
+        
+        receive = receiver.receive
+        handle_rtp_packet = receiver._handle_rtp_packet
         
-        # Convert back to frame (simplified)
-        return frame
+        async def receive_with_rtx(parameters):
+            # RTX payloads carry a 2-byte original sequence number in front
+            self.rtx_payload_types = {
+                codec.payloadType for codec in parameters.codecs
+                if codec.mimeType.lower().endswith("/rtx")
+            }
+            await receive(parameters)
+        
+        async def handle_decrypted_packet(packet, arrival_time_ms):
+            if packet.payload and not self.decrypt_packet(packet):
+                return
+            await handle_rtp_packet(packet, arrival_time_ms)
+        
+        receiver.receive = receive_with_rtx
+        receiver._handle_rtp_packet = handle_decrypted_packet
+    
+    def decrypt_packet(self, packet):
+        """Decrypt a packet payload in place, False if it must be dropped"""
+        if self.encryption is None:
+            return False
+        prefix = 2 if packet.payload_type in self.rtx_payload_types else 0
+        payload = packet.payload
+        # Decrypt behind the RTX prefix in one buffer; the jitter buffer keeps it
+        out = bytearray(max(prefix, len(payload) - MediaEncryption.TAG_SIZE))
+        out[:prefix] = payload[:prefix]
+        started = time.perf_counter()
+        try:
+            with memoryview(payload) as data, memoryview(out) as view:
+                size = self.encryption.decrypt_frame_into(data[prefix:], view[prefix:])
+        except (InvalidTag, ValueError):
+            self.auth_failures += 1
+            return False
+        finally:
+            self.crypto_seconds += time.perf_counter() - started
+        del out[prefix + size:]
+        packet.payload = out
+        self.packets += 1
+        return True
+    
+    def stats(self):
+        """Decrypted packet and authentication failure counters"""
+        counters = {"packets": self.packets, "auth_failures": self.auth_failures,
+                    "crypto_seconds": self.crypto_seconds}
+        if self.encryption:
+            counters["replays"] = self.encryption.replays
+            counters["reordered"] = self.encryption.reordered
+        return counters
 
 class WebRTCPeerConnection:
-    """Manages WebRTC peer connections with encryption"""
+    """Manages WebRTC peer connections with encryption
+    
+    With ``encrypted=True`` every outgoing track and incoming receiver gets
+    an encryption stage. Media is held back until a key is available, which
+    may be given up front or later through ``set_encryption_key``. The
+    sending key ratchets forward every ``rekey_seconds``; new root keys from
+    a Kyber re-exchange are added with ``install_key``/``activate_key``.
+    Caller and callee share the key and tell their frames apart by
+    ``sender_id`` (0 for the caller, 1 for the callee).
+    
+    The camera is opened once: the outgoing track and the local preview
+    (``local_preview_track``) both subscribe to it through a MediaRelay.
+    Once connected, a ``BitrateController`` adapts the outgoing video's
+    bitrate, resolution and frame rate up to ``video_quality``, and
+    ``call_stats`` samples call quality for a live readout and export.
+    """
     
-    def __init__(self, signaling_client, encryption_key=None):
+    def __init__(self, signaling_client, encryption_key=None, encrypted=True,
+                 rekey_frames=None, rekey_seconds=60, sender_id=0, video_quality="720p"):
         self.pc = RTCPeerConnection()
         self.signaling = signaling_client
-        self.encryption = MediaEncryption(encryption_key) if encryption_key else None
+        self.encrypted = encrypted
+        self.rekey_frames = rekey_frames
+        self.rekey_seconds = rekey_seconds
+        self.sender_id = sender_id
+        self.video_quality = video_quality
+        self.encryption = None
+        self.decryption = None
+        self.crypto_executor = CryptoExecutor() if encrypted else None
+        self.encrypted_tracks = []
+        self.decrypting_receivers = []
         self.local_video = None
         self.local_audio = None
+        self.local_video_source = None
+        self.relay = MediaRelay()
+        self.bitrate_controller = None
+        self.call_stats = CallStatsCollector(self)
         self.remote_video_track = None
         self.remote_audio_track = None
+        self.remote_video_ready = asyncio.Event()
         self.call_state = "idle"  # idle, calling, ringing, connected
         
+        if encryption_key:
+            self.set_encryption_key(encryption_key)
+        
         # Set up event handlers
         self.setup_event_handlers()
     
@@ -56,17 +218,37 @@ class WebRTCPeerConnection:
             logger.info(f"Connection state: {self.pc.connectionState}")
             if self.pc.connectionState == "connected":
                 self.call_state = "connected"
+                if self.bitrate_controller and not self.bitrate_controller.task:
+                    self.bitrate_controller.start()
+                if not self.call_stats.task:
+                    self.call_stats.start()
             elif self.pc.connectionState == "failed":
                 self.call_state = "failed"
+                if self.bitrate_controller:
+                    self.bitrate_controller.stop()
+                self.call_stats.stop()
         
         @self.pc.on("track")
         def on_track(track):
             logger.info(f"Received track: {track.kind}")
+            for transceiver in self.pc.getTransceivers():
+                if transceiver.receiver.track is track:
+                    self.call_stats.watch_receiver(transceiver.receiver)
+                    if self.encrypted:
+                        self.decrypting_receivers.append(
+                            DecryptingReceiver(transceiver.receiver, self.decryption)
+                        )
             if track.kind == "video":
                 self.remote_video_track = track
+                self.remote_video_ready.set()
             elif track.kind == "audio":
                 self.remote_audio_track = track
     
+    async def wait_remote_video(self):
+        """The remote video track, once it arrives"""
+        await self.remote_video_ready.wait()
+        return self.remote_video_track
+    
     async def start_local_media(self, video=True, audio=True):
         """Start local video and audio capture"""
         try:
@@ -74,13 +256,13 @@ class WebRTCPeerConnection:
                 # Use webcam
                 self.local_video = MediaPlayer('/dev/video0', format='v4l2')
                 if self.local_video.video:
-                    self.pc.addTrack(self.local_video.video)
+                    self.add_local_video(self.local_video.video)
             
             if audio:
                 # Use microphone
                 self.local_audio = MediaPlayer('default', format='pulse')
                 if self.local_audio.audio:
-                    self.pc.addTrack(self.local_audio.audio)
+                    self.add_local_track(self.local_audio.audio)
                     
         except Exception as e:
             logger.error(f"Error starting local media: {e}")
@@ -93,13 +275,88 @@ class WebRTCPeerConnection:
             from aiortc.contrib.media import MediaPlayer
             self.local_video = MediaPlayer('testsrc=size=640x480:rate=30', format='lavfi')
             if self.local_video.video:
-                self.pc.addTrack(self.local_video.video)
+                self.add_local_video(self.local_video.video)
         
         if audio:
             from aiortc.contrib.media import MediaPlayer
             self.local_audio = MediaPlayer('sine=frequency=1000:duration=0', format='lavfi')
             if self.local_audio.audio:
-                self.pc.addTrack(self.local_audio.audio)
+                self.add_local_track(self.local_audio.audio)
+    
+    def add_local_video(self, source):
+        """Send the camera through the relay (so the preview can share it) and the quality controller"""
+        self.local_video_source = source
+        track = AdaptiveVideoTrack(self.relay.subscribe(source))
+        sender = self.add_local_track(track)
+        self.bitrate_controller = BitrateController(self.pc, sender, track,
+                                                    max_quality=self.video_quality)
+        return sender
+    
+    def local_preview_track(self):
+        """A latest-frame-only view of the local camera, or None (call on the event loop)"""
+        if self.local_video_source is None:
+            return None
+        return self.relay.subscribe(self.local_video_source, buffered=False)
+    
+    def add_local_track(self, track):
+        """Add an outgoing track, wrapped in the encryption stage if enabled"""
+        if not self.encrypted:
+            sender = self.pc.addTrack(track)
+            self.call_stats.watch_sender(sender)
+            return sender
+        
+        encrypted_track = EncryptedVideoStreamTrack(track, self.encryption, self.crypto_executor)
+        sender = self.pc.addTrack(encrypted_track)
+        # Timer first, so encryption is not counted as encoding
+        self.call_stats.watch_sender(sender)
+        encrypted_track.attach(sender)
+        self.encrypted_tracks.append(encrypted_track)
+        return sender
+    
+    def set_encryption_key(self, key):
+        """Install the media key on every encryption/decryption stage"""
+        # Separate instances: each direction keeps its own ratchet position
+        self.encryption = MediaEncryption(key, rekey_frames=self.rekey_frames,
+                                          rekey_seconds=self.rekey_seconds,
+                                          sender_id=self.sender_id)
+        self.decryption = MediaEncryption(key, sender_id=self.sender_id)
+        for track in self.encrypted_tracks:
+            track.encryption = self.encryption
+        for receiver in self.decrypting_receivers:
+            receiver.encryption = self.decryption
+    
+    def install_key(self, key, generation):
+        """Accept media under a new root key without switching the sender yet"""
+        if self.encryption is None:
+            raise ValueError("No media key set")
+        self.encryption.install_key(key, generation)
+        self.decryption.install_key(key, generation)
+    
+    def activate_key(self, generation):
+        """Switch outgoing media to an installed root key"""
+        self.encryption.activate(generation)
+        logger.info(f"Media key generation {generation % 256} active")
+    
+    def encryption_stats(self):
+        """Counters from the send and receive encryption stages"""
+        sent_frames = sum(track.frames for track in self.encrypted_tracks)
+        received = sum(receiver.packets for receiver in self.decrypting_receivers)
+        return {
+            "send": [track.stats() for track in self.encrypted_tracks],
+            "receive": [receiver.stats() for receiver in self.decrypting_receivers],
+            "executor": self.crypto_executor.stats() if self.crypto_executor else None,
+            # Payload bytes copied on top of the AEAD output; 0 when steady
+            "bytes_copied": {
+                "send_per_frame": self.encryption.bytes_copied / sent_frames if sent_frames else 0.0,
+                "receive_per_packet": self.decryption.bytes_copied / received if received else 0.0,
+            } if self.encryption else None,
+        }
+    
+    def video_quality_stats(self):
+        """Current outgoing video level and bitrate, or None without video"""
+        if self.bitrate_controller is None:
+            return None
+        return self.bitrate_controller.stats()
     
     async def create_offer(self):
         """Create WebRTC offer"""
@@ -133,17 +390,24 @@ class WebRTCPeerConnection:
         ))
     
     async def add_ice_candidate(self, candidate):
-        """Add ICE candidate"""
-        await self.pc.addIceCandidate(RTCIceCandidate(
-            candidate=candidate["candidate"],
-            sdpMLineIndex=candidate["sdpMLineIndex"],
-            sdpMid=candidate["sdpMid"]
-        ))
+        """Add an ICE candidate, or a list of them from an ice_candidates batch"""
+        candidates = candidate if isinstance(candidate, list) else [candidate]
+        for candidate in candidates:
+            await self.pc.addIceCandidate(RTCIceCandidate(
+                candidate=candidate["candidate"],
+                sdpMLineIndex=candidate["sdpMLineIndex"],
+                sdpMid=candidate["sdpMid"]
+            ))
     
     async def close(self):
         """Close peer connection"""
+        if self.bitrate_controller:
+            self.bitrate_controller.stop()
+        self.call_stats.stop()
         if self.local_video:
             self.local_video.stop()
         if self.local_audio:
             self.local_audio.stop()
-        await self.pc.close()
\ No newline at end of file
+        await self.pc.close()
+        if self.crypto_executor:
+            self.crypto_executor.shutdown()
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""
+Signaling Reconnect Tests
+Run from project/ with: python -m pytest tests
+"""
+import asyncio
+import socket
+
+from src.signaling.session import CLOSE_REPLACED
+from src.signaling.websocket_client import SignalingClient
+from src.signaling.websocket_server import SignalingServer
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+async def start_server():
+    port = free_port()
+    server = SignalingServer(port=port)
+    task = asyncio.ensure_future(server.start())
+    for _ in range(100):
+        try:
+            _, writer = await asyncio.open_connection("localhost", port)
+            writer.close()
+            break
+        except OSError:
+            await asyncio.sleep(0.02)
+    return server, task, f"ws://localhost:{port}"
+
+async def stop_server(server, task):
+    await server.backend.stop()
+    server.backend.closed.set()
+    await asyncio.wait_for(task, 5)
+
+def make_client(url, events):
+    client = SignalingClient(url, backoff_initial=0.05, backoff_max=0.1)
+
+    async def on_registered(data):
+        events.append("registered")
+
+    async def on_disconnected(data):
+        events.append(("disconnected", data.get("final"), data.get("code")))
+
+    client.on("registered", on_registered)
+    client.on("disconnected", on_disconnected)
+    return client
+
+def test_same_user_id_replaces_without_reconnect_loop():
+    async def run():
+        server, task, url = await start_server()
+        first_events, second_events = [], []
+        first = make_client(url, first_events)
+        second = make_client(url, second_events)
+        try:
+            await first.connect("alice")
+            await asyncio.sleep(0.2)
+            await second.connect("alice")
+            await asyncio.sleep(1.0)
+
+            # The replaced client gives up; the newer one keeps the registration
+            assert first_events == ["registered", ("disconnected", True, CLOSE_REPLACED)]
+            assert not first.running
+            assert second_events == ["registered"]
+            assert second.registered
+            assert list(server.clients) == ["alice"]
+            assert server.clients["alice"].websocket is not None
+        finally:
+            await first.disconnect()
+            await second.disconnect()
+            await stop_server(server, task)
+
+    asyncio.run(run())
+
+def test_dropped_connection_reconnects():
+    async def run():
+        server, task, url = await start_server()
+        events = []
+        client = make_client(url, events)
+        try:
+            await client.connect("bob")
+            await asyncio.sleep(0.2)
+            await server.clients["bob"].websocket.close(code=1011, reason="restart")
+            await asyncio.sleep(1.0)
+
+            assert events == ["registered", ("disconnected", False, None), "registered"]
+            assert client.running and client.registered
+        finally:
+            await client.disconnect()
+            await stop_server(server, task)
+
+    asyncio.run(run())